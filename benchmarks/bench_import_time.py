@@ -0,0 +1,86 @@
+"""
+Measure the import time of plugnplai and guard against regressions.
+
+Each statement is run in a fresh interpreter with ``-X importtime``. The
+script fails (exit code 1) if an import takes longer than its budget, or if
+it loads a heavy dependency it doesn't need.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat 5] [--budget-scale 1.0]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("langchain", "faiss", "tiktoken", "numpy", "openai", "jsonref", "yaml", "httpx")
+
+# statement, budget in milliseconds, heavy modules it is allowed to load
+CASES = [
+    ("import plugnplai", 20, ()),
+    ("from plugnplai import parse_llm_response", 30, ()),
+    ("from plugnplai import Plugins", 300, ()),
+    ("from plugnplai import PluginRetriever", 500, ("numpy",)),
+]
+
+CHECK_MODULES = (
+    "import sys; "
+    "print(','.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))))"
+)
+
+
+def import_time_ms(statement):
+    """Cumulative import time of the plugnplai package, in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, check=True,
+    )
+    total = 0
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", where the
+        # top level imports of the statement have no indentation
+        parts = line.split("|")
+        if len(parts) == 3 and not parts[2].startswith("  ") and parts[2].strip() not in ("site", "usercustomize"):
+            try:
+                total += int(parts[1])
+            except ValueError:
+                continue
+    return total / 1000
+
+
+def loaded_heavy_modules(statement):
+    result = subprocess.run(
+        [sys.executable, "-c", statement + "; " + CHECK_MODULES.format(heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True,
+    )
+    return [m for m in result.stdout.strip().split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every budget, e.g. on slow CI machines.")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'statement':<45}{'median (ms)':>12}{'budget (ms)':>12}  heavy modules")
+    for statement, budget, allowed in CASES:
+        median = statistics.median(import_time_ms(statement) for _ in range(args.repeat))
+        budget *= args.budget_scale
+        heavy = loaded_heavy_modules(statement)
+        print(f"{statement:<45}{median:>12.1f}{budget:>12.0f}  {', '.join(heavy) or '-'}")
+
+        if median > budget:
+            failures.append(f"{statement!r} took {median:.1f} ms (budget {budget:.0f} ms)")
+        unexpected = sorted(set(heavy) - set(allowed))
+        if unexpected:
+            failures.append(f"{statement!r} loaded {', '.join(unexpected)}")
+
+    for failure in failures:
+        print("FAIL:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
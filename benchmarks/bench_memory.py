@@ -0,0 +1,116 @@
+"""
+Measure the memory held by installed plugins.
+
+Synthetic manifests and OpenAPI specs shaped like the ones of the public
+plugin directory (a few operations, shared component schemas referenced with
+$ref) are parsed, then installed in a Plugins instance, which resolves the
+$refs of the operations only. The memory still allocated once the specs
+are installed is measured with tracemalloc, keeping the raw specs and
+dropping them after the operations are compiled.
+
+Usage:
+    python benchmarks/bench_memory.py [--plugins 1000] [--operations 6]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from plugnplai.plugins import PluginObject, Plugins
+
+
+def make_spec(index, n_operations):
+    """JSON text of a synthetic OpenAPI spec."""
+    schemas = {
+        "Item": {
+            "type": "object",
+            "required": ["id", "name"],
+            "properties": {
+                "id": {"type": "string", "description": "Unique identifier of the item."},
+                "name": {"type": "string", "description": "Display name of the item."},
+                "price": {"type": "number", "description": "Price of the item in US dollars."},
+                "tags": {"type": "array", "items": {"type": "string"}, "description": "Tags of the item."},
+            },
+        },
+        "ItemList": {"type": "array", "items": {"$ref": "#/components/schemas/Item"}},
+    }
+    paths = {}
+    for op in range(n_operations):
+        if op % 2:
+            paths[f"/items/{op}"] = {"post": {
+                "operationId": f"createItem{op}",
+                "summary": f"Create an item in collection {op} of plugin {index}.",
+                "requestBody": {"required": True, "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/Item"}}}},
+                "responses": {"200": {"description": "The created item.", "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/Item"}}}}},
+            }}
+        else:
+            paths[f"/items/{op}/{{id}}"] = {"get": {
+                "operationId": f"searchItems{op}",
+                "summary": f"Search the items of collection {op} of plugin {index}.",
+                "parameters": [
+                    {"name": "id", "in": "path", "required": True, "schema": {"type": "string"},
+                     "description": "Identifier of the collection."},
+                    {"name": "query", "in": "query", "required": False, "schema": {"type": "string"},
+                     "description": "Keywords to search for."},
+                    {"name": "limit", "in": "query", "required": False, "schema": {"type": "integer"},
+                     "description": "Maximum number of items to return."},
+                ],
+                "responses": {"200": {"description": "The matching items.", "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/ItemList"}}}}},
+            }}
+    return json.dumps({
+        "openapi": "3.0.1",
+        "info": {"title": f"Plugin {index}", "description": f"Synthetic plugin number {index}.", "version": "v1"},
+        "servers": [{"url": f"https://plugin{index}.example.com"}],
+        "paths": paths,
+        "components": {"schemas": schemas},
+    })
+
+
+def make_manifest(index):
+    return {
+        "schema_version": "v1",
+        "name_for_model": f"plugin{index}",
+        "name_for_human": f"Plugin {index}",
+        "description_for_model": f"Plugin for searching and creating the items of store number {index}.",
+        "description_for_human": f"Items of store {index}.",
+        "auth": {"type": "none"},
+        "api": {"type": "openapi", "url": f"https://plugin{index}.example.com/openapi.json"},
+    }
+
+
+def installed_bytes(n_plugins, n_operations, keep_spec):
+    """Memory still allocated by a Plugins instance with n_plugins installed."""
+    gc.collect()
+    tracemalloc.start()
+    plugins = Plugins([])
+    for index in range(n_plugins):
+        spec = json.loads(make_spec(index, n_operations))
+        plugin = PluginObject(f"https://plugin{index}.example.com", spec, make_manifest(index), keep_spec=keep_spec)
+        plugins.installed_plugins[plugin.name_for_model] = plugin
+        del spec, plugin
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del plugins
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plugins", type=int, default=1000)
+    parser.add_argument("--operations", type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"{args.plugins} plugins, {args.operations} operations each")
+    print(f"{'raw spec':<12}{'total (MB)':>12}{'per plugin (KB)':>18}")
+    for keep_spec in (True, False):
+        total = installed_bytes(args.plugins, args.operations, keep_spec)
+        label = "kept" if keep_spec else "dropped"
+        print(f"{label:<12}{total / 1e6:>12.1f}{total / args.plugins / 1e3:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare the eager jsonref resolution of $refs with the lazy RefResolver.
+
+The synthetic spec looks like the large specs of the plugin directory: a
+deep tree of component schemas shared by many operations, and many more
+component schemas than the operations use. Each plugin is installed:
+
+- eager: jsonref.JsonRef.replace_refs on the whole spec, then PluginObject,
+  as the install did before RefResolver
+- lazy: PluginObject on the spec as parsed, resolving the references of the
+  operations only
+
+The time and the peak memory (tracemalloc) of the install are measured, as
+well as a full resolution with extract_all_parameters.
+
+Usage:
+    python benchmarks/bench_ref_resolution.py [--operations 200] [--schemas 2000] [--depth 6]
+"""
+import argparse
+import copy
+import time
+import tracemalloc
+
+import jsonref
+
+from plugnplai.plugins import PluginObject
+from plugnplai.utils import extract_all_parameters
+
+MANIFEST = {"name_for_model": "bench", "description_for_model": "Benchmark plugin."}
+
+
+def make_spec(n_operations, n_schemas, depth):
+    """Spec whose operations use a chain of depth nested schemas, among n_schemas."""
+    schemas = {}
+    for i in range(n_schemas):
+        child = i + 1 if (i + 1) % depth else None
+        properties = {f"field{j}": {"type": "string", "description": f"Field {j} of schema {i}."} for j in range(8)}
+        if child is not None:
+            properties["child"] = {"$ref": f"#/components/schemas/Schema{child}"}
+            properties["children"] = {"type": "array", "items": {"$ref": f"#/components/schemas/Schema{child}"}}
+        schemas[f"Schema{i}"] = {"type": "object", "required": ["field0"], "properties": properties}
+    # A recursive schema, which jsonref and RefResolver both turn into a cycle
+    schemas["Node"] = {"type": "object", "properties": {"parent": {"$ref": "#/components/schemas/Node"}}}
+
+    paths = {}
+    for op in range(n_operations):
+        # The operations use the first chains only
+        root = (op % 4) * depth
+        paths[f"/items/{op}"] = {
+            "get": {
+                "operationId": f"getItem{op}",
+                "summary": f"Get an item of collection {op}.",
+                "parameters": [{"$ref": "#/components/parameters/Limit"}],
+                "responses": {"200": {"description": "The item.", "content": {"application/json": {
+                    "schema": {"$ref": f"#/components/schemas/Schema{root}"}}}}},
+            },
+            "post": {
+                "operationId": f"createItem{op}",
+                "summary": f"Create an item in collection {op}.",
+                "requestBody": {"required": True, "content": {"application/json": {
+                    "schema": {"$ref": f"#/components/schemas/Schema{root}"}}}},
+            },
+        }
+    return {
+        "openapi": "3.0.1",
+        "info": {"title": "Bench", "version": "v1"},
+        "servers": [{"url": "https://bench.example.com"}],
+        "paths": paths,
+        "components": {
+            "schemas": schemas,
+            "parameters": {"Limit": {"name": "limit", "in": "query", "schema": {"type": "integer"},
+                                     "description": "Maximum number of items."}},
+        },
+    }
+
+
+def eager_install(spec):
+    return PluginObject("https://bench.example.com", jsonref.JsonRef.replace_refs(spec), MANIFEST)
+
+
+def lazy_install(spec):
+    return PluginObject("https://bench.example.com", spec, MANIFEST)
+
+
+def eager_parameters(spec):
+    return extract_all_parameters(jsonref.JsonRef.replace_refs(spec))
+
+
+def measure(function, spec, repeat):
+    """Best time and peak memory of function on fresh copies of spec."""
+    times = []
+    for _ in range(repeat):
+        spec_copy = copy.deepcopy(spec)
+        start = time.perf_counter()
+        function(spec_copy)
+        times.append(time.perf_counter() - start)
+    spec_copy = copy.deepcopy(spec)
+    tracemalloc.start()
+    result = function(spec_copy)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=200)
+    parser.add_argument("--schemas", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    spec = make_spec(args.operations, args.schemas, args.depth)
+    print(f"{args.operations * 2} operations, {args.schemas} schemas, chains of {args.depth} nested schemas")
+    print(f"{'':<28}{'time (ms)':>12}{'peak (MB)':>12}")
+    for label, function in (("install, eager (jsonref)", eager_install),
+                            ("install, lazy", lazy_install),
+                            ("parameters, eager (jsonref)", eager_parameters),
+                            ("parameters, lazy", extract_all_parameters)):
+        best, peak = measure(function, spec, args.repeat)
+        print(f"{label:<28}{best * 1e3:>12.1f}{peak / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark the parsing of OpenAPI specs by marshal_spec.
+
+The corpus is made of synthetic specs of the size of real plugin specs
+(from a few operations to thousands), serialized as JSON and as YAML. Each
+one is parsed with:
+
+- legacy: json.loads, then yaml.safe_load (pure Python loader) if it fails,
+  as marshal_spec did before format detection
+- marshal_spec: format detected from the Content-Type, libyaml C loader and
+  orjson when they are installed
+
+Usage:
+    python benchmarks/bench_spec_parsing.py [--operations 20 200 2000] [--repeat 5]
+"""
+import argparse
+import importlib.util
+import json
+import statistics
+import time
+
+import yaml
+
+from mock_plugin_server import make_spec
+from plugnplai.utils import _yaml_loader, marshal_spec
+
+
+def legacy_marshal_spec(txt):
+    try:
+        return json.loads(txt)
+    except json.JSONDecodeError:
+        return yaml.safe_load(txt)
+
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    json_backend = "orjson" if importlib.util.find_spec("orjson") else "json"
+    print(f"JSON parser: {json_backend}, YAML loader: {_yaml_loader().__name__}")
+    print(f"{'format':<8}{'operations':>11}{'size (KB)':>11}{'legacy (ms)':>13}{'marshal_spec (ms)':>19}{'speedup':>9}")
+    for n_operations in args.operations:
+        spec = make_spec("bench", "https://bench.example.com", n_operations)
+        corpus = {
+            "json": (json.dumps(spec, indent=2), "application/json"),
+            "yaml": (yaml.safe_dump(spec, sort_keys=False), "application/yaml"),
+        }
+        for name, (txt, content_type) in corpus.items():
+            assert marshal_spec(txt, content_type=content_type) == legacy_marshal_spec(txt)
+            legacy, _ = best_time(lambda: legacy_marshal_spec(txt), args.repeat)
+            fast, _ = best_time(lambda: marshal_spec(txt, content_type=content_type), args.repeat)
+            print(f"{name:<8}{n_operations:>11}{len(txt) / 1e3:>11.1f}{legacy * 1e3:>13.2f}{fast * 1e3:>19.2f}"
+                  f"{legacy / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
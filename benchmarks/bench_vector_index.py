@@ -0,0 +1,118 @@
+"""
+Benchmark the PluginRetriever engines: "numpy" (NumpyIndex) against "faiss"
+(LangChain FAISS vector store).
+
+Random normalized vectors stand in for the plugin embeddings, so no network
+is needed. For each catalog size it measures build time, single query and
+batched query latency, and the resident memory added by the retriever.
+
+Usage:
+    python benchmarks/bench_vector_index.py [--sizes 1000 10000 100000] [--dim 384]
+"""
+import argparse
+import gc
+import os
+import resource
+import time
+import zlib
+
+import numpy as np
+
+from plugnplai.embeddings import PluginRetriever, _import_faiss
+
+
+class RandomEmbeddings:
+    """Deterministic random unit vectors, one per text."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def _embed(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class PrecomputedEmbeddings(RandomEmbeddings):
+    """Serves precomputed document vectors, so the build time measures the index only."""
+
+    def __init__(self, dim, texts):
+        super().__init__(dim)
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((len(texts), dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = dict(zip(texts, vectors.tolist()))
+
+    def embed_documents(self, texts):
+        if texts and texts[0] in self.vectors:
+            return [self.vectors[text] for text in texts]
+        return super().embed_documents(texts)
+
+
+def rss_bytes():
+    """Current resident memory of the process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the peak, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench(engine, size, dim, batch_size, repeat):
+    manifests = [
+        {"name_for_model": f"plugin_{i}", "description_for_model": f"description of plugin {i}"}
+        for i in range(size)
+    ]
+    embeddings = PrecomputedEmbeddings(dim, [m["description_for_model"] for m in manifests])
+    queries = [f"user message {i}" for i in range(batch_size)]
+
+    gc.collect()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    retriever = PluginRetriever(manifests, embeddings=embeddings, engine=engine)
+    build = time.perf_counter() - start
+    gc.collect()
+    memory = rss_bytes() - rss_before
+
+    single = timeit(lambda: retriever.retrieve_names(queries[0]), repeat)
+    batch = timeit(lambda: retriever.retrieve_names_batch(queries, k=4), max(1, repeat // 10))
+    return build, single, batch, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    # Import LangChain and FAISS up front, so their import time and memory
+    # are not counted in the first faiss build
+    _import_faiss()
+
+    print(f"{'engine':<8}{'plugins':>10}{'build (s)':>12}{'query (ms)':>12}"
+          f"{'batch/' + str(args.batch_size) + ' (ms)':>16}{'memory (MB)':>14}")
+    for size in args.sizes:
+        for engine in ("numpy", "faiss"):
+            build, single, batch, memory = bench(engine, size, args.dim, args.batch_size, args.repeat)
+            print(f"{engine:<8}{size:>10}{build:>12.3f}{single * 1e3:>12.3f}"
+                  f"{batch * 1e3:>16.3f}{memory / 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Fixtures of the end-to-end benchmarks, run against the local mock plugin server.
+
+Usage:
+    pytest benchmarks --benchmark-only
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from mock_plugin_server import MockPluginServer  # noqa: E402
+
+from plugnplai.cache import get_default_cache, set_default_cache  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def plugin_server():
+    """100 plugins of 8 operations each, answering without latency."""
+    with MockPluginServer(n_plugins=100, n_operations=8) as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def slow_plugin_server():
+    """20 plugins answering every request after 20 ms, like a remote host."""
+    with MockPluginServer(n_plugins=20, n_operations=8, latency=0.02) as server:
+        yield server
+
+
+@pytest.fixture(scope="session")
+def large_spec_server():
+    """20 plugins with 400 operations each, where parsing the specs dominates."""
+    with MockPluginServer(n_plugins=20, n_operations=400) as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def no_spec_cache():
+    """Measure downloads, not the on-disk cache."""
+    cache = get_default_cache()
+    set_default_cache(None)
+    yield
+    set_default_cache(cache)
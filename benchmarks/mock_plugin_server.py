@@ -0,0 +1,240 @@
+"""
+Local stand-in for plugin servers, to exercise plugnplai without internet.
+
+One HTTP server (standard library only) hosts any number of synthetic
+plugins, each under its own path prefix:
+
+    /<name>/.well-known/ai-plugin.json   the manifest
+    /<name>/openapi.json                 the OpenAPI spec (ETag revalidation)
+    /<name>/items/{id}/op<i>             "searchItems<i>" operations (GET)
+    /<name>/items/op<i>                  "createItem<i>" operations (POST, echo)
+
+The number of operations, the length of the descriptions, the size of the
+operation responses and the latency of every request are configurable, so
+benchmarks are reproducible offline.
+
+Usage:
+    python benchmarks/mock_plugin_server.py [--port 8000] [--plugins 10] [--latency 0.05]
+
+or from Python:
+
+    with MockPluginServer(n_plugins=100, latency=0.01) as server:
+        plugins = Plugins(server.urls, max_workers=16)
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_manifest(name, base_url, description_words=30):
+    description = " ".join(f"{name}-word{i}" for i in range(description_words))
+    return {
+        "schema_version": "v1",
+        "name_for_model": name,
+        "name_for_human": name.title(),
+        "description_for_model": f"Plugin {name}. {description}",
+        "description_for_human": f"Synthetic plugin {name}.",
+        "auth": {"type": "none"},
+        "api": {"type": "openapi", "url": f"{base_url}/openapi.json"},
+    }
+
+
+def make_spec(name, base_url, n_operations=4):
+    """OpenAPI spec with n_operations operations sharing $ref schemas."""
+    paths = {}
+    for i in range(n_operations):
+        if i % 2 == 0:
+            paths[f"/items/{{id}}/op{i}"] = {"get": {
+                "operationId": f"searchItems{i}",
+                "summary": f"Search the items of collection {i}.",
+                "parameters": [
+                    {"name": "id", "in": "path", "required": True, "schema": {"type": "string"},
+                     "description": "Identifier of the collection."},
+                    {"name": "q", "in": "query", "required": False, "schema": {"$ref": "#/components/schemas/Query"}},
+                    {"name": "size", "in": "query", "required": False, "schema": {"type": "integer"},
+                     "description": "Number of bytes of the response."},
+                ],
+                "responses": {"200": {"description": "The items.", "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/ItemList"}}}}},
+            }}
+        else:
+            paths[f"/items/op{i}"] = {"post": {
+                "operationId": f"createItem{i}",
+                "summary": f"Create an item in collection {i}.",
+                "requestBody": {"required": True, "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/Item"}}}},
+                "responses": {"200": {"description": "The created item.", "content": {"application/json": {
+                    "schema": {"$ref": "#/components/schemas/Item"}}}}},
+            }}
+    return {
+        "openapi": "3.0.1",
+        "info": {"title": name, "version": "v1"},
+        "servers": [{"url": base_url}],
+        "paths": paths,
+        "components": {"schemas": {
+            "Query": {"type": "string", "description": "Keywords to search for."},
+            "Item": {"type": "object", "required": ["name"], "properties": {
+                "name": {"type": "string", "description": "Name of the item."},
+                "price": {"type": "number", "description": "Price of the item."},
+            }},
+            "ItemList": {"type": "array", "items": {"$ref": "#/components/schemas/Item"}},
+        }},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send the headers and the body in one packet, otherwise Nagle's algorithm
+    # and delayed ACKs add 40 ms to every keep-alive request
+    wbufsize = 64 * 1024
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _plugin(self):
+        parsed = urlparse(self.path)
+        name, _, rest = parsed.path.strip("/").partition("/")
+        return name, rest, parse_qs(parsed.query)
+
+    def do_GET(self):
+        mock = self.server.mock
+        time.sleep(mock.latency)
+        mock._count()
+        name, rest, query = self._plugin()
+        if name not in mock.names:
+            return self._send(404, b"{}")
+
+        base_url = mock.url(name)
+        if rest == ".well-known/ai-plugin.json":
+            return self._send(200, json.dumps(make_manifest(name, base_url, mock.description_words)).encode())
+        if rest == "openapi.json":
+            etag = f'"{name}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            body = json.dumps(make_spec(name, base_url, mock.n_operations)).encode()
+            return self._send(200, body, {"ETag": etag})
+        if rest.startswith("items/"):
+            size = int(query.get("size", [mock.response_bytes])[0])
+            item = json.dumps({"name": rest, "price": 1.0})
+            count = max(1, size // (len(item) + 2))
+            return self._send(200, ("[" + ", ".join([item] * count) + "]").encode())
+        return self._send(404, b"{}")
+
+    def do_POST(self):
+        mock = self.server.mock
+        time.sleep(mock.latency)
+        mock._count()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        return self._send(200, body or b"{}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MockPluginServer:
+    """HTTP server hosting synthetic plugins on localhost.
+
+    Parameters
+    ----------
+    n_plugins : int, optional
+        Number of plugins, named plugin0, plugin1... Defaults to 10.
+    n_operations : int, optional
+        Number of operations of each plugin. Defaults to 4.
+    description_words : int, optional
+        Number of words of each description_for_model. Defaults to 30.
+    response_bytes : int, optional
+        Approximate size of the GET operation responses. Defaults to 1024.
+    latency : float, optional
+        Seconds slept before answering every request. Defaults to 0.
+    port : int, optional
+        Port to listen on. Defaults to 0 (any free port).
+
+    Attributes
+    ----------
+    names : list
+        The names of the plugins.
+    urls : list
+        The URLs of the plugins.
+    requests : int
+        Number of requests received.
+    """
+
+    def __init__(self, n_plugins=10, n_operations=4, description_words=30, response_bytes=1024,
+                 latency=0.0, port=0):
+        self.names = [f"plugin{i}" for i in range(n_plugins)]
+        self.n_operations = n_operations
+        self.description_words = description_words
+        self.response_bytes = response_bytes
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    @property
+    def urls(self):
+        return [self.url(name) for name in self.names]
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--plugins", type=int, default=10)
+    parser.add_argument("--operations", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--response-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    server = MockPluginServer(args.plugins, args.operations, response_bytes=args.response_bytes,
+                              latency=args.latency, port=args.port)
+    print(f"Serving {args.plugins} plugins at {server.base_url}/<plugin0..plugin{args.plugins - 1}>")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+End-to-end benchmarks of plugnplai on the local mock plugin server.
+
+Usage:
+    pytest benchmarks --benchmark-only [--benchmark-json results.json]
+"""
+import pytest
+
+from plugnplai.embeddings import HashingEmbeddings, PluginRetriever
+from plugnplai.plugins import Plugins
+from plugnplai.utils import get_plugin_manifest
+
+
+@pytest.fixture(scope="module")
+def installed(plugin_server):
+    plugins = Plugins(plugin_server.urls, max_workers=16)
+    # Activate without the max_plugins limit or counting tokens (tiktoken needs a download)
+    for name in plugin_server.names[:3]:
+        plugins.active_plugins[name] = plugins.installed_plugins[name]
+    return plugins
+
+
+@pytest.fixture(scope="module")
+def manifests(plugin_server):
+    return [get_plugin_manifest(url) for url in plugin_server.urls]
+
+
+@pytest.mark.parametrize("max_workers", [None, 16])
+def test_install(benchmark, slow_plugin_server, max_workers):
+    plugins = benchmark.pedantic(Plugins, args=(slow_plugin_server.urls,), kwargs={"max_workers": max_workers},
+                                 rounds=3, iterations=1)
+    assert len(plugins.installed_plugins) == len(slow_plugin_server.urls)
+
+
+@pytest.mark.parametrize("processes", [None, 0])
+def test_install_large_specs(benchmark, large_spec_server, processes):
+    # processes=0 parses the specs in one worker process per core
+    plugins = benchmark.pedantic(Plugins, args=(large_spec_server.urls,),
+                                 kwargs={"max_workers": 16, "processes": processes}, rounds=3, iterations=1)
+    assert len(plugins.installed_plugins) == len(large_spec_server.urls)
+
+
+def test_describe_api(benchmark, installed):
+    plugin = installed.installed_plugins["plugin0"]
+    prompt = benchmark(plugin.describe_api)
+    assert prompt == plugin.description_prompt
+
+
+def test_fill_prompt(benchmark, installed):
+    prompt = benchmark(installed.fill_prompt, installed.template)
+    assert "plugin2" in prompt
+
+
+@pytest.mark.parametrize("operation_id,parameters", [
+    ("searchItems0", {"id": "1", "q": "shoes"}),
+    ("createItem1", {"name": "shoes", "price": 10}),
+])
+def test_call_operation(benchmark, installed, operation_id, parameters):
+    plugin = installed.installed_plugins["plugin0"]
+    response = benchmark(plugin.call_operation, operation_id, parameters)
+    assert response.status_code == 200
+
+
+def test_retriever_build(benchmark, manifests):
+    retriever = benchmark(PluginRetriever, manifests, embeddings=HashingEmbeddings(), engine="numpy")
+    assert len(retriever.docs) == len(manifests)
+
+
+def test_retriever_query(benchmark, manifests):
+    retriever = PluginRetriever(manifests, embeddings=HashingEmbeddings(), engine="numpy")
+    names = benchmark(retriever.retrieve_names, "plugin42-word3 plugin42-word7")
+    assert names[0] == "plugin42"
+
+
+def test_retriever_query_batch(benchmark, manifests):
+    retriever = PluginRetriever(manifests, embeddings=HashingEmbeddings(), engine="numpy")
+    queries = [f"plugin{i}-word1 plugin{i}-word2" for i in range(len(manifests))]
+    results = benchmark(retriever.retrieve_names_batch, queries, 4)
+    assert len(results) == len(queries)
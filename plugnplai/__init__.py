@@ -1,29 +1,104 @@
-from plugnplai.utils import (
-    get_openapi_spec,
-    get_openapi_url,
-    get_plugin_manifest,
-    get_plugins,
-    spec_from_url,
-    get_category_names,
-    parse_llm_response
-)
-from plugnplai.embeddings import PluginRetriever
-from plugnplai.plugins import PluginObject, Plugins, build_request_body, count_tokens
-from plugnplai.api.retrieve import retrieve
-
-from importlib import metadata
-# use the method from LangChain (Chase, H. (2022). LangChain [Computer software]. https://github.com/hwchase17/langchain) to get the version of the package
-try:
-    __version__ = metadata.version(__package__)
-except metadata.PackageNotFoundError:
-    # Case where package metadata is not available.
-    __version__ = ""
-del metadata  # optional, avoids polluting the results of dir(__package__)
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from plugnplai.utils import (
+        get_openapi_spec,
+        get_openapi_url,
+        get_plugin_manifest,
+        get_plugins,
+        spec_from_url,
+        get_category_names,
+        parse_llm_response,
+        parse_llm_calls
+    )
+    from plugnplai.embeddings import HashingEmbeddings, PluginRetriever
+    from plugnplai.plugins import PluginObject, Plugins, build_request_body, count_tokens, format_api_return
+    from plugnplai.async_plugins import AsyncPlugins
+    from plugnplai.call_parser import APICallParser
+    from plugnplai.api.retrieve import retrieve
+    from plugnplai.cache import SpecCache, set_default_cache
+    from plugnplai.response_cache import ResponseCache
+    from plugnplai.resilience import CallGuard, CircuitOpenError
+    from plugnplai.instrumentation import (
+        Instrumentation,
+        CallbackInstrumentation,
+        InMemoryMetrics,
+        OpenTelemetryInstrumentation,
+        get_instrumentation,
+        set_instrumentation
+    )
+    from plugnplai.session import configure_session, get_session
+
+# Public names are imported from their module on first access, so that e.g.
+# using parse_llm_response doesn't load LangChain, FAISS or tiktoken
+_LAZY_ATTRIBUTES = {
+    "get_openapi_spec": "plugnplai.utils",
+    "get_openapi_url": "plugnplai.utils",
+    "get_plugin_manifest": "plugnplai.utils",
+    "get_plugins": "plugnplai.utils",
+    "spec_from_url": "plugnplai.utils",
+    "get_category_names": "plugnplai.utils",
+    "parse_llm_response": "plugnplai.utils",
+    "parse_llm_calls": "plugnplai.utils",
+    "HashingEmbeddings": "plugnplai.embeddings",
+    "PluginRetriever": "plugnplai.embeddings",
+    "PluginObject": "plugnplai.plugins",
+    "Plugins": "plugnplai.plugins",
+    "build_request_body": "plugnplai.plugins",
+    "count_tokens": "plugnplai.plugins",
+    "format_api_return": "plugnplai.plugins",
+    "AsyncPlugins": "plugnplai.async_plugins",
+    "APICallParser": "plugnplai.call_parser",
+    "retrieve": "plugnplai.api.retrieve",
+    "SpecCache": "plugnplai.cache",
+    "set_default_cache": "plugnplai.cache",
+    "ResponseCache": "plugnplai.response_cache",
+    "CallGuard": "plugnplai.resilience",
+    "CircuitOpenError": "plugnplai.resilience",
+    "Instrumentation": "plugnplai.instrumentation",
+    "CallbackInstrumentation": "plugnplai.instrumentation",
+    "InMemoryMetrics": "plugnplai.instrumentation",
+    "OpenTelemetryInstrumentation": "plugnplai.instrumentation",
+    "get_instrumentation": "plugnplai.instrumentation",
+    "set_instrumentation": "plugnplai.instrumentation",
+    "configure_session": "plugnplai.session",
+    "get_session": "plugnplai.session",
+}
+
+
+def _get_version():
+    from importlib import metadata
+    # use the method from LangChain (Chase, H. (2022). LangChain [Computer software]. https://github.com/hwchase17/langchain) to get the version of the package
+    try:
+        return metadata.version(__package__)
+    except metadata.PackageNotFoundError:
+        # Case where package metadata is not available.
+        return ""
+
+
+def __getattr__(name):
+    if name == "__version__":
+        value = _get_version()
+    elif name in _LAZY_ATTRIBUTES:
+        value = getattr(import_module(_LAZY_ATTRIBUTES[name]), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Cache the value, so __getattr__ is only called once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
 
 __all__ = [
     "PluginObject",
     "Plugins",
+    "AsyncPlugins",
     "PluginRetriever",
+    "HashingEmbeddings",
     "get_plugins",
     "get_plugin_manifest",
     "get_openapi_url",
@@ -31,7 +106,23 @@ __all__ = [
     "get_category_names",
     "spec_from_url",
     "parse_llm_response",
+    "parse_llm_calls",
+    "APICallParser",
     "build_request_body",
     "count_tokens",
-    "retrieve"
-]
\ No newline at end of file
+    "format_api_return",
+    "retrieve",
+    "SpecCache",
+    "set_default_cache",
+    "ResponseCache",
+    "CallGuard",
+    "CircuitOpenError",
+    "Instrumentation",
+    "CallbackInstrumentation",
+    "InMemoryMetrics",
+    "OpenTelemetryInstrumentation",
+    "get_instrumentation",
+    "set_instrumentation",
+    "configure_session",
+    "get_session"
+]
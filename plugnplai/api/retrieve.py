@@ -1,5 +1,7 @@
 import requests
 
+from plugnplai.session import get_session
+
 def make_request_get(url: str):
     """Helper function to make a GET request.
 
@@ -9,7 +11,7 @@ def make_request_get(url: str):
     Returns:
         Response: HTTP response object.
     """
-    response = requests.get(url)
+    response = get_session().get(url)
     return response
 
 def retrieve(text: str, available_plugins: list):
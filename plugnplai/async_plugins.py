@@ -0,0 +1,475 @@
+"""
+Asyncio version of the plugins manager.
+
+This module provides an AsyncPlugins class with the same interface as
+Plugins, where installing plugins and calling them doesn't block the event
+loop, so many conversations can share one loop. Requires the httpx package.
+
+Classes
+-------
+    AsyncPlugins
+
+"""
+import asyncio
+import inspect
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from plugnplai.call_parser import APICallParser
+from plugnplai.plugins import PluginObject, Plugins, format_api_return
+from plugnplai.resilience import CircuitOpenError
+from plugnplai.session import _import_httpx
+from plugnplai.streaming import aiter_response, aread_response, truncation_note
+from plugnplai.utils import aspec_from_url, parse_llm_calls, parse_llm_response
+
+
+class AsyncPlugins(Plugins):
+    """Manages installed and active plugins using asyncio.
+
+    Plugins are installed from URLs with ``await AsyncPlugins.create(urls)``
+    or ``await plugins.ainstall_plugins(urls)``, since the constructor can't
+    await the downloads.
+
+    Methods
+    -------
+    create(urls, template=None, max_concurrency=None, timeout=None)
+    ainstall_and_activate(urls, template=None, max_concurrency=None, timeout=None)
+    ainstall_plugins(urls, max_concurrency=None, timeout=None)
+    acall_api(plugin_name, operation_id, parameters, api_key=None, stream=False, timeout=None)
+    astream_api(plugin_name, operation_id, parameters, api_key=None, chunk_size=8192, max_bytes=None)
+    aparse_and_call(llm_response)
+    acall_apis(calls, timeout=None)
+    acall_from_stream(chunks, stop_after_call=True)
+    aapply_plugins(llm_function)
+    aapply_plugins_stream(llm_function, stop_after_call=True)
+    """
+
+    def __init__(self, urls: Optional[List[PluginObject]] = None, template: str = None):
+        """Initialize the AsyncPlugins class.
+
+        Parameters
+        ----------
+        urls : list, optional
+            A list of already built PluginObject instances. Use create() to
+            install plugins from URLs.
+        template : str, optional
+            The prompt template to use. Defaults to template_gpt4.
+        """
+        urls = urls or []
+        if isinstance(urls, str) or any(not isinstance(url, PluginObject) for url in urls):
+            raise ValueError("AsyncPlugins can't install URLs in the constructor, use `await AsyncPlugins.create(urls)`.")
+        super().__init__(urls, template)
+
+    @classmethod
+    async def create(cls, urls: Union[str, List[str]], template: Optional[str] = None,
+                     max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        """Install plugins from URLs.
+
+        Parameters
+        ----------
+        urls : str or list
+            A single URL or list of URLs.
+        template : str, optional
+            The prompt template to use. Defaults to template_gpt4.
+        max_concurrency : int, optional
+            Maximum number of plugins fetched at the same time. Defaults to no limit.
+        timeout : float, optional
+            Deadline in seconds for installing the whole batch of plugins.
+
+        Returns
+        -------
+        AsyncPlugins
+            An initialized AsyncPlugins instance with the plugins installed.
+        """
+        instance = cls(template=template)
+        await instance.ainstall_plugins(urls, max_concurrency=max_concurrency, timeout=timeout)
+        return instance
+
+    @classmethod
+    async def ainstall_and_activate(cls, urls: Union[str, List[str]], template: Optional[str] = None,
+                                    max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        """Install plugins from URLs and activate them.
+
+        Parameters
+        ----------
+        urls : str or list
+            A single URL or list of URLs.
+        template : str, optional
+            The prompt template to use. Defaults to template_gpt4.
+        max_concurrency : int, optional
+            Maximum number of plugins fetched at the same time. Defaults to no limit.
+        timeout : float, optional
+            Deadline in seconds for installing the whole batch of plugins.
+
+        Returns
+        -------
+        AsyncPlugins
+            An initialized AsyncPlugins instance with the plugins installed and activated.
+        """
+        instance = await cls.create(urls, template, max_concurrency=max_concurrency, timeout=timeout)
+        for plugin_name in instance.installed_plugins.keys():
+            instance.activate(plugin_name)
+        return instance
+
+    @staticmethod
+    async def _aload_plugin(url: str) -> PluginObject:
+        """Fetch the manifest and OpenAPI spec of a plugin and build its PluginObject."""
+        manifest, openapi_spec = await aspec_from_url(url, resolve_refs=False)
+        return PluginObject(url, openapi_spec, manifest)
+
+    async def ainstall_plugins(self, urls: Union[str, List[str], List[PluginObject]], max_concurrency: Optional[int] = None,
+                               timeout: Optional[float] = None) -> Dict[str, Optional[Exception]]:
+        """Install plugins from URLs concurrently.
+
+        Parameters
+        ----------
+        urls : str or list
+            A single URL or list of URLs.
+        max_concurrency : int, optional
+            Maximum number of plugins fetched at the same time. Defaults to no limit.
+        timeout : float, optional
+            Deadline in seconds for the whole batch. Plugins that finish in
+            time are installed, the others are reported as timed out.
+
+        Returns
+        -------
+        dict
+            A dictionary keyed by URL with None for installed plugins or the
+            exception raised for failed ones.
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+
+        if urls and isinstance(urls[0], PluginObject):
+            self.install_plugins(urls)
+            return {plugin.url: None for plugin in urls}
+
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def load(url):
+            if semaphore is None:
+                return await self._aload_plugin(url)
+            async with semaphore:
+                return await self._aload_plugin(url)
+
+        tasks = {url: asyncio.ensure_future(load(url)) for url in urls}
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+
+        # Install in the order the URLs were given, so the result does not
+        # depend on which plugin answered first
+        results = {}
+        cancelled = []
+        for url, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                cancelled.append(task)
+                results[url] = TimeoutError(f'Installing {url} did not finish within {timeout} seconds')
+            elif task.exception() is not None:
+                results[url] = task.exception()
+            else:
+                plugin = task.result()
+                self.installed_plugins[plugin.name_for_model] = plugin
+                results[url] = None
+        if cancelled:
+            # Let the cancelled downloads close their connections, so none is left running
+            await asyncio.wait(cancelled)
+
+        self.install_errors.update({url: error for url, error in results.items() if error is not None})
+        return results
+
+    async def acall_api(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: str = None,
+                        stream: bool = False, timeout: Optional[float] = None):
+        """Call an operation in an active plugin.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        operation_id : str
+            The ID of the operation to call.
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
+        stream : bool, optional
+            Read the body of the response on demand. Defaults to False.
+        timeout : float, optional
+            Deadline in seconds for the whole call. Defaults to the timeout
+            of call_guard, if there is one, else no deadline.
+
+        Returns
+        -------
+        httpx.Response or None
+            The response from the API call, or None if unsuccessful (e.g.
+            timed out) or if the plugin is unavailable after repeated errors.
+        """
+        openapi_object = self.active_plugins.get(plugin_name)
+
+        if openapi_object is None:
+            print(f'Plugin {plugin_name} not found')
+            return None
+
+        if operation_id not in openapi_object.operation_details_dict:
+            print(f'Operation {operation_id} not found in plugin {plugin_name}')
+            return None
+
+        httpx = _import_httpx()
+        try:
+            return await openapi_object.acall_operation(operation_id, parameters, api_key, stream=stream,
+                                                        cache=self.response_cache, guard=self.call_guard,
+                                                        timeout=timeout)
+        except CircuitOpenError as e:
+            print(e)
+            return None
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            # Timeouts and connection errors, already counted by the breaker
+            print(f'Call to {plugin_name}.{operation_id} failed: {e!r}')
+            return None
+
+    async def astream_api(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: str = None,
+                          chunk_size: int = 8192, max_bytes: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Call an operation in an active plugin and iterate over its response.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        operation_id : str
+            The ID of the operation to call.
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
+        chunk_size : int, optional
+            Size of the chunks read from the connection. Defaults to 8192.
+        max_bytes : int, optional
+            Maximum number of bytes to read. Defaults to max_response_bytes.
+
+        Yields
+        ------
+        bytes
+            The chunks of the response.
+        """
+        response = await self.acall_api(plugin_name, operation_id, parameters, api_key, stream=True)
+        if response is None:
+            return
+
+        if max_bytes is None:
+            max_bytes = self.max_response_bytes
+        async for chunk in aiter_response(response, chunk_size=chunk_size, max_bytes=max_bytes):
+            yield chunk
+
+    async def _aresponse_text(self, response: Any) -> str:
+        """Read the text of an API response for the LLM, within max_response_bytes."""
+        if self.max_response_bytes is None and self.summarize_response is None:
+            return response.text
+        text, truncated = await aread_response(response, self.max_response_bytes)
+        summarize = self.summarize_response or truncation_note
+        return summarize(text, truncated)
+
+    async def _acall_for_llm(self, api_info: Dict[str, Any]) -> Optional[str]:
+        """Call the API of a parsed API call and read its response for the LLM."""
+        print(f"Using {api_info['plugin_name']}")
+
+        api_response = await self.acall_api(api_info['plugin_name'], api_info['operation_id'],
+                                            api_info['parameters'], stream=self.max_response_bytes is not None)
+        if api_response is None:
+            return None
+        return await self._aresponse_text(api_response)
+
+    async def aparse_and_call(self, llm_response: str) -> Optional[str]:
+        """Parse an LLM response for API calls and call the specified plugins.
+
+        Parameters
+        ----------
+        llm_response : str
+            The LLM response to parse.
+
+        Returns
+        -------
+        str or None
+            The API response, or None if unsuccessful.
+        """
+        api_info = parse_llm_response(llm_response)
+
+        if api_info:
+            return await self._acall_for_llm(api_info)
+
+        return None
+
+    async def _acall_for_llm_safe(self, api_info: Dict[str, Any], timeout: Optional[float] = None) -> Optional[str]:
+        """_acall_for_llm within a timeout, printing the errors instead of raising them."""
+        name = f"{api_info['plugin_name']}.{api_info['operation_id']}"
+        try:
+            return await asyncio.wait_for(self._acall_for_llm(api_info), timeout)
+        except asyncio.TimeoutError:
+            print(f"{name} did not finish within {timeout} seconds")
+        except Exception as e:
+            print(f"Error calling {name}: {e}")
+        return None
+
+    async def acall_apis(self, calls: List[Dict[str, Any]],
+                         timeout: Optional[float] = None) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+        """Make several API calls concurrently.
+
+        Parameters
+        ----------
+        calls : list
+            The API calls, as returned by parse_llm_calls.
+        timeout : float, optional
+            Seconds each call has to finish. Calls still running then are
+            cancelled and reported as unsuccessful. Defaults to call_timeout.
+
+        Returns
+        -------
+        list
+            The (api_info, api_response) pair of each call, in the order of
+            the calls, with api_response None if the call was unsuccessful.
+        """
+        if timeout is None:
+            timeout = self.call_timeout
+        responses = await asyncio.gather(*(self._acall_for_llm_safe(api_info, timeout) for api_info in calls))
+        return list(zip(calls, responses))
+
+    async def acall_from_stream(self, chunks: Union[Iterable[str], AsyncIterable[str]], stop_after_call: bool = True
+                                ) -> Tuple[str, List[Tuple[Dict[str, Any], Optional[str]]]]:
+        """Read a streamed LLM response and call each API as soon as its <API> block is complete.
+
+        The calls run as tasks, so they overlap with the rest of the generation.
+
+        Parameters
+        ----------
+        chunks : iterable or async iterable of str
+            The text chunks of the LLM response, as they are generated.
+        stop_after_call : bool, optional
+            Stop reading (and close) the stream once a chunk completes an API
+            call. Defaults to True. With False, every API call of the response
+            is made.
+
+        Returns
+        -------
+        tuple
+            The text read from the stream, and the (api_info, api_response)
+            pair of each API call in order, with api_response None if the
+            call was unsuccessful.
+        """
+        parser = APICallParser()
+        calls = []
+        stream = _aiter_chunks(chunks)
+        try:
+            async for chunk in stream:
+                for api_info in parser.feed(chunk):
+                    calls.append((api_info, asyncio.ensure_future(self._acall_for_llm_safe(api_info, self.call_timeout))))
+                if calls and stop_after_call:
+                    break
+            # Stops the generation now, instead of when the generator is collected
+            await stream.aclose()
+            responses = await asyncio.gather(*(task for _, task in calls))
+        except BaseException:
+            for _, task in calls:
+                task.cancel()
+            await stream.aclose()
+            raise
+
+        return parser.text, [(api_info, response) for (api_info, _), response in zip(calls, responses)]
+
+    def aapply_plugins(self, llm_function: Callable[..., Any]) -> Callable[..., Any]:
+        """Decorate an LLM function to apply active plugins, as a coroutine function.
+
+        The LLM function can be a coroutine function or a regular function.
+        The API calls are made with acall_apis. apply_plugins, inherited from
+        Plugins, still gives a regular function.
+
+        Parameters
+        ----------
+        llm_function : callable
+            The LLM function to decorate.
+
+        Returns
+        -------
+        callable
+            The decorated LLM coroutine function.
+        """
+        async def call_llm(message: str, *args: Any, **kwargs: Any) -> str:
+            response = llm_function(message, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+
+        async def decorator(user_message: str, *args: Any, **kwargs: Any) -> str:
+            # Add the prompt as a prefix of the user's message
+            message_with_prompt = f"{self._llm_prompt()}\n{user_message}"
+            llm_response = await call_llm(message_with_prompt, *args, **kwargs)
+
+            if '<API>' in llm_response:
+                # Make every API call of the response concurrently
+                llm_summary = format_api_return(user_message, await self.acall_apis(parse_llm_calls(llm_response)))
+
+                if llm_summary is not None:
+                    # Call the LLM function again with the API response summary
+                    return await call_llm(llm_summary, *args, **kwargs)
+
+            # Return the original LLM response if no API calls were made
+            return llm_response
+
+        return decorator
+
+    def aapply_plugins_stream(self, llm_function: Callable[..., Any], stop_after_call: bool = True) -> Callable[..., Any]:
+        """Decorate a streaming LLM function to apply active plugins, as a coroutine function.
+
+        The LLM function returns the text chunks of its response as an
+        iterable or an async iterable (possibly from a coroutine). The API is
+        called as soon as the <API> block is complete (see acall_from_stream).
+
+        Parameters
+        ----------
+        llm_function : callable
+            The LLM function to decorate.
+        stop_after_call : bool, optional
+            Stop the generation after the first API call. Defaults to True.
+
+        Returns
+        -------
+        callable
+            The decorated LLM coroutine function, returning the final response as a str.
+        """
+        async def stream_llm(message: str, *args: Any, **kwargs: Any):
+            chunks = llm_function(message, *args, **kwargs)
+            if inspect.isawaitable(chunks):
+                chunks = await chunks
+            return chunks
+
+        async def decorator(user_message: str, *args: Any, **kwargs: Any) -> str:
+            message_with_prompt = f"{self._llm_prompt()}\n{user_message}"
+            llm_response, calls = await self.acall_from_stream(
+                await stream_llm(message_with_prompt, *args, **kwargs), stop_after_call=stop_after_call)
+
+            llm_summary = format_api_return(user_message, calls)
+            if llm_summary is None:
+                # Return the original LLM response if no API calls were made
+                return llm_response
+            return ''.join([chunk async for chunk in _aiter_chunks(await stream_llm(llm_summary, *args, **kwargs))])
+
+        return decorator
+
+
+async def _aiter_chunks(chunks: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    """Iterate over a sync or async stream of chunks, closing it at the end."""
+    if hasattr(chunks, '__aiter__'):
+        iterator = chunks.__aiter__()
+        try:
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            aclose = getattr(iterator, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+    else:
+        iterator = iter(chunks)
+        try:
+            for chunk in iterator:
+                yield chunk
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
@@ -0,0 +1,216 @@
+"""
+Bulk installation of plugins using all the cores.
+
+Parsing a large OpenAPI spec (JSON or YAML), resolving its $refs and
+compiling its operations is CPU-bound, so installing many plugins with
+threads only is limited by one core. load_plugins keeps the downloads on a
+thread pool and sends the parse, the $ref resolution and the PluginObject
+compilation to a process pool. Only the compiled PluginObjects, without
+their raw spec, come back to the main process.
+
+The worker processes are started with forkserver (spawn where it isn't
+available), so a script calling load_plugins needs the usual
+``if __name__ == "__main__":`` guard of multiprocessing. Starting them
+takes a while, so one pool with a worker per core is kept and shared by
+the calls, unless they ask for another number of processes or give their
+own executor.
+
+Functions
+---------
+    load_plugins
+
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from requests.compat import chardet
+
+from plugnplai.cache import SpecCache, get_default_cache
+from plugnplai.plugins import PluginObject
+from plugnplai.utils import (
+    _parse_cached_response,
+    get_openapi_url,
+    get_plugin_manifest,
+    make_request_get,
+    marshal_spec,
+)
+
+# Response headers the cache needs to revalidate a spec
+_CACHE_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+
+
+def _process_context():
+    """Start method of the worker processes.
+
+    The workers are started while the download threads are running, and
+    forking a process with threads can copy locks held by another thread
+    (e.g. in the connection pools), so the workers are never forked from
+    this process.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+# Process pool shared by the load_plugins calls with the default number of processes
+_compiler = None
+_compiler_lock = threading.Lock()
+
+
+def _shared_compiler() -> ProcessPoolExecutor:
+    """Get the shared process pool, with one worker per core, starting it on first use."""
+    global _compiler
+    with _compiler_lock:
+        if _compiler is None:
+            _compiler = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=_process_context())
+        return _compiler
+
+
+def _discard_compiler(compiler: ProcessPoolExecutor):
+    """Drop a broken shared pool, so the next call starts a new one."""
+    global _compiler
+    with _compiler_lock:
+        if _compiler is compiler:
+            _compiler = None
+    compiler.shutdown(wait=False, cancel_futures=True)
+
+
+class _Body(NamedTuple):
+    """The part of a spec response sent to the worker processes."""
+    status_code: int
+    content: bytes
+    # Charset of the Content-Type, or None to detect it
+    encoding: Optional[str]
+    headers: Dict[str, Optional[str]]
+
+    @property
+    def text(self) -> str:
+        """Decode the body the way requests.Response.text does, in the worker process."""
+        encoding = self.encoding
+        if encoding is None:
+            encoding = chardet.detect(self.content)["encoding"]
+        try:
+            return str(self.content, encoding or "utf-8", errors="replace")
+        except (LookupError, TypeError):
+            return str(self.content, errors="replace")
+
+
+def _download(url: str, cache: Optional[SpecCache], deadline: Optional[float]):
+    """Download the manifest and the raw OpenAPI spec of a plugin (I/O thread)."""
+    manifest = get_plugin_manifest(url, cache=cache, deadline=deadline)
+    openapi_url = get_openapi_url(url, manifest)
+
+    entry = cache.lookup(openapi_url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        return manifest, openapi_url, entry, None
+
+    headers = cache.conditional_headers(entry) if entry is not None else None
+    response = make_request_get(openapi_url, timeout=20, headers=headers, deadline=deadline)
+    body = None
+    if response is not None:
+        # The raw bytes are sent, so they are stored in the cache as received
+        # and decoded in the worker instead of in this process
+        body = _Body(response.status_code, response.content, response.encoding,
+                     {name: response.headers.get(name) for name in _CACHE_HEADERS})
+    return manifest, openapi_url, entry, body
+
+
+def _compile(url: str, manifest: dict, openapi_url: str, entry: Optional[dict], body: Optional[_Body],
+             cache: Optional[SpecCache]) -> PluginObject:
+    """Parse the spec, resolve its references and compile the PluginObject (worker process)."""
+    if body is None and entry is not None:
+        spec = cache.load_parsed(entry)
+    elif cache is not None:
+        spec = _parse_cached_response(openapi_url, marshal_spec, cache, entry, body)
+    else:
+        spec = marshal_spec(body.text, content_type=body.headers.get("Content-Type"), url=openapi_url)
+    return PluginObject(url, spec, manifest, keep_spec=False)
+
+
+def load_plugins(urls: List[str], max_workers: int = 16, processes: Optional[int] = None,
+                 timeout: Optional[float] = None, cache: Optional[SpecCache] = None,
+                 executor: Optional[Executor] = None) -> Dict[str, Union[PluginObject, Exception]]:
+    """Download plugins on threads and compile them in a process pool.
+
+    The spec of each plugin is parsed as soon as it is downloaded, so the
+    downloads and the parsing overlap.
+
+    Parameters
+    ----------
+    urls : list
+        A list of plugin URLs.
+    max_workers : int, optional
+        Number of plugins downloaded at the same time. Defaults to 16.
+    processes : int, optional
+        Number of worker processes, in a pool of this call only. Defaults to
+        the pool shared by the calls, with one worker per core.
+    timeout : float, optional
+        Deadline in seconds for the whole batch. Defaults to None (no deadline).
+    cache : SpecCache, optional
+        On-disk cache to use. Defaults to the default cache.
+    executor : concurrent.futures.Executor, optional
+        Process pool to compile the plugins in, instead of the shared one.
+        It is not shut down. Defaults to None.
+
+    Returns
+    -------
+    dict
+        A dictionary keyed by URL with the compiled PluginObject (without its
+        raw spec, see PluginObject.drop_spec) or the exception raised.
+    """
+    cache = cache or get_default_cache()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = {}
+
+    downloads = ThreadPoolExecutor(max_workers=max_workers)
+    if executor is not None:
+        compiler = executor
+    elif processes:
+        compiler = ProcessPoolExecutor(max_workers=processes, mp_context=_process_context())
+    else:
+        compiler = _shared_compiler()
+    compiling = {}
+    try:
+        pending = {downloads.submit(_download, url, cache, deadline): url for url in urls}
+        while pending or compiling:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(list(pending) + list(compiling), timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+
+            for future in done:
+                if future in pending:
+                    url = pending.pop(future)
+                    if future.exception() is not None:
+                        results[url] = future.exception()
+                    else:
+                        try:
+                            compiling[compiler.submit(_compile, url, *future.result(), cache)] = url
+                        except BrokenProcessPool as e:
+                            results[url] = e
+                else:
+                    url = compiling.pop(future)
+                    results[url] = future.exception() or future.result()
+
+                if isinstance(results.get(url), BrokenProcessPool) and compiler is _compiler:
+                    # A worker died: the next calls get a new pool
+                    _discard_compiler(compiler)
+
+        for url in list(pending.values()) + list(compiling.values()):
+            results[url] = TimeoutError(f'Installing {url} did not finish within {timeout} seconds')
+    finally:
+        # Do not block on plugins that missed the deadline
+        downloads.shutdown(wait=False, cancel_futures=True)
+        if executor is None and processes:
+            compiler.shutdown(wait=False, cancel_futures=True)
+        else:
+            # The pool is shared: only this call's work is cancelled
+            for future in compiling:
+                future.cancel()
+
+    return {url: results[url] for url in urls}
@@ -0,0 +1,370 @@
+"""
+Persistent on-disk cache for plugin manifests and OpenAPI specs.
+
+Entries are keyed by the SHA-256 of the URL and point to content-addressed
+objects (the raw body and the parsed document), so identical specs served
+from different URLs are only stored once. Each entry keeps the ETag and
+Last-Modified headers of the response so stale entries can be revalidated
+with a conditional GET.
+
+Classes
+-------
+    SpecCache
+
+Functions
+---------
+    get_default_cache
+    set_default_cache
+
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+# Objects written or reused this many seconds before a prune started are
+# kept even if no entry points to them: a concurrent store (maybe in another
+# process) may be about to write its entry
+_STORE_GRACE = 10
+# Stores between two scans of the objects directory, which other processes
+# may write as well
+_RESCAN_EVERY = 100
+
+
+class SpecCache:
+    """On-disk cache for manifests and OpenAPI specs with HTTP revalidation.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory where the cache is stored. Defaults to ``~/.cache/plugnplai``.
+    ttl : float, optional
+        Seconds an entry is served without contacting the server. After that
+        it is revalidated with a conditional GET. Defaults to 3600.
+    max_bytes : int, optional
+        Maximum size of the stored objects. The least recently used entries
+        are evicted when it is exceeded. Defaults to 256 MB.
+    max_age : float, optional
+        Seconds after which a stale entry is evicted instead of being kept for
+        revalidation. Defaults to None (keep stale entries).
+
+    Methods
+    -------
+    lookup(url)
+    is_fresh(entry)
+    conditional_headers(entry)
+    load_parsed(entry)
+    load_body(entry)
+    store(url, body, parsed, headers)
+    refresh(url, entry, headers)
+    prune()
+    clear()
+    """
+
+    def __init__(self, directory: Optional[str] = None, ttl: float = 3600,
+                 max_bytes: int = 256 * 1024 * 1024, max_age: Optional[float] = None):
+        self.directory = directory or os.path.join(os.path.expanduser("~"), ".cache", "plugnplai")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries_dir = os.path.join(self.directory, "entries")
+        self._objects_dir = os.path.join(self.directory, "objects")
+        # Size of the objects, tracked by store between scans of the directory
+        self._size = None
+        self._stores = 0
+        os.makedirs(self._entries_dir, exist_ok=True)
+        os.makedirs(self._objects_dir, exist_ok=True)
+
+    @staticmethod
+    def _hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _entry_path(self, url: str) -> str:
+        return os.path.join(self._entries_dir, self._hash(url.encode("utf-8")) + ".json")
+
+    def _object_path(self, content_hash: str, suffix: str) -> str:
+        return os.path.join(self._objects_dir, content_hash + suffix)
+
+    def _write_atomic(self, path: str, data: bytes):
+        """Write a file atomically so concurrent workers never read partial data."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Get the cache entry for a URL.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the document.
+
+        Returns
+        -------
+        dict or None
+            The entry metadata, or None if the URL is not cached.
+        """
+        path = self._entry_path(url)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if self.max_age is not None and time.time() - entry["fetched_at"] > self.max_age:
+            self._remove_entry(path, entry)
+            return None
+
+        if not os.path.exists(self._object_path(entry["content_hash"], ".json")):
+            return None
+
+        # Mark the entry as recently used for the LRU eviction
+        os.utime(path)
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """Check if an entry can be served without revalidation."""
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        """Build the headers for a conditional GET revalidating an entry."""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load_parsed(self, entry: Dict[str, Any]) -> Any:
+        """Load the parsed document of an entry."""
+        with open(self._object_path(entry["content_hash"], ".json"), "r") as f:
+            return json.load(f)
+
+    def load_body(self, entry: Dict[str, Any]) -> bytes:
+        """Load the raw body of an entry."""
+        with open(self._object_path(entry["content_hash"], ".body"), "rb") as f:
+            return f.read()
+
+    def store(self, url: str, body: bytes, parsed: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Store a downloaded document.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the document.
+        body : bytes
+            The raw response body.
+        parsed : Any
+            The parsed document. Must be JSON serializable.
+        headers : dict, optional
+            The response headers, used to keep the ETag and Last-Modified values.
+
+        Returns
+        -------
+        dict
+            The new entry metadata.
+        """
+        headers = headers or {}
+        content_hash = self._hash(body)
+        body_path = self._object_path(content_hash, ".body")
+        parsed_path = self._object_path(content_hash, ".json")
+        written = 0
+        try:
+            # Touch the objects so a concurrent prune keeps them until the entry points to them
+            os.utime(body_path)
+            os.utime(parsed_path)
+        except OSError:
+            data = json.dumps(parsed, default=str).encode("utf-8")
+            self._write_atomic(body_path, body)
+            self._write_atomic(parsed_path, data)
+            written = len(body) + len(data)
+
+        entry = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "content_type": headers.get("Content-Type"),
+            "content_hash": content_hash,
+            "fetched_at": time.time(),
+        }
+        self._write_atomic(self._entry_path(url), json.dumps(entry).encode("utf-8"))
+        if self._track_size(written) > self.max_bytes:
+            self.prune()
+        return entry
+
+    def _track_size(self, written: int) -> int:
+        """Add the bytes written by a store to the size of the objects, rescanning it now and then."""
+        self._stores += 1
+        if self._size is None or self._stores >= _RESCAN_EVERY:
+            self._size = self._objects_size()
+            self._stores = 0
+        else:
+            self._size += written
+        return self._size
+
+    def refresh(self, url: str, entry: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Mark an entry as fresh again after a 304 Not Modified response."""
+        headers = headers or {}
+        entry = dict(entry, fetched_at=time.time())
+        entry["etag"] = headers.get("ETag") or entry.get("etag")
+        entry["last_modified"] = headers.get("Last-Modified") or entry.get("last_modified")
+        self._write_atomic(self._entry_path(url), json.dumps(entry).encode("utf-8"))
+        return entry
+
+    def _remove_entry(self, path: str, entry: Optional[Dict[str, Any]] = None):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if entry is not None:
+            self._remove_unreferenced(entry["content_hash"])
+
+    def _remove_unreferenced(self, content_hash: str):
+        """Remove the objects of a content hash if no entry points to it anymore."""
+        before = time.time() - _STORE_GRACE
+        for _, entry in self._iter_entries():
+            if entry["content_hash"] == content_hash:
+                return
+        self._remove_objects(content_hash, before)
+
+    def _remove_objects(self, content_hash: str, before: float):
+        """Remove the objects of a content hash, unless one was written or reused since ``before``."""
+        paths = [self._object_path(content_hash, suffix) for suffix in (".body", ".json")]
+        for path in paths:
+            try:
+                if os.path.getmtime(path) >= before:
+                    return
+            except OSError:
+                pass
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _objects_size(self) -> int:
+        return sum(item.stat().st_size for item in os.scandir(self._objects_dir) if item.is_file())
+
+    def _iter_entries(self):
+        for name in os.listdir(self._entries_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self._entries_dir, name)
+            try:
+                with open(path, "r") as f:
+                    yield path, json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    def prune(self):
+        """Evict expired entries and the least recently used ones above max_bytes.
+
+        Objects written or reused by a store shortly before the prune started
+        are kept, as the entry pointing to them may not be written yet.
+        """
+        now = time.time()
+        entries = []
+        for path, entry in self._iter_entries():
+            if self.max_age is not None and now - entry["fetched_at"] > self.max_age:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                entries.append((os.path.getmtime(path), path, entry))
+            except OSError:
+                continue
+
+        # Objects can be shared between entries, so size them once per hash
+        sizes = {}
+        for _, _, entry in entries:
+            content_hash = entry["content_hash"]
+            if content_hash not in sizes:
+                sizes[content_hash] = sum(
+                    os.path.getsize(p) for p in (self._object_path(content_hash, ".body"),
+                                                 self._object_path(content_hash, ".json"))
+                    if os.path.exists(p)
+                )
+
+        total = sum(sizes.values())
+        entries.sort(key=lambda item: item[0])
+        referenced = {}
+        for _, _, entry in entries:
+            referenced[entry["content_hash"]] = referenced.get(entry["content_hash"], 0) + 1
+
+        for _, path, entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            content_hash = entry["content_hash"]
+            referenced[content_hash] -= 1
+            if referenced[content_hash] == 0:
+                total -= sizes[content_hash]
+
+        # Drop objects that are no longer referenced by any entry
+        before = now - _STORE_GRACE
+        unreferenced = set()
+        for name in os.listdir(self._objects_dir):
+            content_hash, _, suffix = name.partition(".")
+            if suffix in ("body", "json") and referenced.get(content_hash, 0) == 0:
+                unreferenced.add(content_hash)
+        for content_hash in unreferenced:
+            self._remove_objects(content_hash, before)
+        # Objects kept for a concurrent store are counted at the next rescan
+        self._size = total
+        self._stores = 0
+
+    def clear(self):
+        """Remove every entry and object from the cache."""
+        self._size = None
+        for directory in (self._entries_dir, self._objects_dir):
+            for name in os.listdir(directory):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+
+_default_cache = None
+
+
+def get_default_cache() -> Optional[SpecCache]:
+    """Get the cache used by get_plugin_manifest and get_openapi_spec.
+
+    If no cache was set with set_default_cache and the PLUGNPLAI_CACHE_DIR
+    environment variable is defined, a cache is created in that directory.
+
+    Returns
+    -------
+    SpecCache or None
+        The default cache, or None if caching is disabled.
+    """
+    global _default_cache
+    if _default_cache is None and os.environ.get("PLUGNPLAI_CACHE_DIR"):
+        _default_cache = SpecCache(os.environ["PLUGNPLAI_CACHE_DIR"])
+    return _default_cache
+
+
+def set_default_cache(cache: Optional[SpecCache]):
+    """Set the cache used by get_plugin_manifest and get_openapi_spec.
+
+    Parameters
+    ----------
+    cache : SpecCache or None
+        The cache to use, or None to disable caching.
+    """
+    global _default_cache
+    _default_cache = cache
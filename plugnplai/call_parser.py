@@ -0,0 +1,93 @@
+"""
+Incremental parsing of the API calls in a streamed LLM response.
+
+parse_llm_response needs the whole LLM response. APICallParser is fed the
+chunks of the response as the LLM streams them, and returns each
+``<API>plugin.operation(...)</API>`` block as soon as its closing tag
+arrives, so the plugin can be called while the LLM is still generating, or
+the generation stopped early. Only the text after the last complete block
+is scanned again when a chunk arrives.
+
+Classes
+-------
+    APICallParser
+
+"""
+from typing import Any, Dict, List
+
+from plugnplai.utils import _API_CLOSE_TAG, _API_OPEN_TAG, _parse_api_block
+
+
+class APICallParser:
+    """Find the API calls in an LLM response streamed chunk by chunk.
+
+    Attributes
+    ----------
+    calls : list
+        The API calls found so far, as returned by parse_llm_response.
+
+    Methods
+    -------
+    feed(chunk)
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._chunks = []
+        # Text not parsed yet: from the start of an open block, or the end
+        # of the text that may be the start of an opening tag
+        self._pending = ''
+        self._in_block = False
+        # Position in _pending from which to look for the closing tag
+        self._scan_from = 0
+
+    @property
+    def text(self) -> str:
+        """The text fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Add a chunk of the LLM response.
+
+        Parameters
+        ----------
+        chunk : str
+            The next chunk of text.
+
+        Returns
+        -------
+        list
+            The API calls completed by this chunk, in order. Blocks that
+            aren't valid API calls are skipped.
+        """
+        self._chunks.append(chunk)
+        self._pending += chunk
+        calls = []
+        while True:
+            if not self._in_block:
+                start = self._pending.find(_API_OPEN_TAG)
+                if start < 0:
+                    # Keep what could be the beginning of an opening tag
+                    self._pending = self._pending[max(0, len(self._pending) - len(_API_OPEN_TAG) + 1):]
+                    break
+                self._pending = self._pending[start:]
+                self._in_block = True
+                self._scan_from = len(_API_OPEN_TAG)
+
+            end = self._pending.find(_API_CLOSE_TAG, self._scan_from)
+            if end < 0:
+                # A closing tag can't start before the last few characters
+                self._scan_from = max(self._scan_from, len(self._pending) - len(_API_CLOSE_TAG) + 1)
+                break
+
+            end += len(_API_CLOSE_TAG)
+            api_info = _parse_api_block(self._pending[:end])
+            self._pending = self._pending[end:]
+            self._in_block = False
+            if api_info:
+                calls.append(api_info)
+
+        self.calls.extend(calls)
+        return calls
@@ -4,15 +4,125 @@ Embeddings for LangChain.
 This module provides a PluginRetriever class that retrieves plugin 
 information based on queries using embeddings and vector stores.
 
+LangChain and FAISS are only imported when a retriever using them is built,
+so the "numpy" engine with local embeddings doesn't need them at all.
+
 Classes
 -------
+    HashingEmbeddings
     PluginRetriever
 
 """
-from langchain.embeddings import OpenAIEmbeddings  
-from langchain.schema import Document
-from langchain.vectorstores import FAISS
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+
+import numpy as np
 from plugnplai.utils import get_plugin_manifest, get_plugins
+from plugnplai.vector_index import NumpyIndex
+
+
+def _import_faiss():
+    from langchain.vectorstores import FAISS
+    return FAISS
+
+
+class _PluginDocument:
+    """Lightweight stand-in for LangChain's Document, used by the numpy engine."""
+
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content, metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+class HashingEmbeddings:
+    """Local CPU embeddings based on hashed term frequencies.
+
+    Words and word bigrams are hashed into a fixed number of features with
+    sublinear term frequency weighting, then L2 normalized. No model or
+    network is needed, and the same text always gets the same vector.
+
+    It implements the LangChain Embeddings interface (embed_documents and
+    embed_query), so it can be used with LangChain vector stores as well, and
+    embed_queries, used by PluginRetriever to embed a batch of queries in one
+    call.
+
+    Parameters
+    ----------
+    n_features : int, optional
+        Size of the embedding vectors. Defaults to 1024.
+    """
+
+    def __init__(self, n_features: int = 1024):
+        self.n_features = n_features
+
+    def _embed(self, text):
+        words = re.findall(r"\w+", text.lower())
+        terms = words + [a + " " + b for a, b in zip(words, words[1:])]
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        for term in terms:
+            # crc32 is stable across processes, unlike hash()
+            h = zlib.crc32(term.encode("utf-8"))
+            vector[h % self.n_features] += 1.0 if (h >> 31) & 1 == 0 else -1.0
+        # Sublinear term frequency, keeping the sign of the hashed feature
+        vector = np.sign(vector) * np.log1p(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        """Embed a list of documents."""
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        """Embed a query."""
+        return self._embed(text)
+
+    def embed_queries(self, texts):
+        """Embed a list of queries."""
+        return [self._embed(text) for text in texts]
+
+
+# Backends that embed queries and documents with the same model, so a batch of
+# queries can be embedded in one embed_documents call
+_SYMMETRIC_EMBEDDINGS = frozenset({"OpenAIEmbeddings", "AzureOpenAIEmbeddings"})
+
+
+def _embed_queries(embeddings, queries):
+    """Embed queries, in one call if the backend can embed a batch of queries.
+
+    The embed_queries method of the embeddings is used if they have one, and
+    embed_documents if queries and documents are embedded the same way
+    (OpenAI). Other models may embed queries and documents differently, so
+    their queries are embedded one by one with embed_query.
+    """
+    embed_queries = getattr(embeddings, "embed_queries", None)
+    if embed_queries is not None:
+        return embed_queries(queries)
+    if type(embeddings).__name__ in _SYMMETRIC_EMBEDDINGS:
+        return embeddings.embed_documents(queries)
+    return [embeddings.embed_query(query) for query in queries]
+
+
+def _embeddings_id(embeddings):
+    """Identify an embedding backend, so vectors of different backends are never mixed."""
+    params = [type(embeddings).__name__]
+    for attr in ("model", "n_features"):
+        if hasattr(embeddings, attr):
+            params.append(str(getattr(embeddings, attr)))
+    return "-".join(params)
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 class PluginRetriever:
     """PluginRetriever retrieves plugin information based on queries using embeddings and vector stores.
@@ -24,17 +134,30 @@ class PluginRetriever:
     returnList : list, optional
         List of objects to be returned. Can be a list of URLs or a list of 
         objects like LangChain AIPluging object. Defaults to None.
+    embeddings : Embeddings, optional
+        Embeddings used to index the plugins. Defaults to OpenAIEmbeddings.
+    index_path : str, optional
+        Directory where the vector index is saved and loaded from. Defaults to None.
+    engine : str, optional
+        Vector index used for the search, "faiss" (LangChain FAISS vector
+        store) or "numpy" (NumpyIndex, no LangChain or FAISS needed).
+        Defaults to "faiss".
         
     Methods
     -------
-    __init__(manifests, returnList=None)
-    from_urls(urls)
-    from_directory(provider='plugnplai')
+    __init__(manifests, returnList=None, embeddings=None, index_path=None, engine="faiss")
+    from_urls(urls, **kwargs)
+    from_directory(provider='plugnplai', **kwargs)
+    add_manifests(manifests, returnList=None)
+    remove_plugins(plugin_names)
+    update_manifest(manifest, plugin_object=None)
     retrieve_names(query)
     retrieve_urls(query)
+    retrieve_names_batch(queries, k=4)
+    retrieve_urls_batch(queries, k=4)
     """
     
-    def __init__(self, manifests, returnList=None):
+    def __init__(self, manifests, returnList=None, embeddings=None, index_path=None, engine="faiss"):
         """Initialize the PluginRetriever.
         
         Parameters
@@ -44,41 +167,304 @@ class PluginRetriever:
         returnList : list, optional
             List of objects to be returned. Can be a list of URLs or a list of 
             objects like LangChain AIPluging object. Defaults to None.
+        embeddings : Embeddings, optional
+            LangChain embeddings used to index the plugins, for example
+            HashingEmbeddings to run locally. Defaults to OpenAIEmbeddings.
+        index_path : str, optional
+            Directory where the vector index and the computed embeddings are
+            saved. If the same manifests were indexed before, the index is
+            loaded from disk, and only new or changed manifests are embedded
+            again. Only the index and the embeddings of the current
+            manifests are kept. Defaults to None (nothing is saved).
+        engine : str, optional
+            Vector index used for the search, "faiss" or "numpy". Defaults to "faiss".
         """
+        if engine not in ("faiss", "numpy"):
+            raise ValueError(f"Unknown engine {engine}, use 'faiss' or 'numpy'.")
+        self.engine = engine
+
         self.returnList = returnList
         if self.returnList:
             # add urls to manifests
             for i in range(len(manifests)):
                 manifests[i]["plugin_object"] = self.returnList[i]
 
-        self.docs = [
-            Document(
+        self.docs = self._build_docs(manifests)
+
+        # Guards the vector store while plugins are added or removed
+        self._lock = threading.RLock()
+
+        # Initialize embeddings
+        if embeddings is None:
+            from langchain.embeddings import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings()
+        self.embeddings = embeddings
+        self.index_path = index_path
+
+        self.vector_store = None
+        self.retriever = None
+        self.index = None
+        if self.engine == "numpy":
+            self.index = self._load_or_build_numpy_index()
+            return
+
+        # Create vector store from documents
+        if self.index_path is None:
+            self.vector_store = _import_faiss().from_documents(self.docs, self.embeddings)
+        else:
+            self.vector_store = self._load_or_build_vector_store()
+
+        # Create a retriever
+        self.retriever = self.vector_store.as_retriever()
+
+    def _build_docs(self, manifests, returnList=None):
+        """Build the documents indexed for a list of manifests."""
+        if self.engine == "numpy":
+            document_class = _PluginDocument
+        else:
+            from langchain.schema import Document
+            document_class = Document
+        return [
+            document_class(
                 page_content=manifest["description_for_model"],
                 metadata={
                     "plugin_name": manifest["name_for_model"],
-                    "plugin_object": manifest.get("plugin_object", None),
+                    "plugin_object": returnList[i] if returnList else manifest.get("plugin_object", None),
                 },
             )
-            for manifest in manifests
+            for i, manifest in enumerate(manifests)
         ]
 
-        # Initialize embeddings
-        self.embeddings = OpenAIEmbeddings()  
+    def _index_key(self):
+        """Key of the indexed content: the embedding backend, and the name and description of each plugin."""
+        content = [_embeddings_id(self.embeddings)] + [
+            [doc.metadata["plugin_name"], doc.page_content] for doc in self.docs
+        ]
+        return _hash_text(json.dumps(content, ensure_ascii=False, separators=(",", ":")))
 
-        # Create vector store from documents
-        self.vector_store = FAISS.from_documents(self.docs, self.embeddings)  
+    def _index_folder(self):
+        return os.path.join(self.index_path, "index")
 
-        # Create a retriever
-        self.retriever = self.vector_store.as_retriever()
+    def _saved_index_folder(self):
+        """Get the folder of the saved index if it indexes the current manifests, else None."""
+        folder = self._index_folder()
+        try:
+            with open(os.path.join(folder, "key"), "r") as f:
+                key = f.read()
+        except OSError:
+            return None
+        return folder if key == self._index_key() else None
+
+    def _save_index(self, save):
+        """Save the index with save(folder), replacing the index saved before."""
+        os.makedirs(self.index_path, exist_ok=True)
+        # Written aside and swapped in, so a reader never sees a partial index
+        new = tempfile.mkdtemp(prefix=".index-", dir=self.index_path)
+        try:
+            save(new)
+            with open(os.path.join(new, "key"), "w") as f:
+                f.write(self._index_key())
+        except BaseException:
+            shutil.rmtree(new, ignore_errors=True)
+            raise
+        folder = self._index_folder()
+        old = None
+        if os.path.exists(folder):
+            old = new + "-old"
+            os.rename(folder, old)
+        os.rename(new, folder)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+        self._prune_embedding_cache()
+
+    def _embedding_cache_path(self):
+        return os.path.join(self.index_path, f"embeddings-{_embeddings_id(self.embeddings)}.npz")
+
+    def _prune_embedding_cache(self):
+        """Drop the saved vectors of the texts that are no longer indexed."""
+        cache_path = self._embedding_cache_path()
+        if not os.path.exists(cache_path):
+            return
+        with np.load(cache_path) as saved:
+            keys, vectors = saved["keys"], saved["vectors"]
+        indexed = {_hash_text(doc.page_content) for doc in self.docs}
+        kept = [i for i, key in enumerate(keys.tolist()) if key in indexed]
+        if len(kept) == len(keys):
+            return
+        if kept:
+            np.savez(cache_path, keys=keys[kept], vectors=vectors[kept])
+        else:
+            os.remove(cache_path)
+
+    def _embed_documents_cached(self, texts):
+        """Embed texts, reusing the vectors saved in index_path for texts seen before."""
+        cache_path = self._embedding_cache_path()
+        cache = {}
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as saved:
+                cache = dict(zip(saved["keys"].tolist(), saved["vectors"]))
+
+        keys = [_hash_text(text) for text in texts]
+        missing = {key: text for key, text in zip(keys, texts) if key not in cache}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            cache.update(zip(missing.keys(), np.asarray(vectors, dtype=np.float32)))
+            np.savez(cache_path, keys=np.array(list(cache.keys())),
+                     vectors=np.stack(list(cache.values())).astype(np.float32))
+
+        return [cache[key].tolist() for key in keys]
+
+    def _load_or_build_numpy_index(self):
+        """Load the NumpyIndex of the current manifests from index_path, or build (and save) it."""
+        texts = [doc.page_content for doc in self.docs]
+        if self.index_path is None:
+            return NumpyIndex(self.embeddings.embed_documents(texts) if texts else None)
+
+        folder = self._saved_index_folder()
+        if folder is not None:
+            return NumpyIndex.load(folder)
+
+        os.makedirs(self.index_path, exist_ok=True)
+        index = NumpyIndex(self._embed_documents_cached(texts) if texts else None)
+        self._save_index(index.save)
+        return index
+
+    def _load_or_build_vector_store(self):
+        """Load the vector store of the current manifests from index_path, or build and save it."""
+        FAISS = _import_faiss()
+        folder = self._saved_index_folder()
+        if folder is not None:
+            vector_store = FAISS.load_local(folder, self.embeddings)
+            # The returned objects aren't part of the key, use the current ones
+            for i, doc in enumerate(self.docs):
+                vector_store.docstore.search(vector_store.index_to_docstore_id[i]).metadata = doc.metadata
+            return vector_store
+
+        os.makedirs(self.index_path, exist_ok=True)
+        texts = [doc.page_content for doc in self.docs]
+        vectors = self._embed_documents_cached(texts)
+        vector_store = FAISS.from_embeddings(
+            list(zip(texts, vectors)), self.embeddings, metadatas=[doc.metadata for doc in self.docs]
+        )
+        self._save_index(vector_store.save_local)
+        return vector_store
+
+    def _save_vector_store(self):
+        """Save the current vector store in index_path, if there is one."""
+        if self.index_path is None:
+            return
+        self._save_index(self.index.save if self.engine == "numpy" else self.vector_store.save_local)
+
+    def add_manifests(self, manifests, returnList=None):
+        """Add plugins to the index, without rebuilding it.
+
+        Plugins already in the index with the same name are replaced.
+
+        Parameters
+        ----------
+        manifests : list
+            List of manifest objects.
+        returnList : list, optional
+            List of objects returned for these plugins (e.g. their URLs).
+            Defaults to None.
+        """
+        docs = self._build_docs(manifests, returnList)
+        if not docs:
+            return
+        texts = [doc.page_content for doc in docs]
+
+        # Embed outside the lock, so searches are not blocked by the embedding calls
+        if self.index_path is not None:
+            vectors = self._embed_documents_cached(texts)
+        else:
+            vectors = self.embeddings.embed_documents(texts)
+
+        with self._lock:
+            self._remove_docs({doc.metadata["plugin_name"] for doc in docs})
+            if self.engine == "numpy":
+                self.index.add(vectors)
+            else:
+                self.vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=[doc.metadata for doc in docs])
+            if self.returnList is not None:
+                self.returnList.extend(returnList or [None] * len(docs))
+            elif returnList:
+                self.returnList = [None] * len(self.docs) + list(returnList)
+            self.docs.extend(docs)
+            self._save_vector_store()
+
+    def remove_plugins(self, plugin_names):
+        """Remove plugins from the index, without rebuilding it.
+
+        Parameters
+        ----------
+        plugin_names : list
+            Names of the plugins to remove.
+        """
+        with self._lock:
+            if self._remove_docs(set(plugin_names)):
+                self._save_vector_store()
+
+    def update_manifest(self, manifest, plugin_object=None):
+        """Replace the indexed manifest of a plugin, or add it if it is not indexed.
+
+        Parameters
+        ----------
+        manifest : dict
+            The new manifest of the plugin.
+        plugin_object : optional
+            The object returned for this plugin (e.g. its URL). Defaults to None.
+        """
+        self.add_manifests([manifest], [plugin_object] if plugin_object is not None else None)
+
+    def _remove_docs(self, plugin_names):
+        """Remove the plugins with the given names from the vector store, docs and returnList.
+
+        Returns
+        -------
+        bool
+            True if any plugin was removed.
+        """
+        if self.engine == "numpy":
+            # The NumpyIndex rows are in the same order as self.docs
+            positions = [i for i, doc in enumerate(self.docs) if doc.metadata["plugin_name"] in plugin_names]
+            if not positions:
+                return False
+            self.index.remove(positions)
+        else:
+            store = self.vector_store
+            ordered_ids = [store.index_to_docstore_id[i] for i in range(len(store.index_to_docstore_id))]
+            positions = [
+                i for i, _id in enumerate(ordered_ids)
+                if store.docstore.search(_id).metadata["plugin_name"] in plugin_names
+            ]
+            if not positions:
+                return False
+
+            # Flat FAISS indexes keep the order of the remaining vectors, so the
+            # positions are compacted the same way in index_to_docstore_id
+            store.index.remove_ids(np.array(positions, dtype=np.int64))
+            removed = set(positions)
+            for i in positions:
+                # InMemoryDocstore has no delete method
+                store.docstore._dict.pop(ordered_ids[i], None)
+            store.index_to_docstore_id = dict(enumerate(_id for i, _id in enumerate(ordered_ids) if i not in removed))
+
+        keep = [i for i, doc in enumerate(self.docs) if doc.metadata["plugin_name"] not in plugin_names]
+        self.docs = [self.docs[i] for i in keep]
+        if self.returnList is not None:
+            self.returnList = [self.returnList[i] for i in keep]
+        return True
 
     @classmethod
-    def from_urls(cls, urls):
+    def from_urls(cls, urls, **kwargs):
         """Create a PluginRetriever object from a list of URLs.
         
         Parameters
         ----------
         urls : list
             List of URLs.
+        **kwargs
+            Passed to the constructor (embeddings, index_path).
             
         Returns
         -------
@@ -86,16 +472,18 @@ class PluginRetriever:
             Initialized PluginRetriever object.
         """
         manifests = [get_plugin_manifest(url) for url in urls]
-        return cls(manifests, urls)
+        return cls(manifests, urls, **kwargs)
 
     @classmethod
-    def from_directory(cls, provider='plugnplai'):
+    def from_directory(cls, provider='plugnplai', **kwargs):
         """Create a PluginRetriever object from a directory.
         
         Parameters
         ----------
         provider : str, optional
             Provider name. Defaults to 'plugnplai'.
+        **kwargs
+            Passed to the constructor (embeddings, index_path).
             
         Returns
         -------
@@ -105,8 +493,15 @@ class PluginRetriever:
         
         urls = get_plugins(filter = 'working', provider = provider)
         manifests = [get_plugin_manifest(url) for url in urls]
-        return cls(manifests)
+        return cls(manifests, **kwargs)
         
+    def _get_relevant_documents(self, query, k=4):
+        """Get the documents of the k plugins most relevant to a query."""
+        if self.engine == "numpy":
+            return [doc for doc, _ in self._search_vectors([self.embeddings.embed_query(query)], k)[0]]
+        with self._lock:
+            return self.retriever.get_relevant_documents(query)
+
     def retrieve_names(self, query):
         """Retrieve plugin names based on a query.
         
@@ -121,7 +516,7 @@ class PluginRetriever:
             List of plugin names.
         """
         # Get relevant documents based on query
-        docs = self.retriever.get_relevant_documents(query)  
+        docs = self._get_relevant_documents(query)
 
         # Get toolkits based on relevant documents
         plugin_names = [d.metadata["plugin_name"] for d in docs]
@@ -141,13 +536,111 @@ class PluginRetriever:
         list
             List of plugin URLs.
         """
-        if not self.urls:
+        if not self.returnList:
             raise Exception("No urls provided in constructor.")
 
         # Get relevant documents based on query
-        docs = self.retriever.get_relevant_documents(query)  
+        docs = self._get_relevant_documents(query)
 
         # Get toolkits based on relevant documents
         plugin_urls = [d.metadata["plugin_object"] for d in docs]
 
         return plugin_urls
+
+    def _search_batch(self, queries, k):
+        """Embed the queries and search them in one matrix search.
+
+        Returns
+        -------
+        list
+            For each query, a list of (document, score) tuples.
+        """
+        if not queries:
+            return []
+        return self._search_vectors(_embed_queries(self.embeddings, list(queries)), k)
+
+    def _search_vectors(self, vectors, k):
+        """Search the index with a matrix of query vectors.
+
+        Returns
+        -------
+        list
+            For each query vector, a list of (document, score) tuples.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        with self._lock:
+            if self.engine == "numpy":
+                scores, indices = self.index.search(vectors, k)
+                return [
+                    [(self.docs[i], float(score)) for score, i in zip(row_scores, row_indices)]
+                    for row_scores, row_indices in zip(scores, indices)
+                ]
+
+            store = self.vector_store
+            distances, indices = store.index.search(vectors, k)
+            results = []
+            for row_distances, row_indices in zip(distances, indices):
+                row = []
+                for distance, i in zip(row_distances, row_indices):
+                    # FAISS returns -1 when there are less than k plugins
+                    if i == -1:
+                        continue
+                    doc = store.docstore.search(store.index_to_docstore_id[i])
+                    # Squared L2 distance to cosine similarity, for normalized embeddings
+                    row.append((doc, float(1.0 - distance / 2.0)))
+                results.append(row)
+        return results
+
+    def retrieve_names_batch(self, queries, k=4):
+        """Retrieve plugin names for many queries at once.
+
+        The queries are embedded in one call when the embeddings have an
+        embed_queries method or embed queries like documents (OpenAI), and
+        one by one with embed_query otherwise. They are then
+        searched with one matrix search, which is much faster than calling
+        retrieve_names in a loop.
+
+        Parameters
+        ----------
+        queries : list
+            List of query strings.
+        k : int, optional
+            Number of plugins to retrieve per query. Defaults to 4.
+
+        Returns
+        -------
+        list
+            For each query, a list of (plugin name, score) tuples, most
+            relevant first. The score is the cosine similarity between the
+            query and the plugin description.
+        """
+        return [
+            [(doc.metadata["plugin_name"], score) for doc, score in row]
+            for row in self._search_batch(queries, k)
+        ]
+
+    def retrieve_urls_batch(self, queries, k=4):
+        """Retrieve plugin URLs for many queries at once.
+
+        Parameters
+        ----------
+        queries : list
+            List of query strings.
+        k : int, optional
+            Number of plugins to retrieve per query. Defaults to 4.
+
+        Returns
+        -------
+        list
+            For each query, a list of (plugin URL, score) tuples, most
+            relevant first. The score is the cosine similarity between the
+            query and the plugin description.
+        """
+        if not self.returnList:
+            raise Exception("No urls provided in constructor.")
+
+        return [
+            [(doc.metadata["plugin_object"], score) for doc, score in row]
+            for row in self._search_batch(queries, k)
+        ]
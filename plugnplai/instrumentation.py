@@ -0,0 +1,481 @@
+"""
+Timing spans, counters and histograms for the stages of the plugin lifecycle.
+
+The hot paths of the library (manifest and spec download, spec parsing,
+$ref resolution, PluginObject construction, token counting, prompt
+building, LLM response parsing and plugin calls) are wrapped in spans. By
+default the instrumentation is a no-op: span returns a shared object that
+does nothing, so the cost is one function call. Set an instrumentation to
+record them:
+
+- CallbackInstrumentation calls your functions with each span, counter and
+  histogram
+- InMemoryMetrics keeps the durations of the spans, the latency and error
+  rate of the calls of each plugin, and the values of the histograms, with
+  their percentiles
+- OpenTelemetryInstrumentation records them with the OpenTelemetry API
+
+Every plugin call (span "plugnplai.call", with the plugin and operation
+attributes) also records the histogram "plugnplai.call.duration" and the
+counters "plugnplai.calls" and "plugnplai.call.errors".
+
+Classes
+-------
+    Instrumentation
+    CallbackInstrumentation
+    InMemoryMetrics
+    OpenTelemetryInstrumentation
+
+Functions
+---------
+    get_instrumentation
+    set_instrumentation
+    span
+
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+CALL_SPAN = "plugnplai.call"
+CALL_DURATION = "plugnplai.call.duration"
+CALLS = "plugnplai.calls"
+CALL_ERRORS = "plugnplai.call.errors"
+
+
+class _NoopSpan:
+    """Span of the no-op instrumentation."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """Span timing a block of code, reported to its instrumentation when it ends."""
+    __slots__ = ('instrumentation', 'name', 'attributes', 'start')
+
+    def __init__(self, instrumentation: "Instrumentation", name: str, attributes: Dict[str, Any]):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+
+    def __enter__(self):
+        self.instrumentation.start_span(self.name, self.attributes)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instrumentation.end_span(self.name, self.attributes, time.perf_counter() - self.start, exc)
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+def _call_failed(attributes: Dict[str, Any], error: Optional[BaseException]) -> bool:
+    return error is not None or attributes.get("http.status_code", 0) >= 400
+
+
+class Instrumentation:
+    """Base class of the instrumentations.
+
+    Spans are passed to start_span when they start, then timed and passed
+    to end_span. Subclasses override start_span, end_span, counter and
+    histogram, which do nothing here, and call _record_call in end_span to
+    get the metrics of the plugin calls.
+
+    Methods
+    -------
+    span(name, attributes)
+    start_span(name, attributes)
+    end_span(name, attributes, duration, error)
+    counter(name, value=1, attributes=None)
+    histogram(name, value, attributes=None)
+    """
+
+    def span(self, name: str, attributes: Dict[str, Any]):
+        """Start a span, to use as a context manager.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span, e.g. "plugnplai.spec.parse".
+        attributes : dict
+            The attributes of the span. More can be added with the
+            set_attribute method of the span.
+
+        Returns
+        -------
+        context manager
+            The span.
+        """
+        return _Span(self, name, attributes)
+
+    def start_span(self, name: str, attributes: Dict[str, Any]):
+        """Called when a span starts.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+        attributes : dict
+            The attributes of the span.
+        """
+
+    def end_span(self, name: str, attributes: Dict[str, Any], duration: float, error: Optional[BaseException]):
+        """Called when a span ends.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+        attributes : dict
+            The attributes of the span.
+        duration : float
+            The duration of the span in seconds.
+        error : Exception or None
+            The exception raised in the span, if any.
+        """
+
+    def counter(self, name: str, value: float = 1, attributes: Optional[Dict[str, Any]] = None):
+        """Add a value to a counter."""
+
+    def histogram(self, name: str, value: float, attributes: Optional[Dict[str, Any]] = None):
+        """Record a value in a histogram."""
+
+    def _record_call(self, attributes: Dict[str, Any], duration: float, error: Optional[BaseException]):
+        """Record the metrics of a plugin call from its span."""
+        metric_attributes = {"plugin": attributes.get("plugin"), "operation": attributes.get("operation")}
+        self.histogram(CALL_DURATION, duration, metric_attributes)
+        self.counter(CALLS, 1, metric_attributes)
+        if _call_failed(attributes, error):
+            self.counter(CALL_ERRORS, 1, metric_attributes)
+
+
+class _NoopInstrumentation(Instrumentation):
+    """Default instrumentation, which doesn't even read the clock."""
+
+    def span(self, name, attributes):
+        return _NOOP_SPAN
+
+
+class CallbackInstrumentation(Instrumentation):
+    """Instrumentation calling functions with the spans and metrics.
+
+    Parameters
+    ----------
+    on_span : callable, optional
+        Called with the name, attributes, duration in seconds and error
+        (None if the span succeeded) of each span when it ends.
+    on_counter : callable, optional
+        Called with the name, value and attributes of each counter increment.
+    on_histogram : callable, optional
+        Called with the name, value and attributes of each histogram value.
+    on_span_start : callable, optional
+        Called with the name and attributes of each span when it starts.
+    """
+
+    def __init__(self, on_span: Optional[Callable] = None, on_counter: Optional[Callable] = None,
+                 on_histogram: Optional[Callable] = None, on_span_start: Optional[Callable] = None):
+        self.on_span = on_span
+        self.on_counter = on_counter
+        self.on_histogram = on_histogram
+        self.on_span_start = on_span_start
+
+    def start_span(self, name, attributes):
+        if self.on_span_start is not None:
+            self.on_span_start(name, attributes)
+
+    def end_span(self, name, attributes, duration, error):
+        if self.on_span is not None:
+            self.on_span(name, attributes, duration, error)
+        if name == CALL_SPAN:
+            self._record_call(attributes, duration, error)
+
+    def counter(self, name, value=1, attributes=None):
+        if self.on_counter is not None:
+            self.on_counter(name, value, attributes or {})
+
+    def histogram(self, name, value, attributes=None):
+        if self.on_histogram is not None:
+            self.on_histogram(name, value, attributes or {})
+
+
+def _percentile(sorted_values, q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+class _Series:
+    """Count, errors and the last durations of a stage or a plugin."""
+    __slots__ = ('count', 'errors', 'total', 'durations')
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.durations = deque(maxlen=max_samples)
+
+    def add(self, duration: float, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total += duration
+        self.durations.append(duration)
+
+    def summary(self, errors: bool = True) -> Dict[str, float]:
+        durations = sorted(self.durations)
+        summary = {"count": self.count}
+        if errors:
+            summary["errors"] = self.errors
+            summary["error_rate"] = self.errors / self.count if self.count else 0.0
+        summary.update({
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": _percentile(durations, 50) if durations else 0.0,
+            "p99": _percentile(durations, 99) if durations else 0.0,
+            "max": durations[-1] if durations else 0.0,
+        })
+        return summary
+
+
+class InMemoryMetrics(Instrumentation):
+    """Instrumentation keeping the durations of the stages and plugin calls.
+
+    Parameters
+    ----------
+    max_samples : int, optional
+        Number of the last values kept for the percentiles of each stage,
+        plugin and histogram. Defaults to 10000.
+
+    Attributes
+    ----------
+    counters : dict
+        The value of each counter, keyed by (name, sorted attributes).
+
+    Methods
+    -------
+    stage_stats()
+    plugin_stats()
+    histogram_stats()
+    reset()
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything recorded."""
+        with self._lock:
+            self.counters = {}
+            self._stages = {}
+            self._plugins = {}
+            self._histograms = {}
+
+    def _add(self, series: Dict[Any, _Series], key: Any, duration: float, failed: bool):
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = _Series(self.max_samples)
+        entry.add(duration, failed)
+
+    def end_span(self, name, attributes, duration, error):
+        with self._lock:
+            if name == CALL_SPAN:
+                failed = _call_failed(attributes, error)
+                self._add(self._plugins, attributes.get("plugin"), duration, failed)
+            else:
+                failed = error is not None
+            self._add(self._stages, name, duration, failed)
+        if name == CALL_SPAN:
+            self._record_call(attributes, duration, error)
+
+    def counter(self, name, value=1, attributes=None):
+        key = (name, tuple(sorted((attributes or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name, value, attributes=None):
+        key = (name, tuple(sorted((attributes or {}).items())))
+        with self._lock:
+            self._add(self._histograms, key, value, False)
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get the statistics of each stage.
+
+        Returns
+        -------
+        dict
+            The count, errors, error_rate, and mean, p50, p99 and max
+            durations in seconds of each span, keyed by span name.
+        """
+        with self._lock:
+            return {name: series.summary() for name, series in self._stages.items()}
+
+    def plugin_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get the latency and error rate of the calls of each plugin.
+
+        A call fails if it raises or gets an HTTP status >= 400.
+
+        Returns
+        -------
+        dict
+            The count, errors, error_rate, and mean, p50, p99 and max
+            latencies in seconds of the calls, keyed by plugin name.
+        """
+        with self._lock:
+            return {name: series.summary() for name, series in self._plugins.items()}
+
+    def histogram_stats(self) -> Dict[tuple, Dict[str, float]]:
+        """Get the statistics of each histogram.
+
+        Returns
+        -------
+        dict
+            The count, and mean, p50, p99 and max values of each histogram,
+            keyed by (name, sorted attributes) like the counters, e.g. the
+            call durations of each plugin operation under
+            "plugnplai.call.duration".
+        """
+        with self._lock:
+            return {key: series.summary(errors=False) for key, series in self._histograms.items()}
+
+
+def _otel_attributes(attributes: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """OpenTelemetry attributes can't be None."""
+    return {key: value for key, value in (attributes or {}).items() if value is not None}
+
+
+class _OpenTelemetrySpan:
+    """Span recorded both as an OpenTelemetry span and with the call metrics."""
+    __slots__ = ('instrumentation', 'name', 'attributes', 'start', 'context', 'span')
+
+    def __init__(self, instrumentation: "OpenTelemetryInstrumentation", name: str, attributes: Dict[str, Any]):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self.context = None
+        self.span = None
+
+    def __enter__(self):
+        self.context = self.instrumentation.tracer.start_as_current_span(
+            self.name, attributes=_otel_attributes(self.attributes))
+        self.span = self.context.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        # Records the exception and sets the error status of the span
+        self.context.__exit__(exc_type, exc, tb)
+        if self.name == CALL_SPAN:
+            self.instrumentation._record_call(self.attributes, duration, exc)
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+        if value is not None:
+            self.span.set_attribute(key, value)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """Instrumentation recording the spans and metrics with OpenTelemetry.
+
+    Requires the opentelemetry-api package. The spans are children of the
+    current span, and the metrics are recorded with instruments created on
+    first use.
+
+    Parameters
+    ----------
+    tracer_provider : TracerProvider, optional
+        Defaults to the global tracer provider.
+    meter_provider : MeterProvider, optional
+        Defaults to the global meter provider.
+    """
+
+    def __init__(self, tracer_provider=None, meter_provider=None):
+        try:
+            from opentelemetry import metrics, trace
+        except ImportError:
+            raise ImportError(
+                "Could not import opentelemetry python package. "
+                "This is needed in order to use OpenTelemetryInstrumentation. "
+                "Please install it with `pip install opentelemetry-api`."
+            )
+        self.tracer = trace.get_tracer("plugnplai", tracer_provider=tracer_provider)
+        self.meter = metrics.get_meter("plugnplai", meter_provider=meter_provider)
+        self._counters = {}
+        self._histograms = {}
+
+    def span(self, name, attributes):
+        return _OpenTelemetrySpan(self, name, attributes)
+
+    def counter(self, name, value=1, attributes=None):
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters.setdefault(name, self.meter.create_counter(name))
+        counter.add(value, attributes=_otel_attributes(attributes))
+
+    def histogram(self, name, value, attributes=None):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms.setdefault(name, self.meter.create_histogram(name, unit="s"))
+        histogram.record(value, attributes=_otel_attributes(attributes))
+
+
+_instrumentation = _NoopInstrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    """Get the instrumentation of the library.
+
+    Returns
+    -------
+    Instrumentation
+        The instrumentation set with set_instrumentation, or the no-op default.
+    """
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]):
+    """Set the instrumentation of the library.
+
+    Parameters
+    ----------
+    instrumentation : Instrumentation or None
+        The instrumentation recording the spans and metrics. None restores
+        the no-op instrumentation.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation or _NoopInstrumentation()
+
+
+def span(name: str, **attributes: Any):
+    """Start a span with the instrumentation of the library.
+
+    Parameters
+    ----------
+    name : str
+        The name of the span.
+    **attributes
+        The attributes of the span.
+
+    Returns
+    -------
+    context manager
+        The span, with a set_attribute(key, value) method.
+    """
+    return _instrumentation.span(name, attributes)
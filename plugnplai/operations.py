@@ -0,0 +1,231 @@
+"""
+Compact model of the operations of a plugin.
+
+The OpenAPI spec of a plugin is a deep tree of dicts (with $ref references),
+while plugnplai only uses a few fields of each operation. They are copied
+into small ``__slots__`` objects with interned strings, so the raw spec can
+be released once a plugin is installed.
+
+The objects also support read access with the keys of the dicts they replace
+(``operation['parameters']``, ``parameter.get('required')``...), so code
+written against ``PluginObject.operation_details_dict`` keeps working.
+
+Classes
+-------
+    Parameter
+    BodyProperty
+    MediaType
+    RequestBody
+    Operation
+
+Functions
+---------
+    compile_operations
+
+"""
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+from plugnplai.refs import RefResolver
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Record:
+    """Read-only dict-like access to the slots of the model objects."""
+    __slots__ = ()
+    # Dict key -> attribute name
+    _keys: Dict[str, str] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, self._keys[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        attribute = self._keys.get(key)
+        return default if attribute is None else getattr(self, attribute)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._keys
+
+    def keys(self):
+        return self._keys.keys()
+
+    def __getstate__(self):
+        return tuple(getattr(self, attribute) for attribute in self.__slots__)
+
+    def __setstate__(self, state):
+        # Strings are interned again when the objects are sent between processes
+        for attribute, value in zip(self.__slots__, state):
+            if isinstance(value, tuple):
+                value = tuple(map(_intern, value))
+            object.__setattr__(self, attribute, _intern(value))
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f'{attribute}={getattr(self, attribute)!r}' for attribute in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+class Parameter(_Record):
+    """A path, query, header or cookie parameter of an operation."""
+    __slots__ = ('name', 'location', 'description', 'required', 'type')
+    _keys = {'name': 'name', 'in': 'location', 'description': 'description', 'required': 'required', 'type': 'type'}
+
+    def __init__(self, name: str, location: str, description: Optional[str] = None,
+                 required: bool = False, type: Optional[str] = None):
+        self.name = _intern(name)
+        self.location = _intern(location)
+        self.description = description
+        self.required = required
+        self.type = _intern(type)
+
+
+class BodyProperty(_Record):
+    """A property of the schema of a request body."""
+    __slots__ = ('name', 'type', 'description', 'required')
+    _keys = {'type': 'type', 'description': 'description', 'required': 'required'}
+
+    def __init__(self, name: str, type: Optional[str] = None, description: Optional[str] = None, required: bool = False):
+        self.name = _intern(name)
+        self.type = _intern(type)
+        self.description = description
+        # Non standard "required" flag set on the property itself
+        self.required = required
+
+
+class MediaType(_Record):
+    """The schema of a request body for one media type."""
+    __slots__ = ('media_type', 'schema_type', 'properties', 'required')
+    _keys = {'schema': 'schema'}
+
+    def __init__(self, media_type: str, schema_type: Optional[str] = None,
+                 properties: Tuple[BodyProperty, ...] = (), required: Tuple[str, ...] = ()):
+        self.media_type = _intern(media_type)
+        self.schema_type = _intern(schema_type)
+        self.properties = properties
+        self.required = tuple(_intern(name) for name in required)
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        """The schema rebuilt as a dict with the fields kept by the model."""
+        schema = {'properties': {prop.name: {'type': prop.type, 'description': prop.description}
+                                 for prop in self.properties}}
+        if self.schema_type is not None:
+            schema['type'] = self.schema_type
+        if self.required:
+            schema['required'] = list(self.required)
+        return schema
+
+
+class RequestBody(_Record):
+    """The request body of an operation."""
+    __slots__ = ('description', 'required', 'media_types')
+    _keys = {'description': 'description', 'required': 'required', 'content': 'content'}
+
+    def __init__(self, description: Optional[str] = None, required: bool = False,
+                 media_types: Tuple[MediaType, ...] = ()):
+        self.description = description
+        self.required = required
+        self.media_types = media_types
+
+    @property
+    def content(self) -> Dict[str, Dict[str, Any]]:
+        """The content rebuilt as a dict of media types, as in the OpenAPI spec."""
+        return {media_type.media_type: {'schema': media_type.schema} for media_type in self.media_types}
+
+
+class Operation(_Record):
+    """An operation of a plugin."""
+    __slots__ = ('operation_id', 'method', 'url', 'parameters', 'request_body')
+    _keys = {'method': 'method', 'url': 'url', 'parameters': 'parameters', 'requestBody': 'request_body'}
+
+    def __init__(self, operation_id: str, method: str, url: str, parameters: Tuple[Parameter, ...] = (),
+                 request_body: Optional[RequestBody] = None):
+        self.operation_id = _intern(operation_id)
+        self.method = _intern(method)
+        self.url = url
+        self.parameters = parameters
+        self.request_body = request_body
+
+
+def _identity(node: Any) -> Any:
+    return node
+
+
+# Keys of a path item that are operations, the others (parameters, summary,
+# servers...) apply to the path
+_METHODS = frozenset(('get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace'))
+
+
+def _compile_media_type(media_type: str, media_type_obj: Dict[str, Any], deref=_identity) -> MediaType:
+    schema = deref(media_type_obj.get('schema', {}))
+    properties = tuple(
+        BodyProperty(name, prop.get('type'), prop.get('description'), bool(prop.get('required')))
+        for name, prop in ((name, deref(prop)) for name, prop in deref(schema.get('properties', {})).items())
+    )
+    return MediaType(media_type, schema.get('type'), properties, schema.get('required', []))
+
+
+def compile_operations(paths: Dict[str, Any], base_url: str,
+                       resolver: Optional[RefResolver] = None) -> Dict[str, Operation]:
+    """Compile the operations of the paths of an OpenAPI spec.
+
+    Parameters
+    ----------
+    paths : dict
+        The paths of the OpenAPI spec.
+    base_url : str
+        The base URL of the operations.
+    resolver : RefResolver, optional
+        Resolver of the spec, to follow the $ref references of unresolved
+        paths. Only the nodes read for the operations with an operationId
+        are dereferenced. Defaults to None (the paths are already resolved).
+
+    Returns
+    -------
+    dict
+        The operations keyed by operation ID.
+    """
+    deref = resolver.deref if resolver is not None else _identity
+    operations = {}
+    base_url = base_url.rstrip('/')
+
+    for path, path_item in paths.items():
+        for method, operation in deref(path_item).items():
+            if method.lower() not in _METHODS:
+                continue
+            operation = deref(operation)
+            operation_id = operation.get('operationId')
+            if not operation_id:
+                continue
+
+            parameters = tuple(
+                Parameter(
+                    parameter['name'],
+                    parameter['in'],
+                    parameter.get('description'),
+                    parameter.get('required', False),
+                    deref(parameter['schema']).get('type'),
+                )
+                for parameter in map(deref, operation.get('parameters', []))
+            )
+
+            request_body = None
+            if 'requestBody' in operation:
+                body = deref(operation['requestBody'])
+                request_body = RequestBody(
+                    body.get('description'),
+                    body.get('required', False),
+                    tuple(_compile_media_type(media_type, deref(media_type_obj), deref)
+                          for media_type, media_type_obj in body['content'].items()),
+                )
+
+            operations[_intern(operation_id)] = Operation(
+                operation_id, method, f"{base_url}/{path.lstrip('/')}", parameters, request_body
+            )
+
+    return operations
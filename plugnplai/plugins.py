@@ -1,8 +1,36 @@
+import asyncio
+import re
+import time
 import requests
-from typing import Any, Dict, Optional, List, Callable, Union
-import tiktoken
-from plugnplai.utils import spec_from_url, parse_llm_response
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Optional, List, Callable, NamedTuple, Tuple, Union
+from plugnplai.call_parser import APICallParser
+from plugnplai.instrumentation import span
+from plugnplai.operations import Operation, compile_operations
+from plugnplai.refs import RefResolver
+from plugnplai.resilience import CircuitOpenError
+from plugnplai.utils import spec_from_url, parse_llm_calls, parse_llm_response
+from plugnplai.session import call_request, get_async_client
+from plugnplai.streaming import iter_json_lines, iter_response, read_response, truncation_note
 from plugnplai.prompt_templates import *
+from plugnplai.prompt_templates import PromptBuilder
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = "gpt-4") -> "tiktoken.Encoding":
+    """
+    Get the tiktoken encoding of a model, loading it once per process.
+
+    Parameters:
+    model_name (str): The name of the GPT model. Defaults to "gpt-4".
+
+    Returns:
+    tiktoken.Encoding: The encoding used by the model.
+    """
+    # tiktoken is slow to import, so it is only loaded when tokens are counted
+    import tiktoken
+    return tiktoken.encoding_for_model(model_name)
 
 
 def count_tokens(text: str, model_name: str = "gpt-4") -> int:
@@ -16,11 +44,66 @@ def count_tokens(text: str, model_name: str = "gpt-4") -> int:
     Returns:
     int: The number of tokens in the text.
     """
-    encoding = tiktoken.encoding_for_model(model_name)
-    num_tokens = len(encoding.encode(text))
+    with span("plugnplai.count_tokens"):
+        encoding = get_encoding(model_name)
+        num_tokens = len(encoding.encode(text))
     return num_tokens
 
 
+@lru_cache(maxsize=None)
+def _template_tokens(template: str) -> int:
+    """Count the tokens of a prompt template, without the {{plugins}} placeholder."""
+    return sum(count_tokens(part) for part in template.split('{{plugins}}'))
+
+
+@lru_cache(maxsize=None)
+def _plugin_header_tokens(position: int) -> int:
+    """Count the tokens wrapping the description of the plugin at a position of the prompt."""
+    return count_tokens(f'### Plugin {position}\n') + count_tokens('\n\n')
+
+
+def _knapsack(weights: List[int], values: List[float], capacity: int) -> List[int]:
+    """Solve the 0/1 knapsack problem.
+
+    Only the Pareto front of (weight, value) states is kept, so the cost
+    depends on the number of distinct reachable weights instead of the
+    whole capacity.
+
+    Parameters
+    ----------
+    weights : list of int
+        The weight of each item.
+    values : list of float
+        The value of each item.
+    capacity : int
+        The maximum total weight.
+
+    Returns
+    -------
+    list of int
+        The indices of the chosen items, in increasing order.
+    """
+    # States are (weight, value, chosen) sorted by weight with increasing
+    # values, chosen being a linked list (index, rest) of the chosen items
+    states = [(0, 0.0, None)]
+    for index, (weight, value) in enumerate(zip(weights, values)):
+        if weight > capacity:
+            continue
+        candidates = states + [(w + weight, v + value, (index, chosen))
+                               for w, v, chosen in states if w + weight <= capacity]
+        candidates.sort(key=lambda state: (state[0], -state[1]))
+        states = []
+        for state in candidates:
+            if not states or state[1] > states[-1][1]:
+                states.append(state)
+
+    chosen, indices = states[-1][2], []
+    while chosen is not None:
+        index, chosen = chosen
+        indices.append(index)
+    return indices[::-1]
+
+
 def build_request_body(schema: Dict[str, Any], parameters: Dict[str, Any]) -> Any:
     
     """Build the request body for an API call.
@@ -55,6 +138,124 @@ def build_request_body(schema: Dict[str, Any], parameters: Dict[str, Any]) -> An
     return None
 
 
+_PATH_PARAMETER = re.compile(r'(\{[^}]*\})')
+
+
+class _CallPlan(NamedTuple):
+    """Precomputed routing of an operation's parameters into an HTTP request.
+
+    Built once per operation by compile(), so calling an operation only binds
+    the given values instead of walking the operation details every time.
+    """
+    method: str
+    # Literal URL pieces at even positions and path parameter names at odd positions
+    url_parts: Tuple[str, ...]
+    query_names: Tuple[str, ...]
+    header_names: Tuple[str, ...]
+    cookie_names: Tuple[str, ...]
+    required_body: Tuple[str, ...]
+    bearer_auth: bool
+    sends_json: bool
+
+    @classmethod
+    def compile(cls, operation: Operation, bearer_auth: bool) -> '_CallPlan':
+        """Compile the call plan of an operation.
+
+        Parameters
+        ----------
+        operation : Operation
+            The operation, as built by PluginObject.get_operation_details.
+        bearer_auth : bool
+            Whether the plugin authenticates with a bearer token.
+
+        Returns
+        -------
+        _CallPlan
+            The compiled call plan.
+        """
+        names = {'path': [], 'query': [], 'header': [], 'cookie': []}
+        for parameter in operation.parameters:
+            if parameter.location in names:
+                names[parameter.location].append(parameter.name)
+
+        # Split the URL around the declared path parameters, other braces are kept as is
+        url_parts = ['']
+        for piece in _PATH_PARAMETER.split(operation.url):
+            if piece.startswith('{') and piece[1:-1] in names['path']:
+                url_parts.extend([piece[1:-1], ''])
+            else:
+                url_parts[-1] += piece
+
+        required_body = ()
+        if operation.request_body:
+            for media_type in operation.request_body.media_types:
+                if media_type.media_type == 'application/json':
+                    if media_type.schema_type == 'object':
+                        required_body = tuple(prop.name for prop in media_type.properties
+                                              if prop.name in media_type.required)
+                    break
+
+        method = operation.method.upper()
+        return cls(
+            method=method,
+            url_parts=tuple(url_parts),
+            query_names=tuple(names['query']),
+            header_names=tuple(names['header']),
+            cookie_names=tuple(names['cookie']),
+            required_body=required_body,
+            bearer_auth=bearer_auth,
+            sends_json=method != 'GET',
+        )
+
+    def bind(self, parameters: Dict[str, Any], api_key: str = None) -> Dict[str, Any]:
+        """Bind parameter values to the plan.
+
+        Parameters
+        ----------
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
+
+        Returns
+        -------
+        dict
+            The method, url, params, headers, cookies and json body of the request.
+        """
+        get = parameters.get
+
+        url_parts = self.url_parts
+        if len(url_parts) == 1:
+            url = url_parts[0]
+        else:
+            pieces = list(url_parts)
+            for i in range(1, len(pieces), 2):
+                pieces[i] = str(get(pieces[i]))
+            url = ''.join(pieces)
+
+        for name in self.required_body:
+            if name not in parameters:
+                print(f'Required parameter {name} is missing')
+                break
+
+        # Parameters not given by the caller are left out of the request
+        headers = {name: get(name) for name in self.header_names if get(name) is not None}
+        if self.bearer_auth:
+            headers['Authorization'] = f"Bearer {api_key}"
+            headers['Accept'] = 'application/json'
+        if self.sends_json:
+            headers['Content-Type'] = 'application/json'
+
+        return {
+            'method': self.method,
+            'url': url,
+            'params': {name: get(name) for name in self.query_names if get(name) is not None},
+            'headers': headers,
+            'cookies': {name: get(name) for name in self.cookie_names if get(name) is not None},
+            'json': parameters if self.sends_json else None,
+        }
+
+
 class PluginObject():
     """Represents an AI plugin object.
 
@@ -68,6 +269,8 @@ class PluginObject():
         The paths object from the OpenAPI spec.
     servers : list
         The servers list from the OpenAPI spec.
+    resolver : RefResolver
+        Resolver of the $ref references of the spec.
     manifest : dict
         The plugin manifest.
     url : str
@@ -77,98 +280,139 @@ class PluginObject():
     description_for_model : str
         The plugin description.
     operation_details_dict : dict
-        A dictionary containing details for each operation in the plugin.
+        A dictionary containing the Operation of each operation in the plugin.
     description_prompt : str
         A prompt describing the plugin operations.
     tokens : int
-        The number of tokens in the description_prompt.
+        The number of tokens in the description_prompt, counted on first use.
 
     Methods
     -------
-    __init__(self, url: str, spec: Dict[str, Any], manifest: Dict[str, Any])
+    __init__(self, url: str, spec: Dict[str, Any], manifest: Dict[str, Any], keep_spec: bool = True)
         Initialize the PluginObject.
     get_operation_details(self)
         Get the details for each operation in the plugin.
+    drop_spec(self)
+        Release the raw OpenAPI spec.
     call_operation(self, operation_id: str, parameters: Dict[str, Any])
         Call an operation in the plugin.
     describe_api(self)
         Generate a prompt describing the plugin operations.
     """
     
-    def __init__(self, url: str, spec: Dict[str, Any], manifest: Dict[str, Any]):
+    def __init__(self, url: str, spec: Dict[str, Any], manifest: Dict[str, Any], keep_spec: bool = True):
         """
         Initialize the PluginObject.
 
         Parameters:
         url (str): The plugin URL.
-        spec (dict): The OpenAPI specification.
+        spec (dict): The OpenAPI specification. Its $ref references may be
+            unresolved, they are resolved when the operations are compiled.
         manifest (dict): The plugin manifest.
+        keep_spec (bool): Keep the info, paths and servers of the spec after
+            compiling the operations. Defaults to True.
         """
-        self.openapi = spec.get('openapi')
-        self.info = spec.get('info')
-        self.paths = spec.get('paths')
-        self.servers = spec.get('servers')
-        self.manifest = manifest
-        self.url = url
-        self.name_for_model = manifest.get('name_for_model', None)
-        self.description_for_model = manifest.get('description_for_model', None)
-        self.operation_details_dict = self.get_operation_details()
-        self.description_prompt = self.describe_api()
-        # Count the tokens in the description
-        self.tokens = count_tokens(self.description_prompt)
-
-
-    def get_operation_details(self) -> Dict[str, Any]:
+        with span("plugnplai.plugin.init", plugin=manifest.get('name_for_model')):
+            self.openapi = spec.get('openapi')
+            self.info = spec.get('info')
+            self.paths = spec.get('paths')
+            self.servers = spec.get('servers')
+            # Resolves the references of the paths, which may point anywhere in the spec
+            self.resolver = RefResolver(spec)
+            self.manifest = manifest
+            self.url = url
+            self.name_for_model = manifest.get('name_for_model', None)
+            self.description_for_model = manifest.get('description_for_model', None)
+            self.operation_details_dict = self.get_operation_details()
+            # Call plans are compiled from operation_details_dict on first call
+            self._call_plans = {}
+            self.description_prompt = self.describe_api()
+            # The tokens in the description are counted on first use
+            self._tokens = None
+            if not keep_spec:
+                self.drop_spec()
+
+    @property
+    def tokens(self) -> int:
+        """The number of tokens in the description_prompt."""
+        if self._tokens is None:
+            self._tokens = count_tokens(self.description_prompt)
+        return self._tokens
+
+    def get_operation_details(self) -> Dict[str, Operation]:
         """
         Get the details for each operation in the plugin.
 
         Returns:
-        dict: A dictionary containing details for each operation.
+        dict: A dictionary containing the Operation of each operation ID.
         """
-        operation_details_dict = {}
-
         # Use url as a fallback if servers is not provided
         base_url = self.servers[0]['url'] if self.servers else self.url
+        # The $ref references used by the operations are resolved here
+        with span("plugnplai.refs.resolve", plugin=self.name_for_model):
+            return compile_operations(self.paths, base_url, self.resolver)
 
-        # Iterate over all paths
-        for path, path_item in self.paths.items():
-            # Iterate over all methods for each path
-            for method, operation in path_item.items():
-                current_operation_id = operation.get('operationId')
-                if current_operation_id:
-                    # Build the URL
-                    url_op = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
-
-                    # Store operation details
-                    operation_details = {
-                        'method': method,
-                        'url': url_op,
-                        'parameters': [],
-                        'requestBody': None,
-                    }
-
-                    # Store parameter details
-                    for parameter in operation.get('parameters', []):
-                        operation_details['parameters'].append({
-                            'name': parameter['name'],
-                            'in': parameter['in'],
-                            'description': parameter.get('description'),
-                            'required': parameter.get('required', False),
-                            'type': parameter['schema'].get('type'),
-                        })
-                    
-                    if 'requestBody' in operation:
-                        operation_details['requestBody'] = {
-                            'description': operation['requestBody'].get('description'),
-                            'required': operation['requestBody'].get('required', False),
-                            'content': operation['requestBody']['content'],
-                        }
+    def drop_spec(self):
+        """Release the raw OpenAPI spec.
+
+        Everything needed to describe and call the operations is kept in
+        operation_details_dict, so the info, paths and servers of the spec
+        are only useful to inspect it.
+        """
+        self.info = None
+        self.paths = None
+        self.servers = None
+        self.resolver = None
+
+    def _call_plan(self, operation_id: str) -> Optional['_CallPlan']:
+        """Get the compiled call plan of an operation, compiling it on first use.
+
+        Parameters
+        ----------
+        operation_id : str
+            The ID of the operation.
+
+        Returns
+        -------
+        _CallPlan or None
+            The call plan, or None if the operation is not found.
+        """
+        plan = self._call_plans.get(operation_id)
+        if plan is None:
+            operation = self.operation_details_dict.get(operation_id)
+            if not operation:
+                return None
+            auth_type = self.manifest.get("auth", {}).get("type", "").lower()
+            plan = _CallPlan.compile(operation, auth_type in ("service_http", "user_http", "oauth"))
+            self._call_plans[operation_id] = plan
+        return plan
 
-                    operation_details_dict[current_operation_id] = operation_details
+    def _prepare_request(self, operation_id: str, parameters: Dict[str, Any], api_key: str = None) -> Optional[Dict[str, Any]]:
+        """Build the arguments of the HTTP request calling an operation.
 
-        return operation_details_dict
+        Parameters
+        ----------
+        operation_id : str
+            The ID of the operation to call.
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
 
-    def call_operation(self, operation_id: str, parameters: Dict[str, Any], api_key: str = None):
+        Returns
+        -------
+        dict or None
+            The method, url, params, headers, cookies and json body of the
+            request, or None if the operation is not found.
+        """
+        plan = self._call_plan(operation_id)
+        if plan is None:
+            print(f'Operation {operation_id} not found')
+            return None
+        return plan.bind(parameters, api_key)
+
+    def call_operation(self, operation_id: str, parameters: Dict[str, Any], api_key: str = None, stream: bool = False,
+                       timeout: Optional[float] = None, cache=None, guard=None):
         """Call an operation in the plugin.
         
         Parameters
@@ -179,57 +423,117 @@ class PluginObject():
             The parameters to pass to the operation.
         api_key : str, optional
             The api key for authentication.
+        stream : bool, optional
+            Return as soon as the headers are received and read the body
+            on demand (see plugnplai.streaming). Defaults to False.
+        timeout : float, optional
+            Deadline in seconds for the whole call, up to the end of the
+            body (of the headers when streaming). Defaults to None (no
+            timeout).
+        cache : ResponseCache, optional
+            Serve the response from this cache when possible (see
+            plugnplai.response_cache). Defaults to None (no cache).
+        guard : CallGuard, optional
+            Apply the timeouts, rate limits and circuit breaker of this guard
+            to the call (see plugnplai.resilience). Raises CircuitOpenError
+            if the plugin is unavailable. Defaults to None.
             
         Returns
         -------
         requests.Response or None
             The response from the API call, or None if unsuccessful.
         """
-        # Get the operation details from the operation_details_dict attribute
-        operation_details = self.operation_details_dict.get(operation_id)
-        if not operation_details:
-            print(f'Operation {operation_id} not found')
+        request = self._prepare_request(operation_id, parameters, api_key)
+        if request is None:
             return None
 
-        # Separate parameters by type
-        path_parameters = {}
-        query_parameters = {}
-        header_parameters = {}
-        cookie_parameters = {}
-        body = None
-
-        for parameter in operation_details['parameters']:
-            if parameter['in'] == 'path':
-                path_parameters[parameter['name']] = parameters.get(parameter['name'])
-            elif parameter['in'] == 'query':
-                query_parameters[parameter['name']] = parameters.get(parameter['name'])
-            elif parameter['in'] == 'header':
-                header_parameters[parameter['name']] = parameters.get(parameter['name'])
-            elif parameter['in'] == 'cookie':
-                cookie_parameters[parameter['name']] = parameters.get(parameter['name'])
-
-        if operation_details['requestBody']:
-            body_schema = operation_details['requestBody']['content']['application/json']['schema']
-            body = build_request_body(body_schema, parameters)
-
-        # Replace path parameters in the URL
-        url = operation_details['url']
-        for name, value in path_parameters.items():
-            url = url.replace('{' + name + '}', str(value))
-
-        if self.manifest.get("auth", {}).get("type", "").lower() in ("service_http", "user_http", "oauth"):
-            header_parameters["Authorization"] = f"Bearer {api_key}"
-            header_parameters["Accept"] = "application/json"
-
         # Make the API call
-        method = operation_details['method']
-        if method.lower() == 'get':
-            response = requests.get(url, params=query_parameters, headers=header_parameters, cookies=cookie_parameters)
-        elif method.lower() == 'post':
-            header_parameters['Content-Type'] = 'application/json'
-            response = requests.post(url, params=query_parameters, headers=header_parameters, cookies=cookie_parameters,
-                                    json=parameters)
+        if guard is None:
+            def send(request):
+                return call_request(request, timeout=timeout, stream=stream)
+        else:
+            call_timeout = guard.timeout_for(self.name_for_model, operation_id, timeout)
+
+            def send(request):
+                return guard.call(self.name_for_model, request['url'],
+                                  lambda: call_request(request, timeout=call_timeout, stream=stream))
+
+        with span("plugnplai.call", plugin=self.name_for_model, operation=operation_id) as call_span:
+            if cache is None:
+                response = send(request)
+            else:
+                response = cache.fetch(self.name_for_model, operation_id, parameters, api_key, request, send,
+                                       stream=stream)
+            call_span.set_attribute("http.status_code", response.status_code)
+        return response
+
+    async def acall_operation(self, operation_id: str, parameters: Dict[str, Any], api_key: str = None, client=None,
+                              stream: bool = False, cache=None, guard=None, timeout: Optional[float] = None):
+        """Call an operation in the plugin without blocking the event loop.
+
+        Requires the httpx package.
+
+        Parameters
+        ----------
+        operation_id : str
+            The ID of the operation to call.
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
+        client : httpx.AsyncClient, optional
+            The client to use. Defaults to the shared client of the running event loop.
+        stream : bool, optional
+            Return as soon as the headers are received and read the body
+            on demand (see plugnplai.streaming). Defaults to False.
+        cache : ResponseCache, optional
+            Serve the response from this cache when possible (see
+            plugnplai.response_cache). Defaults to None (no cache).
+        guard : CallGuard, optional
+            Apply the timeouts, rate limits and circuit breaker of this guard
+            to the call (see plugnplai.resilience). Raises CircuitOpenError
+            if the plugin is unavailable. Defaults to None.
+        timeout : float, optional
+            Deadline in seconds for the whole call, up to the end of the
+            body (of the headers when streaming). Defaults to the timeout of
+            the guard, or of the client.
+
+        Returns
+        -------
+        httpx.Response or None
+            The response from the API call, or None if unsuccessful.
+        """
+        request = self._prepare_request(operation_id, parameters, api_key)
+        if request is None:
+            return None
 
+        # httpx deprecated per-request cookies, send them as a header instead
+        cookies = request.pop('cookies')
+        if cookies:
+            request['headers']['Cookie'] = '; '.join(f'{k}={v}' for k, v in cookies.items())
+
+        client = client or get_async_client()
+        if guard is not None:
+            timeout = guard.timeout_for(self.name_for_model, operation_id, timeout)
+        if timeout is not None:
+            request['timeout'] = timeout
+
+        def send_within(request):
+            # The timeout of httpx applies to each read, bound the whole call
+            return asyncio.wait_for(client.send(client.build_request(**request), stream=stream), timeout)
+
+        async def send(request):
+            if guard is None:
+                return await send_within(request)
+            return await guard.acall(self.name_for_model, request['url'], lambda: send_within(request))
+
+        with span("plugnplai.call", plugin=self.name_for_model, operation=operation_id) as call_span:
+            if cache is None:
+                response = await send(request)
+            else:
+                response = await cache.afetch(self.name_for_model, operation_id, parameters, api_key, request, send,
+                                              stream=stream)
+            call_span.set_attribute("http.status_code", response.status_code)
         return response
 
 
@@ -261,23 +565,23 @@ class PluginObject():
         operations = ''
 
         # Iterate over all operation details in operation_details_dict
-        for operation_id, operation_details in self.operation_details_dict.items():
-            description = operation_details.get('description', '')
+        for operation_id, operation in self.operation_details_dict.items():
+            description = operation.get('description', '')
 
             # Build the parameter list
             parameter_list = []
-            for parameter in operation_details.get('parameters', []):
+            for parameter in operation.parameters:
                 # Add a "*" suffix to the name of required parameters
-                name = "'" + parameter['name'] + "'" + "*" if parameter.get('required') else "'" + parameter['name'] + "'"
-                type_ = type_shorteners.get(parameter.get('type'), 'any')
+                name = "'" + parameter.name + "'" + "*" if parameter.required else "'" + parameter.name + "'"
+                type_ = type_shorteners.get(parameter.type, 'any')
                 parameter_list.append(f"{name}: '{type_}'")
 
             # Handle requestBody
-            if operation_details.get('requestBody'):
-                for media_type, media_type_obj in operation_details['requestBody'].get('content', {}).items():
-                    for name, schema in media_type_obj.get('schema', {}).get('properties', {}).items():
-                        name = "'" + name + "'" + "*" if operation_details['requestBody'].get('required') else "'" + name + "'"
-                        type_ = type_shorteners.get(schema.get('type'), 'any')
+            if operation.request_body:
+                for media_type in operation.request_body.media_types:
+                    for prop in media_type.properties:
+                        name = "'" + prop.name + "'" + "*" if operation.request_body.required else "'" + prop.name + "'"
+                        type_ = type_shorteners.get(prop.type, 'any')
                         parameter_list.append(f"{name}: '{type_}'")
 
             parameters = ', '.join(parameter_list)
@@ -307,6 +611,34 @@ Assistant called a plugin in response to this human message:
 """
 
 
+def format_api_return(user_message: str, calls: List[Tuple[Dict[str, Any], Optional[str]]]) -> Optional[str]:
+    """Fill api_return_template with the results of API calls.
+
+    Parameters
+    ----------
+    user_message : str
+        The message of the user.
+    calls : list
+        The (api_info, api_response) pair of each API call, as returned by
+        Plugins.call_apis. Unsuccessful calls (api_response None) are left out.
+
+    Returns
+    -------
+    str or None
+        The message for the LLM, or None if no call was successful.
+    """
+    calls = [(api_info, api_response) for api_info, api_response in calls if api_response is not None]
+    if not calls:
+        return None
+    if len(calls) == 1:
+        api_info, api_response = calls[0]
+    else:
+        api_info = [api_info for api_info, _ in calls]
+        api_response = '\n\n'.join(f"{info['plugin_name']}.{info['operation_id']}:\n{response}"
+                                    for info, response in calls)
+    return api_return_template.format(user_message=user_message, api_info=api_info, api_response=api_response)
+
+
 class Plugins:
     """Manages installed and active plugins.
     
@@ -324,9 +656,30 @@ class Plugins:
         The number of tokens in the prompt.
     max_plugins : int
         The maximum number of plugins that can be active at once.
+    install_errors : dict
+        Errors raised while installing plugins concurrently, keyed by URL.
+    max_response_bytes : int
+        Maximum number of bytes of an API response read by parse_and_call
+        and apply_plugins. Defaults to None (the whole response).
+    summarize_response : callable
+        Hook called with the text read from an API response and whether it
+        was truncated, returning the text given to the LLM. Defaults to
+        None (truncation_note when max_response_bytes is set).
+    call_timeout : float
+        Seconds an API call made for the LLM has to finish (call_apis,
+        apply_plugins, call_from_stream). Defaults to None (no timeout).
+    response_cache : ResponseCache
+        Cache of the responses of the API calls (see
+        plugnplai.response_cache). Defaults to None (no cache).
+    call_guard : CallGuard
+        Timeouts, per-host rate limits and per-plugin circuit breakers of
+        the API calls (see plugnplai.resilience). Plugins whose breaker is
+        open are left out of the prompts. Defaults to None (no timeout,
+        rate limit or breaker).
     """
     
-    def __init__(self, urls: Union[str, List[str], List[PluginObject]], template: str = None):
+    def __init__(self, urls: Union[str, List[str], List[PluginObject]], template: str = None,
+                 max_workers: Optional[int] = None, timeout: Optional[float] = None, processes: Optional[int] = None):
         """Initialize the Plugins class.
         
         Parameters
@@ -335,6 +688,14 @@ class Plugins:
             A list of plugin URLs.
         template : str, optional
             The prompt template to use. Defaults to template_gpt4.
+        max_workers : int, optional
+            Number of plugins to install concurrently. If None (and no timeout
+            is given), plugins are installed one after another.
+        timeout : float, optional
+            Deadline in seconds for installing the whole batch of plugins.
+        processes : int, optional
+            Parse and compile the specs in this many worker processes (see
+            install_plugins). Defaults to None (no worker processes).
         """
         if isinstance(urls, str):
             urls = [urls]
@@ -346,11 +707,20 @@ class Plugins:
         self.tokens = None
         self.functions = None
         self.max_plugins = 3
+        self.install_errors = {}
+        self.max_response_bytes = None
+        self.summarize_response = None
+        self.call_timeout = None
+        self.response_cache = None
+        self.call_guard = None
+        self._prompt_builders = {}
 
-        self.install_plugins(urls)
+        self.install_plugins(urls, max_workers=max_workers, timeout=timeout, processes=processes)
 
     @classmethod
-    def install_and_activate(cls, urls: Union[str, List[str]], template: Optional[str] = None):
+    def install_and_activate(cls, urls: Union[str, List[str]], template: Optional[str] = None,
+                             max_workers: Optional[int] = None, timeout: Optional[float] = None,
+                             processes: Optional[int] = None):
         """Install plugins from URLs and activate them.
         
         Parameters
@@ -359,6 +729,12 @@ class Plugins:
             A single URL or list of URLs.
         template : str, optional
             The prompt template to use. Defaults to template_gpt4.
+        max_workers : int, optional
+            Number of plugins to install concurrently.
+        timeout : float, optional
+            Deadline in seconds for installing the whole batch of plugins.
+        processes : int, optional
+            Number of worker processes parsing and compiling the specs.
             
         Returns
         -------
@@ -368,7 +744,7 @@ class Plugins:
         if isinstance(urls, str):
             urls = [urls]
         template = template or template_gpt4    
-        instance = cls(urls, template)
+        instance = cls(urls, template, max_workers=max_workers, timeout=timeout, processes=processes)
         for plugin_name in instance.installed_plugins.keys():
             instance.activate(plugin_name)
         return instance
@@ -393,27 +769,139 @@ class Plugins:
         """
         return list(self.active_plugins.keys())
 
-    def install_plugins(self, urls: Union[str, List[str], List[PluginObject]]):
+    def install_plugins(self, urls: Union[str, List[str], List[PluginObject]], max_workers: Optional[int] = None,
+                        timeout: Optional[float] = None,
+                        processes: Optional[int] = None) -> Optional[Dict[str, Optional[Exception]]]:
         """Install plugins from URLs.
         
         Parameters
         ----------
         urls : str or list
             A single URL or list of URLs.
+        max_workers : int, optional
+            Number of plugins to install concurrently. If None (and no timeout
+            is given), plugins are installed one after another and the first
+            error is raised.
+        timeout : float, optional
+            Deadline in seconds for installing the whole batch. Plugins that
+            finish in time are installed, the others are reported as timed out
+            and their downloads stopped.
+        processes : int, optional
+            Download on max_workers threads (16 by default) and parse, resolve
+            and compile the specs in this many worker processes (0 for one per
+            core), which scales with the number of cores for large catalogs. The plugins are
+            installed without their raw spec (see PluginObject.drop_spec).
+
+        Returns
+        -------
+        dict or None
+            When installing concurrently, a dictionary keyed by URL with None for
+            installed plugins or the exception raised for failed ones.
         """
         if isinstance(urls, str):
             urls = [urls]
 
         # if input is a list of PluginObjects, add them directly
-        if isinstance(urls[0], PluginObject):
+        if urls and isinstance(urls[0], PluginObject):
             for plugin in urls:
                 self.installed_plugins[plugin.name_for_model] = plugin
             return
 
-        for url in urls:
-            manifest, openapi_spec = spec_from_url(url)
-            openapi_object = PluginObject(url, openapi_spec, manifest)
-            self.installed_plugins[openapi_object.name_for_model] = openapi_object
+        if processes is not None:
+            return self._install_bulk(urls, max_workers=max_workers or 16, timeout=timeout, processes=processes)
+
+        if max_workers is None and timeout is None:
+            for url in urls:
+                self._install_one(url)
+            return
+
+        return self._install_concurrent(urls, max_workers=max_workers or 8, timeout=timeout)
+
+    def _install_one(self, url: str) -> PluginObject:
+        """Fetch and install a single plugin from its URL."""
+        openapi_object = self._load_plugin(url)
+        self.installed_plugins[openapi_object.name_for_model] = openapi_object
+        return openapi_object
+
+    @staticmethod
+    def _load_plugin(url: str, deadline: Optional[float] = None) -> PluginObject:
+        """Fetch the manifest and OpenAPI spec of a plugin and build its PluginObject.
+
+        The downloads stop at the deadline, a time.monotonic() value, if given.
+        """
+        # The references are resolved lazily, for the operations only
+        manifest, openapi_spec = spec_from_url(url, resolve_refs=False, deadline=deadline)
+        return PluginObject(url, openapi_spec, manifest)
+
+    def _install_concurrent(self, urls: List[str], max_workers: int = 8,
+                            timeout: Optional[float] = None) -> Dict[str, Optional[Exception]]:
+        """Install plugins using a bounded thread pool.
+
+        Parameters
+        ----------
+        urls : list
+            A list of plugin URLs.
+        max_workers : int, optional
+            Maximum number of plugins fetched at the same time. Defaults to 8.
+        timeout : float, optional
+            Deadline in seconds for the whole batch.
+
+        Returns
+        -------
+        dict
+            A dictionary keyed by URL with None for installed plugins or the
+            exception raised for failed ones.
+        """
+        results = {}
+        # The downloads stop at the deadline too, so no thread is left running
+        deadline = None if timeout is None else time.monotonic() + timeout
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {url: executor.submit(self._load_plugin, url, deadline) for url in urls}
+            wait(futures.values(), timeout=timeout)
+
+            # Install in the order the URLs were given, so the result does not
+            # depend on which plugin answered first
+            for url, future in futures.items():
+                if not future.done():
+                    future.cancel()
+                    results[url] = TimeoutError(f'Installing {url} did not finish within {timeout} seconds')
+                elif future.exception() is not None:
+                    results[url] = future.exception()
+                else:
+                    plugin = future.result()
+                    self.installed_plugins[plugin.name_for_model] = plugin
+                    results[url] = None
+        finally:
+            # Do not block on plugins that missed the deadline
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        self.install_errors.update({url: error for url, error in results.items() if error is not None})
+        return results
+
+    def _install_bulk(self, urls: List[str], max_workers: int = 16, timeout: Optional[float] = None,
+                      processes: Optional[int] = None) -> Dict[str, Optional[Exception]]:
+        """Install plugins with the bulk pipeline of plugnplai.bulk.
+
+        Returns
+        -------
+        dict
+            A dictionary keyed by URL with None for installed plugins or the
+            exception raised for failed ones.
+        """
+        from plugnplai.bulk import load_plugins
+
+        results = {}
+        for url, plugin in load_plugins(urls, max_workers=max_workers, processes=processes or None,
+                                        timeout=timeout).items():
+            if isinstance(plugin, Exception):
+                results[url] = plugin
+            else:
+                self.installed_plugins[plugin.name_for_model] = plugin
+                results[url] = None
+
+        self.install_errors.update({url: error for url, error in results.items() if error is not None})
+        return results
 
     def activate(self, plugin_name: str):
         """Activate an installed plugin.
@@ -434,7 +922,7 @@ class Plugins:
 
         self.active_plugins[plugin_name] = plugin
         self.prompt = self.fill_prompt(self.template)
-        self.tokens = count_tokens(self.prompt)
+        self.tokens = self.count_prompt_tokens()
         self.functions = self.build_functions()
 
     def deactivate(self, plugin_name: str):
@@ -448,9 +936,74 @@ class Plugins:
         if plugin_name in self.active_plugins:
             del self.active_plugins[plugin_name]
             self.prompt = self.fill_prompt(self.template)
-            self.tokens = count_tokens(self.prompt)
+            self.tokens = self.count_prompt_tokens()
             self.functions = self.build_functions()
 
+    def _select_plugins(self, plugin_names: Optional[List[str]], plugins: Dict[str, PluginObject]) -> List[PluginObject]:
+        """Get the PluginObjects of the given names, or all of them if names is None."""
+        if plugin_names is None:
+            return list(plugins.values())
+        return [plugins[name] for name in plugin_names if name in plugins]
+
+    def available_plugins(self, plugin_names: Optional[List[str]] = None) -> List[str]:
+        """Leave out the plugins whose circuit breaker is open.
+
+        Parameters
+        ----------
+        plugin_names : list, optional
+            The names of the plugins to check. If None, uses all installed plugins.
+
+        Returns
+        -------
+        list
+            The names of the plugins that can be called, in order.
+        """
+        if plugin_names is None:
+            plugin_names = list(self.installed_plugins)
+        if self.call_guard is None:
+            return list(plugin_names)
+        return [name for name in plugin_names if self.call_guard.is_available(name)]
+
+    def _llm_prompt(self) -> str:
+        """The prompt of the active plugins, without the ones that are unavailable."""
+        available = self.available_plugins(list(self.active_plugins))
+        if len(available) == len(self.active_plugins):
+            return self.prompt
+        return self.fill_prompt(self.template, available)
+
+    def _prompt_builder(self, template: str) -> PromptBuilder:
+        """Get the cached PromptBuilder of a template."""
+        builder = self._prompt_builders.get(template)
+        if builder is None:
+            builder = self._prompt_builders[template] = PromptBuilder(template)
+        return builder
+
+    @staticmethod
+    def _count_tokens_for(template: str, plugins: List[PluginObject]) -> int:
+        tokens = _template_tokens(template)
+        for i, plugin in enumerate(plugins, start=1):
+            tokens += _plugin_header_tokens(i) + plugin.tokens
+        return tokens
+
+    def count_prompt_tokens(self, active_plugins: Optional[List[str]] = None) -> int:
+        """Count the tokens of the prompt without encoding it again.
+
+        The count is the sum of the template tokens and the cached token count
+        of each plugin description, so it can differ by a few tokens from
+        encoding the whole prompt at once.
+
+        Parameters
+        ----------
+        active_plugins : list, optional
+            A list of plugin names to include in the count. If None, uses all active plugins.
+
+        Returns
+        -------
+        int
+            The number of tokens in the prompt.
+        """
+        return self._count_tokens_for(self.template, self._select_plugins(active_plugins, self.active_plugins))
+
     def fill_prompt(self, template: str, active_plugins: Optional[List[str]] = None) -> str:
         """Generate a prompt with descriptions of active plugins.
         
@@ -466,23 +1019,122 @@ class Plugins:
         str
             The generated prompt.
         """
-        plugins_descriptions = ''
+        plugins = self._select_plugins(active_plugins, self.active_plugins)
+        with span("plugnplai.prompt.fill", plugins=len(plugins)):
+            return self._prompt_builder(template).build(plugin.description_prompt for plugin in plugins)
 
-        if active_plugins is not None:
-            active_plugins = {name: self.active_plugins[name] for name in active_plugins if name in self.active_plugins}
-        else:
-            active_plugins = self.active_plugins
+    def prompt_for(self, plugin_names: List[str], template: Optional[str] = None) -> str:
+        """Generate a prompt for any subset of installed plugins.
+
+        Unlike activate, this doesn't change the active plugins, so a different
+        subset can be used on every request.
+
+        Parameters
+        ----------
+        plugin_names : list
+            The names of the installed plugins to include in the prompt.
+        template : str, optional
+            The prompt template to use. Defaults to self.template.
 
-        for i, openapi_object in enumerate(active_plugins.values(), start=1):
-            api_description = openapi_object.describe_api()
-            plugins_descriptions += f'### Plugin {i}\n{api_description}\n\n'
+        Returns
+        -------
+        str
+            The generated prompt.
+        """
+        plugins = self._select_plugins(plugin_names, self.installed_plugins)
+        with span("plugnplai.prompt.fill", plugins=len(plugins)):
+            return self._prompt_builder(template or self.template).build(plugin.description_prompt for plugin in plugins)
+
+    def tokens_for(self, plugin_names: List[str], template: Optional[str] = None) -> int:
+        """Count the tokens of the prompt for a subset of installed plugins.
+
+        Parameters
+        ----------
+        plugin_names : list
+            The names of the installed plugins to include in the prompt.
+        template : str, optional
+            The prompt template to use. Defaults to self.template.
+
+        Returns
+        -------
+        int
+            The number of tokens in the prompt, as computed by count_prompt_tokens.
+        """
+        return self._count_tokens_for(template or self.template,
+                                      self._select_plugins(plugin_names, self.installed_plugins))
+
+    def select_within_budget(self, scores: Union[Dict[str, float], List[Tuple[str, float]], List[str]],
+                             token_budget: int, template: Optional[str] = None,
+                             activate: bool = False) -> Tuple[str, int, List[str]]:
+        """Select the most relevant installed plugins whose prompt fits in a token budget.
+
+        The plugins are chosen by solving a knapsack problem on their cached
+        token counts, maximizing the sum of their relevance scores. The
+        prompt is then encoded once to get its exact token count, and the
+        least relevant plugins are dropped while it exceeds the budget.
+
+        Parameters
+        ----------
+        scores : dict or list
+            The relevance of the plugins: a dictionary of scores keyed by
+            plugin name, a list of (name, score) tuples as returned by
+            PluginRetriever.retrieve_names_batch, or a list of names ranked
+            by relevance as returned by retrieve. Plugins that are not
+            installed, are unavailable (see available_plugins) or have a
+            score <= 0 are ignored.
+        token_budget : int
+            The maximum number of tokens of the prompt.
+        template : str, optional
+            The prompt template to use. Defaults to self.template.
+        activate : bool, optional
+            Make the selected plugins the active ones, ignoring max_plugins.
+            Defaults to False.
 
-        prompt = template.replace('{{plugins}}', plugins_descriptions)
+        Returns
+        -------
+        tuple
+            The prompt, its exact number of tokens and the names of the
+            selected plugins, most relevant first.
+        """
+        template = template or self.template
+        if isinstance(scores, dict):
+            scores = list(scores.items())
+        elif scores and isinstance(scores[0], str):
+            # Ranked names: the first one is the most relevant
+            scores = [(name, float(len(scores) - rank)) for rank, name in enumerate(scores)]
+
+        candidates = {}
+        available = set(self.available_plugins())
+        for name, score in scores:
+            if name in available and score > 0:
+                candidates[name] = max(score, candidates.get(name, 0))
+        names = sorted(candidates, key=candidates.get, reverse=True)
+
+        # Headers are numbered by position, so weigh each plugin with the longest header
+        header_tokens = max((_plugin_header_tokens(i) for i in range(1, len(names) + 1)), default=0)
+        weights = [self.installed_plugins[name].tokens + header_tokens for name in names]
+        capacity = token_budget - _template_tokens(template)
+        selected = [names[i] for i in _knapsack(weights, [candidates[name] for name in names], capacity)] \
+            if capacity > 0 else []
+
+        prompt = self.prompt_for(selected, template)
+        tokens = count_tokens(prompt)
+        # Joining the pieces can merge tokens, so the sum of the counts is not exact
+        while tokens > token_budget and selected:
+            selected.pop()
+            prompt = self.prompt_for(selected, template)
+            tokens = count_tokens(prompt)
+
+        if activate:
+            self.active_plugins = {name: self.installed_plugins[name] for name in selected}
+            self.prompt = prompt
+            self.tokens = tokens
+            self.functions = self.build_functions()
 
-        return prompt
+        return prompt, tokens, selected
 
-    def call_api(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: str = None) -> Optional[
-        requests.Response]:
+    def call_api(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: str = None,
+                 stream: bool = False, timeout: Optional[float] = None) -> Optional[requests.Response]:
         """Call an operation in an active plugin.
         
         Parameters
@@ -495,11 +1147,17 @@ class Plugins:
             The parameters to pass to the operation.
         api_key : str, optional
             The api key for authentication.
+        stream : bool, optional
+            Read the body of the response on demand. Defaults to False.
+        timeout : float, optional
+            Deadline in seconds for the whole call. Defaults to the timeout
+            of call_guard, if there is one, else no deadline.
             
         Returns
         -------
         requests.Response or None
-            The response from the API call, or None if unsuccessful.
+            The response from the API call, or None if unsuccessful (e.g.
+            timed out) or if the plugin is unavailable after repeated errors.
         """
         # Get the PluginObject for the specified plugin
         openapi_object = self.active_plugins.get(plugin_name)
@@ -516,10 +1174,75 @@ class Plugins:
             return None
 
         # Call the operation
-        response = openapi_object.call_operation(operation_id, parameters, api_key)
+        try:
+            response = openapi_object.call_operation(operation_id, parameters, api_key, stream=stream,
+                                                     timeout=timeout, cache=self.response_cache,
+                                                     guard=self.call_guard)
+        except CircuitOpenError as e:
+            print(e)
+            return None
+        except requests.RequestException as e:
+            # Timeouts and connection errors, already counted by the breaker
+            print(f'Call to {plugin_name}.{operation_id} failed: {e!r}')
+            return None
 
         return response
 
+    def stream_api(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: str = None,
+                   json_lines: bool = False, chunk_size: int = 8192, max_bytes: Optional[int] = None) -> Iterator[Any]:
+        """Call an operation in an active plugin and iterate over its response.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        operation_id : str
+            The ID of the operation to call.
+        parameters : dict
+            The parameters to pass to the operation.
+        api_key : str, optional
+            The api key for authentication.
+        json_lines : bool, optional
+            Yield the parsed objects of a JSON-lines response instead of raw
+            chunks. Defaults to False.
+        chunk_size : int, optional
+            Size of the chunks read from the connection. Defaults to 8192.
+        max_bytes : int, optional
+            Maximum number of bytes to read. Defaults to max_response_bytes.
+
+        Yields
+        ------
+        bytes or Any
+            The chunks of the response, or the objects of its lines.
+        """
+        response = self.call_api(plugin_name, operation_id, parameters, api_key, stream=True)
+        if response is None:
+            return
+
+        if max_bytes is None:
+            max_bytes = self.max_response_bytes
+        iterate = iter_json_lines if json_lines else iter_response
+        yield from iterate(response, chunk_size=chunk_size, max_bytes=max_bytes)
+
+    def _response_text(self, response: requests.Response) -> str:
+        """Read the text of an API response for the LLM, within max_response_bytes."""
+        if self.max_response_bytes is None and self.summarize_response is None:
+            return response.text
+        text, truncated = read_response(response, self.max_response_bytes)
+        summarize = self.summarize_response or truncation_note
+        return summarize(text, truncated)
+
+    def _call_for_llm(self, api_info: Dict[str, Any], timeout: Optional[float] = None) -> Optional[str]:
+        """Call the API of a parsed API call and read its response for the LLM."""
+        plugin_name = api_info['plugin_name']
+        print(f"Using {plugin_name}")
+
+        api_response = self.call_api(plugin_name, api_info['operation_id'], api_info['parameters'],
+                                     stream=self.max_response_bytes is not None, timeout=timeout)
+        if api_response is None:
+            return None
+        return self._response_text(api_response)
+
     def parse_and_call(self, llm_response: str) -> Optional[str]:
         """Parse an LLM response for API calls and call the specified plugins.
         
@@ -538,18 +1261,108 @@ class Plugins:
 
         if api_info:
             # Step 2: Call the API using self.call_api
-            plugin_name = api_info['plugin_name']
-            operation_id = api_info['operation_id']
-            parameters = api_info['parameters']
+            return self._call_for_llm(api_info)
 
-            print(f"Using {plugin_name}")
+        return None
 
-            api_response = self.call_api(plugin_name, operation_id, parameters)
+    def _call_for_llm_safe(self, api_info: Dict[str, Any], timeout: Optional[float] = None) -> Optional[str]:
+        """_call_for_llm, printing the errors instead of raising them, so one call can't fail the others."""
+        try:
+            return self._call_for_llm(api_info, timeout)
+        except Exception as e:
+            print(f"Error calling {api_info['plugin_name']}.{api_info['operation_id']}: {e}")
+            return None
 
-            if api_response is not None:
-                return api_response.text
+    def call_apis(self, calls: List[Dict[str, Any]], timeout: Optional[float] = None,
+                  max_workers: Optional[int] = None) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+        """Make several API calls concurrently.
 
-        return None
+        The calls are made on a thread pool, so a turn with several calls
+        takes as long as the slowest one instead of the sum of all of them.
+
+        Parameters
+        ----------
+        calls : list
+            The API calls, as returned by parse_llm_calls.
+        timeout : float, optional
+            Seconds each call has to finish, counted from the start of the
+            dispatch. Calls still running then are reported as unsuccessful.
+            Defaults to call_timeout.
+        max_workers : int, optional
+            Maximum number of calls in flight. Defaults to the number of calls.
+
+        Returns
+        -------
+        list
+            The (api_info, api_response) pair of each call, in the order of
+            the calls, with api_response None if the call was unsuccessful.
+            Ready for format_api_return.
+        """
+        if not calls:
+            return []
+        if timeout is None:
+            timeout = self.call_timeout
+
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(calls))
+        try:
+            futures = [executor.submit(self._call_for_llm_safe, api_info, timeout) for api_info in calls]
+            wait(futures, timeout=timeout)
+            results = []
+            for api_info, future in zip(calls, futures):
+                if future.done():
+                    results.append((api_info, future.result()))
+                else:
+                    print(f"{api_info['plugin_name']}.{api_info['operation_id']} did not finish within {timeout} seconds")
+                    results.append((api_info, None))
+            return results
+        finally:
+            # Don't wait for the calls that timed out
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def call_from_stream(self, chunks: Iterable[str], stop_after_call: bool = True,
+                         max_workers: int = 4) -> Tuple[str, List[Tuple[Dict[str, Any], Optional[str]]]]:
+        """Read a streamed LLM response and call each API as soon as its <API> block is complete.
+
+        The calls run on a thread pool, so they overlap with the rest of the
+        generation.
+
+        Parameters
+        ----------
+        chunks : iterable of str
+            The text chunks of the LLM response, as they are generated.
+        stop_after_call : bool, optional
+            Stop reading (and close) the stream once a chunk completes an API
+            call, as the prompt asks the LLM to wait for the API response.
+            Defaults to True. With False, every API call of the response is made.
+        max_workers : int, optional
+            Maximum number of API calls in flight. Defaults to 4.
+
+        Returns
+        -------
+        tuple
+            The text read from the stream, and the (api_info, api_response)
+            pair of each API call in order, with api_response None if the
+            call was unsuccessful.
+        """
+        parser = APICallParser()
+        calls = []
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        iterator = iter(chunks)
+        try:
+            try:
+                for chunk in iterator:
+                    for api_info in parser.feed(chunk):
+                        calls.append((api_info, executor.submit(self._call_for_llm_safe, api_info, self.call_timeout)))
+                    if calls and stop_after_call:
+                        break
+            finally:
+                # Stops the generation when the stream is a generator
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+            return parser.text, [(api_info, future.result()) for api_info, future in calls]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def apply_plugins(self, llm_function: Callable[..., str]) -> Callable[..., str]:
         """Decorate an LLM function to apply active plugins.
@@ -565,35 +1378,22 @@ class Plugins:
             The decorated LLM function.
         """
         def decorator(user_message: str, *args: Any, **kwargs: Any) -> str:
-            # Step 1: Add self.prompt as a prefix of the user's message
-            message_with_prompt = f"{self.prompt}\n{user_message}"
+            # Step 1: Add the prompt as a prefix of the user's message
+            message_with_prompt = f"{self._llm_prompt()}\n{user_message}"
 
             # Step 2: Call the passed LLM function with the updated message and additional arguments
             llm_response = llm_function(message_with_prompt, *args, **kwargs)
 
             # Step 3: Check if the response contains '<API>'
             if '<API>' in llm_response:
-                # Step 4: Parse the LLM response to get API information
-                api_info = parse_llm_response(llm_response)
-
-                if api_info:
-                    # Step 5: Call the API using self.call_api
-                    plugin_name = api_info['plugin_name']
-                    operation_id = api_info['operation_id']
-                    parameters = api_info['parameters']
-
-                    print(f"Using {plugin_name}")
-
-                    api_response = self.call_api(plugin_name, operation_id, parameters)
+                # Step 4: Parse the LLM response to get the information of every API call
+                calls = parse_llm_calls(llm_response)
 
-                if api_response is not None:
-                    # Step 6: Build a new call to the passed LLM function with API response summary
-                    llm_summary = api_return_template.format(
-                        user_message=user_message,
-                        api_info=api_info,
-                        api_response=api_response
-                    )
+                # Step 5: Make the API calls concurrently
+                # Step 6: Build a new call to the passed LLM function with API response summary
+                llm_summary = format_api_return(user_message, self.call_apis(calls))
 
+                if llm_summary is not None:
                     # Step 7: Return the updated response
                     return llm_function(llm_summary, *args, **kwargs)
 
@@ -602,6 +1402,40 @@ class Plugins:
 
         return decorator
 
+    def apply_plugins_stream(self, llm_function: Callable[..., Iterable[str]],
+                             stop_after_call: bool = True) -> Callable[..., str]:
+        """Decorate a streaming LLM function to apply active plugins.
+
+        Like apply_plugins, but the LLM function returns the text chunks of
+        its response as they are generated. The API is called as soon as the
+        <API> block is complete and the rest of the generation is skipped
+        (see call_from_stream).
+
+        Parameters
+        ----------
+        llm_function : callable
+            The LLM function to decorate, returning an iterable of str.
+        stop_after_call : bool, optional
+            Stop the generation after the first API call. Defaults to True.
+
+        Returns
+        -------
+        callable
+            The decorated LLM function, returning the final response as a str.
+        """
+        def decorator(user_message: str, *args: Any, **kwargs: Any) -> str:
+            message_with_prompt = f"{self._llm_prompt()}\n{user_message}"
+            llm_response, calls = self.call_from_stream(llm_function(message_with_prompt, *args, **kwargs),
+                                                        stop_after_call=stop_after_call)
+
+            llm_summary = format_api_return(user_message, calls)
+            if llm_summary is None:
+                # Return the original LLM response if no API calls were made
+                return llm_response
+            return ''.join(llm_function(llm_summary, *args, **kwargs))
+
+        return decorator
+
     def build_functions(self) -> List[Dict[str, Any]]:
         '''Generate a list of JSON objects describing the active plugins.
 
@@ -618,31 +1452,30 @@ class Plugins:
                     'description': plugin.description_for_model,
                 }
                 
-                if operation['parameters'] != []:
+                if operation.parameters:
                     function['parameters'] = {"type": "object", "properties": {}, "required": []}
-                    for parameter in operation['parameters']:
-                        name = parameter.get('name')
-                        function['parameters']["properties"][name] = {
-                            'type': parameter.get('type'),
-                            'description': parameter.get('description'),
+                    for parameter in operation.parameters:
+                        function['parameters']["properties"][parameter.name] = {
+                            'type': parameter.type,
+                            'description': parameter.description,
                         }
-                        if parameter.get('required'):
-                            function['parameters']["required"].append(name)
+                        if parameter.required:
+                            function['parameters']["required"].append(parameter.name)
                 else:
-                    if operation['requestBody'] != None:
+                    if operation.request_body is not None:
                         function['parameters'] = {}
                         function['parameters']["type"] = "object"
                         function['parameters']["properties"] = {}
                         function['parameters']["required"] = []
 
-                        for media_type, media_type_obj in operation['requestBody'].get('content', {}).items():
-                            for name, schema in media_type_obj.get('schema', {}).get('properties', {}).items():
-                                function['parameters']['properties'][name] = {
-                                    'type': schema.get('type'),
-                                    'description': schema.get('description'),
+                        for media_type in operation.request_body.media_types:
+                            for prop in media_type.properties:
+                                function['parameters']['properties'][prop.name] = {
+                                    'type': prop.type,
+                                    'description': prop.description,
                                 }
-                                if schema.get('required'):
-                                    function['parameters']['required'].append(name)
+                                if prop.required:
+                                    function['parameters']['required'].append(prop.name)
                                 
                 functions_list.append(function)
         return functions_list
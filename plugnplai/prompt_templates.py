@@ -1,4 +1,8 @@
 from datetime import datetime
+from functools import lru_cache
+
+__all__ = ["today_date", "template_gpt4", "PromptBuilder"]
+
 today_date = datetime.today().date()
 
 # Template to be filled with the plugins description, 
@@ -28,4 +32,52 @@ After requesting the API, refrain from writing anything else and wait for the AP
 
 {{plugins}}
 # USER MESSAGE
-'''.replace('DATE_TODAY', str(today_date))
\ No newline at end of file
+'''.replace('DATE_TODAY', str(today_date))
+
+@lru_cache(maxsize=None)
+def _plugin_header(position: int) -> str:
+    # Cached since the same positions are rendered on every build, lru_cache
+    # is safe to share between the threads building prompts
+    return f'### Plugin {position}\n'
+
+
+class PromptBuilder:
+    """Builds prompts from a template and pre-rendered plugin descriptions.
+
+    The template is split once around the {{plugins}} placeholder, so a prompt
+    for any subset of plugins is produced by joining cached pieces instead of
+    rendering and replacing the whole template again.
+
+    Parameters
+    ----------
+    template : str
+        The prompt template, with a {{plugins}} placeholder.
+
+    Methods
+    -------
+    build(descriptions)
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self._parts = template.split('{{plugins}}')
+
+    def build(self, descriptions) -> str:
+        """Build the prompt for a list of plugin descriptions.
+
+        Parameters
+        ----------
+        descriptions : iterable of str
+            The descriptions of the plugins to include, in order.
+
+        Returns
+        -------
+        str
+            The generated prompt.
+        """
+        pieces = []
+        for i, description in enumerate(descriptions, start=1):
+            pieces.append(_plugin_header(i))
+            pieces.append(description)
+            pieces.append('\n\n')
+        return ''.join(pieces).join(self._parts)
@@ -0,0 +1,150 @@
+"""
+Lazy resolution of the $ref references of an OpenAPI spec.
+
+jsonref.JsonRef.replace_refs wraps every reference of a spec in a proxy up
+front, and every access to the resolved tree then goes through the proxies.
+RefResolver instead leaves the spec as parsed and follows a reference only
+when the node is read: deref follows the reference of one node, resolve
+builds a plain copy of a subtree with its references resolved. Resolved
+targets are memoized by JSON pointer, so a schema shared by many operations
+is resolved once, and recursive schemas become cyclic dicts instead of
+recursing forever.
+
+Only local references (``#/components/...``) are resolved. Other references
+are left as they are.
+
+Classes
+-------
+    RefResolver
+
+"""
+from typing import Any, Dict, List, Union
+from urllib.parse import unquote
+
+
+def _is_local_ref(node: Any) -> bool:
+    if not isinstance(node, dict):
+        return False
+    ref = node.get('$ref')
+    return isinstance(ref, str) and ref.startswith('#')
+
+
+def _pointer_tokens(ref: str) -> List[str]:
+    """Split the JSON pointer of a local reference (RFC 6901) in its tokens."""
+    pointer = unquote(ref[1:])
+    if not pointer:
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f"Unsupported $ref {ref}: only JSON pointers are supported")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+class RefResolver:
+    """Resolve the local $ref references of a document on demand.
+
+    Parameters
+    ----------
+    document : dict
+        The parsed OpenAPI spec, with its references unresolved.
+
+    Methods
+    -------
+    deref(node)
+    resolve(node)
+    """
+
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+        # JSON pointer -> node it points to, as in the document
+        self._targets = {}
+        # JSON pointer -> resolved copy of the target
+        self._resolved = {}
+        # id of a node being copied -> its copy
+        self._copying = {}
+
+    def _target(self, ref: str) -> Any:
+        target = self._targets.get(ref)
+        if target is None and ref not in self._targets:
+            target = self.document
+            for token in _pointer_tokens(ref):
+                try:
+                    target = target[int(token)] if isinstance(target, list) else target[token]
+                except (KeyError, IndexError, TypeError, ValueError):
+                    raise ValueError(f"Unresolvable $ref {ref}") from None
+            self._targets[ref] = target
+        return target
+
+    def deref(self, node: Any) -> Any:
+        """Follow the reference of a node, if it is one.
+
+        Chains of references are followed to the first node that isn't a
+        reference. The nodes below it are not resolved.
+
+        Parameters
+        ----------
+        node : Any
+            A node of the document.
+
+        Returns
+        -------
+        Any
+            The node the reference points to, or the node itself.
+        """
+        seen = []
+        while _is_local_ref(node):
+            ref = node['$ref']
+            if ref in seen:
+                raise ValueError(f"Circular $ref {' -> '.join(seen + [ref])}")
+            seen.append(ref)
+            node = self._target(ref)
+        return node
+
+    def resolve(self, node: Any) -> Any:
+        """Copy a node with all the references below it resolved.
+
+        Parameters
+        ----------
+        node : Any
+            A node of the document.
+
+        Returns
+        -------
+        Any
+            The resolved copy. Targets of references are shared between
+            the copies, and a recursive schema contains itself.
+        """
+        if _is_local_ref(node):
+            return self._resolve_ref(node['$ref'])
+        if not isinstance(node, (dict, list)):
+            return node
+        # A node already being copied higher in the tree is part of a cycle
+        # (e.g. in a spec already resolved by jsonref)
+        copy = self._copying.get(id(node))
+        if copy is None:
+            copy = self._copy(node, {} if isinstance(node, dict) else [])
+        return copy
+
+    def _copy(self, node: Union[Dict[str, Any], List[Any]], copy: Union[Dict[str, Any], List[Any]]):
+        """Fill an empty copy of a node with its resolved children."""
+        self._copying[id(node)] = copy
+        try:
+            if isinstance(node, dict):
+                copy.update((key, self.resolve(value)) for key, value in node.items())
+            else:
+                copy.extend(self.resolve(item) for item in node)
+        finally:
+            del self._copying[id(node)]
+        return copy
+
+    def _resolve_ref(self, ref: str) -> Any:
+        if ref in self._resolved:
+            return self._resolved[ref]
+
+        target = self.deref({'$ref': ref})
+        if isinstance(target, (dict, list)):
+            # Memoized before the children are resolved, so a reference back
+            # to this target in the children gets the same (cyclic) copy
+            resolved = self._resolved[ref] = {} if isinstance(target, dict) else []
+            return self._copy(target, resolved)
+        self._resolved[ref] = target
+        return target
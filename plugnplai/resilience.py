@@ -0,0 +1,368 @@
+"""
+Failure isolation for plugin API calls.
+
+A plugin that hangs or fails must not hold the threads and the event loop
+that serve the other plugins. CallGuard wraps each call with:
+
+- a timeout, with a default and per-operation overrides
+- a token bucket per plugin host, limiting the rate of the calls to it
+- a circuit breaker per plugin: after repeated errors the calls fail fast
+  with CircuitOpenError, until a probe call succeeds after a recovery time
+
+The state of the breakers is exposed, and Plugins leaves the plugins whose
+breaker is open out of the prompt.
+
+Classes
+-------
+    TokenBucket
+    CircuitBreaker
+    CallGuard
+    CircuitOpenError
+
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a plugin whose circuit breaker is open."""
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Parameters
+    ----------
+    rate : float
+        Number of calls per second allowed on average.
+    burst : int, optional
+        Number of calls allowed at once. Defaults to max(1, rate).
+
+    Methods
+    -------
+    reserve()
+    acquire()
+    aacquire()
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, possibly in advance.
+
+        Returns
+        -------
+        float
+            Seconds to wait before the token is available (0 if it is).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # The calls waiting for a token are served in order
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        """Wait for a token."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        """Wait for a token without blocking the event loop."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """Circuit breaker, failing fast after repeated errors.
+
+    The breaker is closed at first. It opens after failure_threshold
+    consecutive failures, and the calls are then refused. After
+    recovery_time seconds it is half-open: up to half_open_calls probe calls
+    are let through, and the breaker closes if they succeed or opens again
+    if one fails.
+
+    Parameters
+    ----------
+    failure_threshold : int, optional
+        Consecutive failures opening the breaker. Defaults to 5.
+    recovery_time : float, optional
+        Seconds before an open breaker lets a probe through. Defaults to 30.
+    half_open_calls : int, optional
+        Number of concurrent probe calls when half-open. Defaults to 1.
+
+    Attributes
+    ----------
+    state : str
+        "closed", "open" or "half_open".
+
+    Methods
+    -------
+    allow()
+    record_success()
+    record_failure()
+    release()
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30, half_open_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.half_open_calls = half_open_calls
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_time:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Check if a call may be made, and count it as a probe when half-open.
+
+        Returns
+        -------
+        bool
+            False if the call must be refused.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self):
+        """Record a successful call, closing the breaker."""
+        with self._lock:
+            self.failures = 0
+            self._state = CLOSED
+            self._probes = 0
+
+    def record_failure(self):
+        """Record a failed call, opening the breaker if needed."""
+        with self._lock:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+
+    def release(self):
+        """Forget a call that neither succeeded nor failed (e.g. cancelled)."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes:
+                self._probes -= 1
+
+
+class CallGuard:
+    """Timeouts, rate limits and circuit breakers for the calls of plugins.
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Deadline in seconds of the calls, from connecting to the end of the
+        response. Defaults to 30. None disables it.
+    operation_timeouts : dict, optional
+        Timeouts overriding the default, keyed by
+        ``"plugin_name.operation_id"`` or by operation ID. Defaults to None.
+    rate : float, optional
+        Maximum number of calls per second to each plugin host. Defaults to
+        None (no limit).
+    burst : int, optional
+        Number of calls to a host allowed at once. Defaults to max(1, rate).
+    host_rates : dict, optional
+        Rates overriding the default, keyed by host (e.g.
+        ``"api.example.com"``). Defaults to None.
+    failure_threshold : int, optional
+        Consecutive failures of a plugin opening its breaker. Defaults to 5.
+    recovery_time : float, optional
+        Seconds before the breaker of a plugin lets a probe call through.
+        Defaults to 30.
+    failure_statuses : tuple, optional
+        HTTP statuses counted as failures, besides the exceptions (timeouts,
+        connection errors). Defaults to (429, 500, 502, 503, 504).
+
+    Methods
+    -------
+    timeout_for(plugin_name, operation_id, timeout=None)
+    limiter(host)
+    breaker(plugin_name)
+    is_available(plugin_name)
+    breaker_states()
+    call(plugin_name, url, send)
+    acall(plugin_name, url, send)
+    """
+
+    def __init__(self, timeout: Optional[float] = 30, operation_timeouts: Optional[Dict[str, float]] = None,
+                 rate: Optional[float] = None, burst: Optional[int] = None,
+                 host_rates: Optional[Dict[str, float]] = None, failure_threshold: int = 5,
+                 recovery_time: float = 30, failure_statuses: tuple = (429, 500, 502, 503, 504)):
+        self.timeout = timeout
+        self.operation_timeouts = operation_timeouts or {}
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = host_rates or {}
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failure_statuses = frozenset(failure_statuses)
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def timeout_for(self, plugin_name: str, operation_id: str, timeout: Optional[float] = None) -> Optional[float]:
+        """Get the timeout of a call.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        operation_id : str
+            The ID of the operation.
+        timeout : float, optional
+            Timeout given for this call, used if not None.
+
+        Returns
+        -------
+        float or None
+            The timeout in seconds.
+        """
+        if timeout is not None:
+            return timeout
+        timeout = self.operation_timeouts.get(f"{plugin_name}.{operation_id}")
+        if timeout is None:
+            timeout = self.operation_timeouts.get(operation_id, self.timeout)
+        return timeout
+
+    def limiter(self, host: str) -> Optional[TokenBucket]:
+        """Get the rate limiter of a host, or None if its calls are not limited."""
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            rate = self.host_rates.get(host, self.rate)
+            if not rate:
+                return None
+            with self._lock:
+                limiter = self._limiters.setdefault(host, TokenBucket(rate, self.burst))
+        return limiter
+
+    def breaker(self, plugin_name: str) -> CircuitBreaker:
+        """Get the circuit breaker of a plugin."""
+        breaker = self._breakers.get(plugin_name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    plugin_name, CircuitBreaker(self.failure_threshold, self.recovery_time))
+        return breaker
+
+    def is_available(self, plugin_name: str) -> bool:
+        """Check if a plugin can be called, i.e. its breaker is not open."""
+        breaker = self._breakers.get(plugin_name)
+        return breaker is None or breaker.state != OPEN
+
+    def breaker_states(self) -> Dict[str, str]:
+        """Get the state of the breakers of the plugins called so far.
+
+        Returns
+        -------
+        dict
+            "closed", "open" or "half_open", keyed by plugin name.
+        """
+        return {name: breaker.state for name, breaker in list(self._breakers.items())}
+
+    def _admit(self, plugin_name: str) -> CircuitBreaker:
+        breaker = self.breaker(plugin_name)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Plugin {plugin_name} is unavailable after repeated errors")
+        return breaker
+
+    def _record(self, breaker: CircuitBreaker, response):
+        if response.status_code in self.failure_statuses:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def call(self, plugin_name: str, url: str, send: Callable[[], Any]):
+        """Make a call through the breaker of the plugin and the limiter of the host.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        url : str
+            The URL called.
+        send : callable
+            Function making the call and returning the response.
+
+        Returns
+        -------
+        requests.Response
+            The response of send.
+
+        Raises
+        ------
+        CircuitOpenError
+            If the breaker of the plugin is open.
+        """
+        breaker = self._admit(plugin_name)
+        try:
+            limiter = self.limiter(urlsplit(url).netloc)
+            if limiter is not None:
+                limiter.acquire()
+            response = send()
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        self._record(breaker, response)
+        return response
+
+    async def acall(self, plugin_name: str, url: str, send: Callable[[], Awaitable[Any]]):
+        """Async version of call.
+
+        Returns
+        -------
+        httpx.Response
+            The response of send.
+        """
+        breaker = self._admit(plugin_name)
+        try:
+            limiter = self.limiter(urlsplit(url).netloc)
+            if limiter is not None:
+                await limiter.aacquire()
+            response = await send()
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. by the timeout of acall_apis
+            breaker.release()
+            raise
+        self._record(breaker, response)
+        return response
@@ -0,0 +1,486 @@
+"""
+Cache for the responses of idempotent plugin operations.
+
+Identical calls (same plugin, operation, parameters and API key) made
+within the freshness lifetime of a response are served from memory instead
+of the network. The lifetime comes from the Cache-Control (s-maxage,
+max-age, no-cache, no-store), Expires and Age headers of the response, can
+be overridden per operation, and defaults to a short TTL for the many
+plugin APIs that send no caching headers. Stale responses with an ETag or
+a Last-Modified date are revalidated with a conditional request.
+
+Entries live in a bounded in-memory LRU and, optionally, in a SQLite
+database shared by the processes of a deployment. Concurrent identical
+calls are coalesced: only the first one goes to the network and the others
+get a copy of its response.
+
+The cache is opt-in: set ``Plugins.response_cache`` or pass ``cache`` to
+``PluginObject.call_operation``.
+
+Classes
+-------
+    ResponseCache
+
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+
+# Headers describing the transfer of the original body, not the cached one
+_TRANSFER_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding', 'connection')
+
+
+class _Entry(NamedTuple):
+    """A cached response."""
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+    url: str
+    encoding: Optional[str]
+    stored_at: float
+    expires_at: float
+
+    @property
+    def etag(self) -> Optional[str]:
+        return _header(self.headers, 'ETag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return _header(self.headers, 'Last-Modified')
+
+
+class _Flight:
+    """A request in progress, waited for by the identical concurrent requests."""
+
+    def __init__(self, event):
+        self.event = event
+        # The entry to serve to the followers, None if they must send their own request
+        self.entry = None
+
+
+def _header(headers, name: str) -> Optional[str]:
+    """Case insensitive lookup of a header in a plain dict."""
+    for key, value in headers.items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def _cache_control(headers) -> Dict[str, Optional[str]]:
+    """Parse the Cache-Control header into a dict of directives."""
+    directives = {}
+    for directive in (headers.get('Cache-Control') or '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class ResponseCache:
+    """Cache for the responses of idempotent plugin operations.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        Freshness lifetime in seconds of the responses without caching
+        headers. Defaults to 60.
+    operation_ttls : dict, optional
+        Freshness lifetimes overriding the headers, keyed by
+        ``"plugin_name.operation_id"`` or by operation ID. A TTL of 0
+        disables caching for the operation. Defaults to None.
+    max_entries : int, optional
+        Maximum number of responses kept in memory. Defaults to 1024.
+    max_bytes : int, optional
+        Maximum size of the response bodies kept in memory. Defaults to 64 MB.
+    max_entry_bytes : int, optional
+        Responses with a larger body are not cached. Defaults to 1 MB.
+    sqlite_path : str, optional
+        Path of a SQLite database used as a second tier, shared between
+        processes. Defaults to None (memory only).
+    sqlite_max_entries : int, optional
+        Maximum number of responses in the SQLite database. Defaults to 100000.
+    methods : tuple, optional
+        HTTP methods whose responses are cached. Defaults to ("get", "head").
+
+    Attributes
+    ----------
+    stats : dict
+        Number of hits, misses, revalidated and coalesced calls.
+
+    Methods
+    -------
+    key(plugin_name, operation_id, parameters, api_key=None)
+    fetch(plugin_name, operation_id, parameters, api_key, request, send, stream=False)
+    afetch(plugin_name, operation_id, parameters, api_key, request, send, stream=False)
+    clear()
+    """
+
+    def __init__(self, ttl: float = 60, operation_ttls: Optional[Dict[str, float]] = None, max_entries: int = 1024,
+                 max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 1024 * 1024,
+                 sqlite_path: Optional[str] = None, sqlite_max_entries: int = 100000,
+                 methods: tuple = ("get", "head")):
+        self.ttl = ttl
+        self.operation_ttls = operation_ttls or {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.sqlite_path = sqlite_path
+        self.sqlite_max_entries = sqlite_max_entries
+        self.methods = tuple(method.lower() for method in methods)
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._flights = {}
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, status_code INTEGER, headers TEXT,"
+                " body BLOB, url TEXT, encoding TEXT, stored_at REAL, expires_at REAL, used_at REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+            self._db_lock = threading.Lock()
+
+    @staticmethod
+    def key(plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: Optional[str] = None) -> str:
+        """Build the cache key of a call.
+
+        The parameters are normalized (sorted keys, compact JSON) so the same
+        call written differently hits the same entry, and only a hash of the
+        API key is kept.
+
+        Returns
+        -------
+        str
+            The SHA-256 of the call.
+        """
+        normalized = json.dumps(parameters, sort_keys=True, separators=(',', ':'), default=str)
+        api_key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest() if api_key else ''
+        call = '\0'.join((plugin_name or '', operation_id, normalized, api_key_hash))
+        return hashlib.sha256(call.encode('utf-8')).hexdigest()
+
+    def _operation_ttl(self, plugin_name: str, operation_id: str) -> Optional[float]:
+        ttl = self.operation_ttls.get(f"{plugin_name}.{operation_id}")
+        return self.operation_ttls.get(operation_id) if ttl is None else ttl
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    # Freshness
+
+    def _lifetime(self, headers, ttl: Optional[float]) -> float:
+        """Seconds a response stays fresh, from its headers or the TTL override."""
+        if ttl is not None:
+            return ttl
+        directives = _cache_control(headers)
+        if 'no-cache' in directives:
+            return 0
+        age = _number(headers.get('Age')) or 0
+        for directive in ('s-maxage', 'max-age'):
+            max_age = _number(directives.get(directive))
+            if max_age is not None:
+                return max(0.0, max_age - age)
+        expires = _http_date(headers.get('Expires'))
+        if expires is not None:
+            date = _http_date(headers.get('Date')) or time.time()
+            return max(0.0, expires - date - age)
+        return max(0.0, self.ttl - age)
+
+    def _entry(self, response, headers, body: bytes, ttl: Optional[float]) -> Optional[_Entry]:
+        """Build the entry of a response, or None if it can't be cached."""
+        if response.status_code != 200 or 'no-store' in _cache_control(headers):
+            return None
+        if len(body) > self.max_entry_bytes:
+            return None
+        lifetime = self._lifetime(headers, ttl)
+        kept_headers = {name: value for name, value in headers.items() if name.lower() not in _TRANSFER_HEADERS}
+        now = time.time()
+        entry = _Entry(response.status_code, kept_headers, body, str(response.url),
+                       getattr(response, 'encoding', None), now, now + lifetime)
+        if lifetime <= 0 and not (entry.etag or entry.last_modified):
+            # Can neither be served nor revalidated
+            return None
+        return entry
+
+    def _refreshed(self, entry: _Entry, headers, ttl: Optional[float]) -> _Entry:
+        """Update an entry after a 304 Not Modified response."""
+        merged = dict(entry.headers)
+        for name, value in headers.items():
+            if name.lower() not in _TRANSFER_HEADERS:
+                merged[name] = value
+        now = time.time()
+        return entry._replace(headers=merged, stored_at=now, expires_at=now + self._lifetime(merged, ttl))
+
+    @staticmethod
+    def _conditional(request: Dict[str, Any], entry: Optional[_Entry]) -> Dict[str, Any]:
+        """Add the validators of a stale entry to a request."""
+        if entry is None or not (entry.etag or entry.last_modified):
+            return request
+        headers = dict(request.get('headers') or {})
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return dict(request, headers=headers)
+
+    # Storage
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        if self._db is None:
+            return None
+
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT status_code, headers, body, url, encoding, stored_at, expires_at FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        entry = _Entry(row[0], json.loads(row[1]), bytes(row[2]), row[3], row[4], row[5], row[6])
+        self._put_memory(key, entry)
+        return entry
+
+    def _put_memory(self, key: str, entry: _Entry):
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous.body)
+            self._memory[key] = entry
+            self._memory_bytes += len(entry.body)
+            while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted.body)
+
+    def _put(self, key: str, entry: _Entry):
+        self._put_memory(key, entry)
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.status_code, json.dumps(entry.headers), entry.body, entry.url, entry.encoding,
+                 entry.stored_at, entry.expires_at, time.time()))
+            count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.sqlite_max_entries:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at LIMIT ?)",
+                    (count - self.sqlite_max_entries,))
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses")
+
+    # Responses
+
+    @staticmethod
+    def _response(entry: _Entry):
+        """Build a new requests.Response from an entry."""
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        response = requests.Response()
+        response.status_code = entry.status_code
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.headers['Content-Length'] = str(len(entry.body))
+        response._content = entry.body
+        # iter_content reads the body from memory
+        response._content_consumed = True
+        response.url = entry.url
+        response.encoding = entry.encoding
+        response.reason = 'OK'
+        return response
+
+    @staticmethod
+    def _aresponse(entry: _Entry, request: Dict[str, Any]):
+        """Build a new httpx.Response from an entry."""
+        import httpx
+
+        headers = dict(entry.headers, **{'Content-Length': str(len(entry.body))})
+        return httpx.Response(entry.status_code, headers=headers, content=entry.body,
+                              request=httpx.Request(request['method'], entry.url))
+
+    def _cacheable(self, plugin_name: str, operation_id: str, request: Dict[str, Any]):
+        """Return (cacheable, ttl override) for a call."""
+        if request['method'].lower() not in self.methods:
+            return False, None
+        ttl = self._operation_ttl(plugin_name, operation_id)
+        return ttl != 0, ttl
+
+    def _lookup(self, key: str):
+        """Return (fresh entry or None, stale entry or None)."""
+        entry = self._get(key)
+        if entry is not None and entry.expires_at > time.time():
+            self._count("hits")
+            return entry, None
+        return None, entry
+
+    def _join(self, key: str, new_event: Callable[[], Any]):
+        """Return (flight, leader): the request in progress for a key, or a new one."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight(new_event())
+            return flight, True
+
+    def _land(self, key: str, flight: _Flight):
+        with self._lock:
+            del self._flights[key]
+        flight.event.set()
+
+    def _small_enough(self, headers, stream: bool) -> bool:
+        """Check if the body of a streamed response is small enough to be read for the cache."""
+        if not stream:
+            return True
+        length = _number(headers.get('Content-Length'))
+        return length is not None and length <= self.max_entry_bytes
+
+    def fetch(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: Optional[str],
+              request: Dict[str, Any], send: Callable[[Dict[str, Any]], Any], stream: bool = False):
+        """Get the response of a call from the cache, or send it and cache the response.
+
+        Parameters
+        ----------
+        plugin_name : str
+            The name of the plugin.
+        operation_id : str
+            The ID of the operation.
+        parameters : dict
+            The parameters of the call.
+        api_key : str or None
+            The API key of the call.
+        request : dict
+            The keyword arguments of the request (method, url, headers...).
+        send : callable
+            Function sending a request (given as keyword arguments) and
+            returning the requests.Response.
+        stream : bool, optional
+            Whether the response is streamed. Streamed responses are only
+            cached when their Content-Length is known and small enough.
+            Defaults to False.
+
+        Returns
+        -------
+        requests.Response
+            A cached copy or the response received.
+        """
+        cacheable, ttl = self._cacheable(plugin_name, operation_id, request)
+        if not cacheable:
+            return send(request)
+
+        key = self.key(plugin_name, operation_id, parameters, api_key)
+        fresh, stale = self._lookup(key)
+        if fresh is not None:
+            return self._response(fresh)
+
+        flight, leader = self._join(key, threading.Event)
+        if not leader:
+            flight.event.wait()
+            if flight.entry is not None:
+                self._count("coalesced")
+                return self._response(flight.entry)
+            return send(request)
+
+        try:
+            response = send(self._conditional(request, stale))
+            if response.status_code == 304 and stale is not None:
+                response.close()
+                entry = self._refreshed(stale, response.headers, ttl)
+                self._put(key, entry)
+                self._count("revalidated")
+                flight.entry = entry
+                return self._response(entry)
+
+            self._count("misses")
+            if response.status_code == 200 and self._small_enough(response.headers, stream):
+                entry = self._entry(response, response.headers, response.content, ttl)
+                if entry is not None:
+                    self._put(key, entry)
+                    flight.entry = entry
+            return response
+        finally:
+            self._land(key, flight)
+
+    async def afetch(self, plugin_name: str, operation_id: str, parameters: Dict[str, Any], api_key: Optional[str],
+                     request: Dict[str, Any], send: Callable[[Dict[str, Any]], Awaitable[Any]], stream: bool = False):
+        """Async version of fetch, for httpx responses.
+
+        The SQLite tier, if any, is accessed synchronously.
+
+        Returns
+        -------
+        httpx.Response
+            A cached copy or the response received.
+        """
+        cacheable, ttl = self._cacheable(plugin_name, operation_id, request)
+        if not cacheable:
+            return await send(request)
+
+        key = self.key(plugin_name, operation_id, parameters, api_key)
+        fresh, stale = self._lookup(key)
+        if fresh is not None:
+            return self._aresponse(fresh, request)
+
+        # Requests of different event loops can't wait for each other
+        flight, leader = self._join((id(asyncio.get_running_loop()), key), asyncio.Event)
+        if not leader:
+            await flight.event.wait()
+            if flight.entry is not None:
+                self._count("coalesced")
+                return self._aresponse(flight.entry, request)
+            return await send(request)
+
+        try:
+            response = await send(self._conditional(request, stale))
+            if response.status_code == 304 and stale is not None:
+                await response.aclose()
+                entry = self._refreshed(stale, response.headers, ttl)
+                self._put(key, entry)
+                self._count("revalidated")
+                flight.entry = entry
+                return self._aresponse(entry, request)
+
+            self._count("misses")
+            if response.status_code == 200 and self._small_enough(response.headers, stream):
+                entry = self._entry(response, response.headers, await response.aread(), ttl)
+                if entry is not None:
+                    self._put(key, entry)
+                    flight.entry = entry
+            return response
+        finally:
+            self._land((id(asyncio.get_running_loop()), key), flight)
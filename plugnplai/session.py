@@ -0,0 +1,313 @@
+"""
+Shared HTTP sessions for all plugin traffic.
+
+Plugin traffic goes through two shared ``requests.Session``, so repeated
+calls to the same host reuse keep-alive connections from a per-host pool
+instead of opening a new TCP+TLS connection each time:
+
+- get_session, for the downloads of manifests, OpenAPI specs and directory
+  listings. These idempotent GETs are retried after connection errors, read
+  errors and retryable status codes, with exponential backoff.
+- get_call_session, for the plugin operation calls. They are never retried
+  by the session: the calls may not be idempotent, and their timeouts, rate
+  limits and failure handling belong to CallGuard (see plugnplai.resilience).
+
+The async API uses an ``httpx.AsyncClient`` built from the same settings,
+one per event loop. httpx only retries failed connections.
+
+Functions
+---------
+    configure_session
+    get_session
+    get_call_session
+    call_request
+    close_session
+    get_async_client
+    aclose_async_client
+
+"""
+import io
+import threading
+import time
+import weakref
+from typing import Any, Dict, Iterable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import DecodeError, HTTPError, ProtocolError, ReadTimeoutError
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
+
+_session = None
+_call_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_session_config = {
+    "pool_connections": 10,
+    "pool_maxsize": 10,
+    "max_retries": 3,
+    "backoff_factor": 0.3,
+    "status_forcelist": (429, 500, 502, 503, 504),
+    "headers": None,
+}
+
+
+def _build_session(pool_connections: int, pool_maxsize: int, max_retries: int, backoff_factor: float,
+                   status_forcelist: Iterable[int], headers: Optional[Dict[str, str]]) -> requests.Session:
+    """Build a session with pooled adapters and a retry policy (max_retries=0 for none)."""
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=tuple(status_forcelist),
+        # Only idempotent methods are retried, and the last response is
+        # returned instead of raising when the retries are exhausted
+        raise_on_status=False,
+        # A Retry-After header could hold the caller for any time, the
+        # backoff bounds the wait instead
+        respect_retry_after_header=False,
+    ) if max_retries else 0
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def configure_session(pool_connections: int = 10, pool_maxsize: int = 10, max_retries: int = 3,
+                      backoff_factor: float = 0.3, status_forcelist: Iterable[int] = (429, 500, 502, 503, 504),
+                      headers: Optional[Dict[str, str]] = None):
+    """Configure the sessions shared by the package.
+
+    The current sessions and async clients are closed and new ones are built
+    on next use. The retry settings apply to the downloads of manifests,
+    specs and directory listings (get_session) only; plugin operation calls
+    are never retried.
+
+    Parameters
+    ----------
+    pool_connections : int, optional
+        Number of hosts to keep connection pools for. Defaults to 10.
+    pool_maxsize : int, optional
+        Maximum number of keep-alive connections per host. Defaults to 10.
+    max_retries : int, optional
+        Retries of the downloads after failed connections and reads, and
+        retryable status codes. Defaults to 3.
+    backoff_factor : float, optional
+        Exponential backoff factor between retries, in seconds. Defaults to 0.3.
+    status_forcelist : iterable of int, optional
+        Status codes that trigger a retry of a download. Retry-After headers
+        are ignored. Defaults to (429, 500, 502, 503, 504).
+    headers : dict, optional
+        Headers sent with every request. Defaults to None.
+    """
+    with _session_lock:
+        # Async clients are bound to their event loop and picked up the old
+        # settings, new ones are built on next use
+        _close_async_clients()
+        _session_config.update(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=tuple(status_forcelist),
+            headers=headers,
+        )
+        _close_sessions()
+
+
+def _close_sessions():
+    global _session, _call_session
+    for session in (_session, _call_session):
+        if session is not None:
+            session.close()
+    _session = _call_session = None
+
+
+def _close_async_clients():
+    """Close the async clients on their event loops and forget them.
+
+    The clients of running loops are closed by a task on their loop, which
+    isn't waited for: it may be the loop of the caller.
+    """
+    import asyncio
+
+    clients = list(_async_clients.items())
+    _async_clients.clear()
+    for loop, client in clients:
+        if loop.is_closed():
+            # Nothing can run on the loop anymore
+            continue
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            continue
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            loop.run_until_complete(client.aclose())
+        # Else another loop runs in this thread and this one can't be run
+
+
+def get_session() -> requests.Session:
+    """Get the session of the downloads, creating it on first use.
+
+    Manifests, specs and directory listings are downloaded with this
+    session, which retries failed connections and reads, and retryable
+    status codes.
+
+    Returns
+    -------
+    requests.Session
+        The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(**_session_config)
+    return _session
+
+
+def get_call_session() -> requests.Session:
+    """Get the session of the plugin operation calls, creating it on first use.
+
+    The session has the pool sizes and headers of get_session, but never
+    retries a request.
+
+    Returns
+    -------
+    requests.Session
+        The shared session.
+    """
+    global _call_session
+    if _call_session is None:
+        with _session_lock:
+            if _call_session is None:
+                _call_session = _build_session(**dict(_session_config, max_retries=0))
+    return _call_session
+
+
+def call_request(request: Dict[str, Any], timeout: Optional[float] = None, stream: bool = False) -> requests.Response:
+    """Make a plugin operation call with the session of get_call_session.
+
+    Parameters
+    ----------
+    request : dict
+        The keyword arguments of ``requests.Session.request``.
+    timeout : float, optional
+        Deadline in seconds for the whole call: connecting, sending, and
+        receiving the headers and the body (only the headers when
+        streaming). Defaults to None (no deadline).
+    stream : bool, optional
+        Return as soon as the headers are received. Defaults to False.
+
+    Returns
+    -------
+    requests.Response
+        The response.
+
+    Raises
+    ------
+    requests.exceptions.Timeout
+        If the deadline passed.
+    """
+    session = get_call_session()
+    if timeout is None:
+        return session.request(**request, stream=stream)
+    deadline = time.monotonic() + timeout
+    # urllib3 bounds connecting and receiving the headers together, and each
+    # read of the body by the time left when the headers arrived
+    response = session.request(**request, stream=True, timeout=Timeout(total=timeout))
+    if stream:
+        return response
+    chunks = []
+    try:
+        # Response.iter_content would mark the body as consumed, so it is read
+        # from the urllib3 response and served from memory afterwards. read1
+        # (urllib3 2) returns what has arrived instead of waiting for a full
+        # chunk, so the deadline is checked while a slow body trickles in.
+        raw = response.raw
+        if hasattr(raw, "read1"):
+            body = iter(lambda: raw.read1(65536, decode_content=True), b"")
+        else:
+            body = raw.stream(65536, decode_content=True)
+        for chunk in body:
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout(f"No complete response from {response.url} within {timeout} seconds")
+            chunks.append(chunk)
+    except ReadTimeoutError as e:
+        response.close()
+        raise requests.exceptions.ReadTimeout(e, request=response.request)
+    except ProtocolError as e:
+        response.close()
+        raise requests.exceptions.ChunkedEncodingError(e, request=response.request)
+    except DecodeError as e:
+        response.close()
+        raise requests.exceptions.ContentDecodingError(e, request=response.request)
+    except HTTPError as e:
+        response.close()
+        raise requests.exceptions.ConnectionError(e, request=response.request)
+    except BaseException:
+        response.close()
+        raise
+    # The whole body was read, so the connection goes back to the pool
+    response.raw.release_conn()
+    response.raw = io.BytesIO(b"".join(chunks))
+    return response
+
+
+def close_session():
+    """Close the shared sessions and their pooled connections."""
+    with _session_lock:
+        _close_sessions()
+
+
+def _import_httpx() -> Any:
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError(
+            "Could not import httpx python package. "
+            "Please install it with `pip install httpx`."
+        )
+    return httpx
+
+
+def get_async_client() -> Any:
+    """Get the async HTTP client shared by the package in the running event loop.
+
+    The client uses the pool sizes, retries and headers set with
+    configure_session. Requires the ``httpx`` package.
+
+    Returns
+    -------
+    httpx.AsyncClient
+        The shared async client for the running event loop.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        httpx = _import_httpx()
+        # httpx pools connections per client, so allow pool_maxsize
+        # connections for each of the pool_connections hosts
+        max_connections = _session_config["pool_connections"] * _session_config["pool_maxsize"]
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        transport = httpx.AsyncHTTPTransport(limits=limits, retries=_session_config["max_retries"])
+        client = httpx.AsyncClient(transport=transport, headers=_session_config["headers"])
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """Close the async client of the running event loop."""
+    import asyncio
+
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,244 @@
+"""
+Bounded reading of plugin API responses.
+
+Plugin responses are read as a stream of chunks, so a large response is never
+buffered whole: iter_response yields raw chunks, iter_json_lines yields the
+objects of a JSON-lines body, and read_response decodes at most max_bytes of
+the body and tells whether the rest was cut off. The async functions do the
+same for httpx responses.
+
+Functions
+---------
+    iter_response
+    iter_json_lines
+    read_response
+    truncation_note
+    aiter_response
+    aread_response
+
+"""
+import codecs
+import json
+from typing import Any, AsyncIterator, Iterator, Optional, Tuple
+
+DEFAULT_CHUNK_SIZE = 8192
+
+
+def _cap(chunks, max_bytes: Optional[int]):
+    """Yield (chunk, truncated) pairs, cutting the chunks after max_bytes."""
+    total = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if max_bytes is not None and total + len(chunk) > max_bytes:
+            yield chunk[:max_bytes - total], True
+            return
+        total += len(chunk)
+        yield chunk, False
+
+
+def _decoder(response: Any):
+    encoding = getattr(response, 'encoding', None) or 'utf-8'
+    try:
+        return codecs.getincrementaldecoder(encoding)(errors='replace')
+    except LookupError:
+        return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+
+def _split_lines(buffer: bytes, chunk: bytes):
+    """Add a chunk to the buffer and split out the complete lines."""
+    lines = (buffer + chunk).split(b'\n')
+    return lines[:-1], lines[-1]
+
+
+def _parse_line(line: bytes) -> Any:
+    line = line.strip()
+    return json.loads(line) if line else None
+
+
+def iter_response(response: Any, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  max_bytes: Optional[int] = None) -> Iterator[bytes]:
+    """Iterate over the body of a response, stopping after max_bytes.
+
+    The response should be requested with ``stream=True``, otherwise the
+    body is already in memory. It is closed when the iteration ends.
+
+    Parameters
+    ----------
+    response : requests.Response
+        The response to read.
+    chunk_size : int, optional
+        Size of the chunks read from the connection. Defaults to 8192.
+    max_bytes : int, optional
+        Maximum number of bytes to yield. Defaults to None (the whole body).
+
+    Yields
+    ------
+    bytes
+        The chunks of the body.
+    """
+    try:
+        for chunk, _ in _cap(response.iter_content(chunk_size=chunk_size), max_bytes):
+            yield chunk
+    finally:
+        response.close()
+
+
+def iter_json_lines(response: Any, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    max_bytes: Optional[int] = None) -> Iterator[Any]:
+    """Iterate over the objects of a JSON-lines response, stopping after max_bytes.
+
+    Blank lines are skipped. A line cut off by max_bytes is dropped.
+
+    Parameters
+    ----------
+    response : requests.Response
+        The response to read, requested with ``stream=True``.
+    chunk_size : int, optional
+        Size of the chunks read from the connection. Defaults to 8192.
+    max_bytes : int, optional
+        Maximum number of bytes to read. Defaults to None (the whole body).
+
+    Yields
+    ------
+    Any
+        The parsed object of each line.
+    """
+    buffer = b''
+    truncated = False
+    try:
+        for chunk, truncated in _cap(response.iter_content(chunk_size=chunk_size), max_bytes):
+            lines, buffer = _split_lines(buffer, chunk)
+            for line in lines:
+                item = _parse_line(line)
+                if item is not None:
+                    yield item
+    finally:
+        response.close()
+
+    if not truncated:
+        item = _parse_line(buffer)
+        if item is not None:
+            yield item
+
+
+def read_response(response: Any, max_bytes: Optional[int] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[str, bool]:
+    """Read the text of a response, keeping at most max_bytes of the body.
+
+    Parameters
+    ----------
+    response : requests.Response
+        The response to read, requested with ``stream=True``.
+    max_bytes : int, optional
+        Maximum number of bytes to read. Defaults to None (the whole body).
+    chunk_size : int, optional
+        Size of the chunks read from the connection. Defaults to 8192.
+
+    Returns
+    -------
+    tuple
+        The decoded text and whether the body was truncated.
+    """
+    decoder = _decoder(response)
+    parts = []
+    truncated = False
+    try:
+        for chunk, truncated in _cap(response.iter_content(chunk_size=chunk_size), max_bytes):
+            parts.append(decoder.decode(chunk))
+    finally:
+        response.close()
+    # A character cut in half by the cap is dropped instead of replaced
+    if not truncated:
+        parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts), truncated
+
+
+def truncation_note(text: str, truncated: bool) -> str:
+    """Default summarize hook: flag truncated responses for the LLM.
+
+    Parameters
+    ----------
+    text : str
+        The text read from the response.
+    truncated : bool
+        Whether the response was truncated.
+
+    Returns
+    -------
+    str
+        The text to put in the follow-up prompt.
+    """
+    if truncated:
+        return f"{text}\n[... response truncated to its first {len(text.encode('utf-8'))} bytes]"
+    return text
+
+
+async def aiter_response(response: Any, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         max_bytes: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Iterate over the body of an httpx response, stopping after max_bytes.
+
+    The response should be sent with ``stream=True``. It is closed when the
+    iteration ends.
+
+    Parameters
+    ----------
+    response : httpx.Response
+        The response to read.
+    chunk_size : int, optional
+        Size of the chunks read from the connection. Defaults to 8192.
+    max_bytes : int, optional
+        Maximum number of bytes to yield. Defaults to None (the whole body).
+
+    Yields
+    ------
+    bytes
+        The chunks of the body.
+    """
+    total = 0
+    try:
+        async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+            if max_bytes is not None and total + len(chunk) > max_bytes:
+                yield chunk[:max_bytes - total]
+                return
+            total += len(chunk)
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+async def aread_response(response: Any, max_bytes: Optional[int] = None,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[str, bool]:
+    """Read the text of an httpx response, keeping at most max_bytes of the body.
+
+    Parameters
+    ----------
+    response : httpx.Response
+        The response to read, sent with ``stream=True``.
+    max_bytes : int, optional
+        Maximum number of bytes to read. Defaults to None (the whole body).
+    chunk_size : int, optional
+        Size of the chunks read from the connection. Defaults to 8192.
+
+    Returns
+    -------
+    tuple
+        The decoded text and whether the body was truncated.
+    """
+    decoder = _decoder(response)
+    parts = []
+    total = 0
+    truncated = False
+    try:
+        async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+            if max_bytes is not None and total + len(chunk) > max_bytes:
+                parts.append(decoder.decode(chunk[:max_bytes - total]))
+                truncated = True
+                break
+            total += len(chunk)
+            parts.append(decoder.decode(chunk))
+    finally:
+        await response.aclose()
+    if not truncated:
+        parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts), truncated
@@ -1,24 +1,44 @@
 import json
 import ast
 import os
-
-import jsonref
-import requests
-import yaml
 import re
+import time
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from plugnplai.cache import get_default_cache
+from plugnplai.instrumentation import span
+from plugnplai.refs import RefResolver
+
+# requests, jsonref and yaml are imported in the functions that use them, so
+# importing this module (e.g. only for parse_llm_response) stays cheap
 
-def make_request_get(url: str, timeout=5):
+def make_request_get(url: str, timeout=5, headers: dict = None, deadline: float = None):
     """Make an HTTP GET request.
 
     Args:
         url (str): URL to make request to.
         timeout (int, optional): Timeout in seconds. Defaults to 5.
+        headers (dict, optional): Extra request headers. Defaults to None.
+        deadline (float, optional): time.monotonic() value by which the whole
+            response must be received. The request is then not retried.
+            Defaults to None (no deadline).
 
     Returns:
         requests.Response: Response from request.
     """
+    import requests
+    from plugnplai.session import call_request, get_session
+
+    response = None
     try:
-        response = requests.get(url, timeout=timeout)
+        if deadline is None:
+            response = get_session().get(url, timeout=timeout, headers=headers)
+        else:
+            # The retries of the download session could go past the deadline
+            remaining = max(0.0, deadline - time.monotonic())
+            response = call_request({"method": "GET", "url": url, "headers": headers},
+                                    timeout=min(timeout, remaining))
         response.raise_for_status()  # Raises stored HTTPError, if one occurred.
     except requests.exceptions.HTTPError as errh:
         print ("Http Error:",errh)
@@ -97,19 +117,92 @@ def get_category_names(provider: str = "plugnplai"):
     else:
         return "Provider not supported for this operation."
 
+def _parse_response(parse, url: str, response):
+    """Parse the text of a response, giving its Content-Type and URL as format hints.
+
+    Args:
+        parse (callable): Function converting the response text to a dict.
+        url (str): URL of the document.
+        response: requests or httpx response.
+
+    Returns:
+        dict: Parsed document.
+    """
+    return parse(response.text, content_type=response.headers.get("Content-Type"), url=url)
+
+
+def _cached_get(url: str, parse, timeout=5, cache=None, deadline=None):
+    """Get and parse a document, going through the on-disk cache if there is one.
+
+    Fresh cache entries are served without any request. Stale entries are
+    revalidated with a conditional GET and kept if the server answers 304, or
+    if the server can't be reached.
+
+    Args:
+        url (str): URL of the document.
+        parse (callable): Function converting the response text to a dict.
+        timeout (int, optional): Timeout in seconds. Defaults to 5.
+        cache (SpecCache, optional): Cache to use. Defaults to the default cache.
+        deadline (float, optional): time.monotonic() value by which the
+            download must be done. Defaults to None (no deadline).
+
+    Returns:
+        dict: Parsed document.
+    """
+    cache = cache or get_default_cache()
+    if cache is None:
+        return _parse_response(parse, url, make_request_get(url, timeout=timeout, deadline=deadline))
+
+    entry = cache.lookup(url)
+    if entry is not None and cache.is_fresh(entry):
+        return cache.load_parsed(entry)
+
+    headers = cache.conditional_headers(entry) if entry is not None else None
+    response = make_request_get(url, timeout=timeout, headers=headers, deadline=deadline)
+    return _parse_cached_response(url, parse, cache, entry, response)
+
+def _parse_cached_response(url: str, parse, cache, entry, response):
+    """Parse a (possibly conditional) response and update the cache with it.
+
+    Args:
+        url (str): URL of the document.
+        parse (callable): Function converting the response text to a dict.
+        cache (SpecCache): Cache to update.
+        entry (dict): Current cache entry, or None.
+        response: requests or httpx response, or None if the request failed.
+
+    Returns:
+        dict: Parsed document.
+    """
+    if entry is not None:
+        if response is None or response.status_code >= 400:
+            # Serve the stale copy rather than failing when the server is down
+            return cache.load_parsed(entry)
+        if response.status_code == 304:
+            cache.refresh(url, entry, response.headers)
+            return cache.load_parsed(entry)
+
+    parsed = _parse_response(parse, url, response)
+    if response.status_code < 400:
+        cache.store(url, response.content, parsed, response.headers)
+    return parsed
+
 # given a plugin url, get the ai-plugin.json manifest, in "/.well-known/ai-plugin.json"
-def get_plugin_manifest(url: str):
+def get_plugin_manifest(url: str, cache=None, deadline=None):
     """Get plugin manifest from URL.
 
     Args:
         url (str): Plugin URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+        deadline (float, optional): time.monotonic() value by which the
+            download must be done. Defaults to None (no deadline).
 
     Returns:
         dict: Plugin manifest.
     """
     urlJson = os.path.join(url, ".well-known/ai-plugin.json")
-    response = make_request_get(urlJson)
-    return response.json()
+    with span("plugnplai.manifest.fetch", url=urlJson):
+        return _cached_get(urlJson, _load_json, cache=cache, deadline=deadline)
 
 def _is_partial_url(url, openapi_url):
     """Check if OpenAPI URL is partial.
@@ -143,82 +236,299 @@ def get_openapi_url(url, manifest):
     openapi_url = manifest["api"]["url"]
     return _is_partial_url(url, openapi_url)
 
+@lru_cache(maxsize=None)
+def _json_loads():
+    """Get the fastest JSON parser available: orjson if installed, else json."""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+
+    def loads(txt):
+        try:
+            return orjson.loads(txt)
+        except orjson.JSONDecodeError:
+            # orjson is stricter (NaN, integers above 64 bits...)
+            return json.loads(txt)
+
+    return loads
+
+
+@lru_cache(maxsize=None)
+def _yaml_loader():
+    """Get the YAML safe loader, using the libyaml C extension when available."""
+    import yaml
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _load_yaml(txt: str):
+    import yaml
+    return yaml.load(txt, Loader=_yaml_loader())
+
+
+def _load_json(txt: str, content_type: str = None, url: str = None):
+    """Parse a JSON document with the fastest JSON parser available.
+
+    Args:
+        txt (str): JSON serialized document.
+        content_type (str, optional): Unused, for the same interface as marshal_spec.
+        url (str, optional): Unused, for the same interface as marshal_spec.
+
+    Returns:
+        dict: The parsed document.
+    """
+    return _json_loads()(txt)
+
+
+def detect_spec_format(txt: str, content_type: str = None, url: str = None) -> str:
+    """Guess if a serialized spec is JSON or YAML.
+
+    The Content-Type is checked first, then the extension of the URL, then
+    the first character of the document.
+
+    Args:
+        txt (str): Serialized spec.
+        content_type (str, optional): Content-Type of the response.
+        url (str, optional): URL of the spec.
+
+    Returns:
+        str: "json" or "yaml".
+    """
+    if content_type:
+        content_type = content_type.lower()
+        if "json" in content_type:
+            return "json"
+        if "yaml" in content_type or "yml" in content_type:
+            return "yaml"
+
+    if url:
+        path = urlparse(url).path.lower()
+        if path.endswith(".json"):
+            return "json"
+        if path.endswith((".yaml", ".yml")):
+            return "yaml"
+
+    # A JSON spec is an object, while a YAML one starts with a key or a comment
+    return "json" if txt.lstrip()[:1] in ("{", "[") else "yaml"
+
+
 # This code uses the following source: https://github.com/hwchase17/langchain/blob/master/langchain/tools/plugin.py
-def marshal_spec(txt: str) -> dict:
+def marshal_spec(txt: str, content_type: str = None, url: str = None) -> dict:
     """Convert YAML or JSON serialized spec to dict.
 
+    The format is detected with detect_spec_format and the other one is tried
+    if parsing fails, since some servers send a wrong Content-Type. JSON is
+    parsed with orjson if installed, and YAML with the libyaml C loader if
+    available.
+
     Args:
         txt (str): YAML or JSON serialized spec.
+        content_type (str, optional): Content-Type of the response, used as a format hint.
+        url (str, optional): URL of the spec, used as a format hint.
 
     Returns:
         dict: Spec as a dict.
     """
-    try:
-        return json.loads(txt)
-    except json.JSONDecodeError:
-        return yaml.safe_load(txt)
+    spec_format = detect_spec_format(txt, content_type, url)
+    with span("plugnplai.spec.parse", format=spec_format, size=len(txt)):
+        if spec_format == "json":
+            try:
+                return _json_loads()(txt)
+            except ValueError:
+                return _load_yaml(txt)
+
+        import yaml
+        try:
+            return _load_yaml(txt)
+        except yaml.YAMLError as yaml_error:
+            try:
+                return _json_loads()(txt)
+            except ValueError:
+                raise yaml_error
 
 
-def get_openapi_spec(openapi_url):
+def get_openapi_spec(openapi_url, cache=None, resolve_refs=True, deadline=None):
     """Get OpenAPI spec from URL.
 
     Args:
         openapi_url (str): OpenAPI URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+        resolve_refs (bool, optional): Resolve all the $ref references with jsonref.
+            PluginObject resolves them lazily, so it can be given the spec as
+            parsed (False). Defaults to True.
+        deadline (float, optional): time.monotonic() value by which the
+            download must be done. Defaults to None (no deadline).
 
     Returns:
         dict: OpenAPI spec.
     """
-    openapi_spec_str = make_request_get(openapi_url, timeout=20).text
-    openapi_spec = marshal_spec(openapi_spec_str)
+    with span("plugnplai.spec.fetch", url=openapi_url):
+        openapi_spec = _cached_get(openapi_url, marshal_spec, timeout=20, cache=cache, deadline=deadline)
+    if not resolve_refs:
+        return openapi_spec
     # Use jsonref to resolve references
-    resolved_openapi_spec = jsonref.JsonRef.replace_refs(openapi_spec)
+    import jsonref
+    with span("plugnplai.refs.resolve", url=openapi_url):
+        resolved_openapi_spec = jsonref.JsonRef.replace_refs(openapi_spec)
     return resolved_openapi_spec
 
 
-def spec_from_url(url):
+def spec_from_url(url, cache=None, resolve_refs=True, deadline=None):
     """Get plugin manifest and OpenAPI spec from URL.
 
     Args:
         url (str): Plugin URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+        resolve_refs (bool, optional): Resolve the $ref references of the spec. Defaults to True.
+        deadline (float, optional): time.monotonic() value by which the
+            downloads must be done. Defaults to None (no deadline).
 
     Returns:
         dict: Plugin manifest.
         dict: OpenAPI spec.
     """
-    manifest = get_plugin_manifest(url)
+    manifest = get_plugin_manifest(url, cache=cache, deadline=deadline)
     openapi_url = get_openapi_url(url, manifest)
-    openapi_spec = get_openapi_spec(openapi_url)
+    openapi_spec = get_openapi_spec(openapi_url, cache=cache, resolve_refs=resolve_refs, deadline=deadline)
     return manifest, openapi_spec
 
 
-def extract_parameters(openapi_spec, path, method):
+async def amake_request_get(url: str, timeout=5, headers: dict = None):
+    """Make an async HTTP GET request. Requires the httpx package.
+
+    Args:
+        url (str): URL to make request to.
+        timeout (int, optional): Timeout in seconds. Defaults to 5.
+        headers (dict, optional): Extra request headers. Defaults to None.
+
+    Returns:
+        httpx.Response: Response from request.
+    """
+    from plugnplai.session import get_async_client
+
+    client = get_async_client()
+    # httpx is an optional dependency, get_async_client made sure it's installed
+    import httpx
+
+    response = None
+    try:
+        response = await client.get(url, timeout=timeout, headers=headers)
+        response.raise_for_status()
+    except httpx.HTTPStatusError as errh:
+        print ("Http Error:",errh)
+    except httpx.TimeoutException as errt:
+        print ("Timeout Error:",errt)
+    except httpx.HTTPError as err:
+        print ("Something went wrong",err)
+    return response
+
+async def _acached_get(url: str, parse, timeout=5, cache=None):
+    """Async version of _cached_get.
+
+    Args:
+        url (str): URL of the document.
+        parse (callable): Function converting the response text to a dict.
+        timeout (int, optional): Timeout in seconds. Defaults to 5.
+        cache (SpecCache, optional): Cache to use. Defaults to the default cache.
+
+    Returns:
+        dict: Parsed document.
+    """
+    cache = cache or get_default_cache()
+    if cache is None:
+        return _parse_response(parse, url, await amake_request_get(url, timeout=timeout))
+
+    entry = cache.lookup(url)
+    if entry is not None and cache.is_fresh(entry):
+        return cache.load_parsed(entry)
+
+    headers = cache.conditional_headers(entry) if entry is not None else None
+    response = await amake_request_get(url, timeout=timeout, headers=headers)
+    return _parse_cached_response(url, parse, cache, entry, response)
+
+async def aget_plugin_manifest(url: str, cache=None):
+    """Async version of get_plugin_manifest.
+
+    Args:
+        url (str): Plugin URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+
+    Returns:
+        dict: Plugin manifest.
+    """
+    urlJson = os.path.join(url, ".well-known/ai-plugin.json")
+    with span("plugnplai.manifest.fetch", url=urlJson):
+        return await _acached_get(urlJson, _load_json, cache=cache)
+
+async def aget_openapi_spec(openapi_url, cache=None, resolve_refs=True):
+    """Async version of get_openapi_spec.
+
+    Args:
+        openapi_url (str): OpenAPI URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+        resolve_refs (bool, optional): Resolve the $ref references with jsonref. Defaults to True.
+
+    Returns:
+        dict: OpenAPI spec.
+    """
+    with span("plugnplai.spec.fetch", url=openapi_url):
+        openapi_spec = await _acached_get(openapi_url, marshal_spec, timeout=20, cache=cache)
+    if not resolve_refs:
+        return openapi_spec
+    import jsonref
+    with span("plugnplai.refs.resolve", url=openapi_url):
+        return jsonref.JsonRef.replace_refs(openapi_spec)
+
+async def aspec_from_url(url, cache=None, resolve_refs=True):
+    """Async version of spec_from_url.
+
+    Args:
+        url (str): Plugin URL.
+        cache (SpecCache, optional): On-disk cache to use. Defaults to the default cache.
+        resolve_refs (bool, optional): Resolve the $ref references of the spec. Defaults to True.
+
+    Returns:
+        dict: Plugin manifest.
+        dict: OpenAPI spec.
+    """
+    manifest = await aget_plugin_manifest(url, cache=cache)
+    openapi_url = get_openapi_url(url, manifest)
+    openapi_spec = await aget_openapi_spec(openapi_url, cache=cache, resolve_refs=resolve_refs)
+    return manifest, openapi_spec
+
+
+def extract_parameters(openapi_spec, path, method, resolver=None):
     """Extract parameters from OpenAPI spec for a path and method.
 
     Args:
-        openapi_spec (dict): OpenAPI spec.
+        openapi_spec (dict): OpenAPI spec, with its $ref references resolved or not.
         path (str): Path.
         method (str): Method.
+        resolver (RefResolver, optional): Resolver of the spec, to share the
+            resolved schemas between calls. Defaults to a new one.
 
     Returns:
         dict: Parameters.
     """
+    resolver = resolver or RefResolver(openapi_spec)
     parameters = {}
+    operation = resolver.deref(resolver.deref(openapi_spec["paths"][path])[method])
 
     # Extract path parameters and query parameters
-    if "parameters" in openapi_spec["paths"][path][method]:
-        for param in openapi_spec["paths"][path][method]["parameters"]:
+    if "parameters" in operation:
+        for param in map(resolver.deref, operation["parameters"]):
             param_name = param["name"]
             param_type = param["in"]  # e.g., 'path', 'query', 'header'
-            parameters[param_name] = {"type": param_type, "schema": param["schema"]}
+            parameters[param_name] = {"type": param_type, "schema": resolver.resolve(param["schema"])}
 
     # Extract request body properties
-    if "requestBody" in openapi_spec["paths"][path][method]:
-        content = openapi_spec["paths"][path][method]["requestBody"]["content"]
+    if "requestBody" in operation:
+        content = resolver.deref(operation["requestBody"])["content"]
         if "application/json" in content:
-            json_schema = content["application/json"]["schema"]
+            json_schema = resolver.deref(content["application/json"]["schema"])
             if "properties" in json_schema:
-                for prop_name, prop_schema in json_schema["properties"].items():
-                    parameters[prop_name] = {"type": "body", "schema": prop_schema}
+                for prop_name, prop_schema in resolver.deref(json_schema["properties"]).items():
+                    parameters[prop_name] = {"type": "body", "schema": resolver.resolve(prop_schema)}
 
     return parameters
 
@@ -226,12 +536,16 @@ def extract_parameters(openapi_spec, path, method):
 def extract_all_parameters(openapi_spec):
     """Extract all parameters from OpenAPI spec.
 
+    The $ref references are resolved for the operations only, and the
+    schemas they share are resolved once.
+
     Args:
-        openapi_spec (dict): OpenAPI spec.
+        openapi_spec (dict): OpenAPI spec, with its $ref references resolved or not.
 
     Returns:
         dict: All parameters.
     """
+    resolver = RefResolver(openapi_spec)
     all_parameters = {}
 
     # Mapping of long type names to short names
@@ -247,7 +561,7 @@ def extract_all_parameters(openapi_spec):
     # Iterate over all paths in the specification
     for path, path_item in openapi_spec["paths"].items():
         # Iterate over all methods (e.g., 'get', 'post', 'put') in the path item
-        for method, operation in path_item.items():
+        for method, operation in resolver.deref(path_item).items():
             # Skip non-method keys such as 'parameters' that can be present in the path item
             if method not in [
                 "get",
@@ -261,6 +575,8 @@ def extract_all_parameters(openapi_spec):
             ]:
                 continue
 
+            operation = resolver.deref(operation)
+
             # Extract the operation ID
             operation_id = operation.get("operationId", f"{method}_{path}")
 
@@ -268,7 +584,7 @@ def extract_all_parameters(openapi_spec):
             summary = operation.get("summary", "")
 
             # Extract parameters for the current operation
-            parameters = extract_parameters(openapi_spec, path, method)
+            parameters = extract_parameters(openapi_spec, path, method, resolver)
 
             # Shorten the types in the parameters dictionary
             for param_info in parameters.values():
@@ -286,24 +602,20 @@ def extract_all_parameters(openapi_spec):
 
     return all_parameters
 
-def parse_llm_response(response: str) -> dict:
-    """Parse LLM response to extract API call information.
-
-    Args:
-        response (str): LLM response.
-
-    Returns:
-        dict: API call information.
-    """
-    pattern = r'<API>\s*(.*?)\s*\((.*?)\)\s*</API>'
-    match = re.search(pattern, response, re.DOTALL)
+_API_OPEN_TAG = '<API>'
+_API_CLOSE_TAG = '</API>'
+_API_CALL_PATTERN = re.compile(r'<API>\s*(.*?)\s*\((.*?)\)\s*</API>', re.DOTALL)
 
-    if not match:
-        return {}
 
+def _api_call_info(match) -> dict:
+    """Build the API call information from a match of _API_CALL_PATTERN."""
     api = match.group(1)
     params_str = match.group(2)
 
+    # A tag in the name is an unclosed block, e.g. <API><API>a.b({})</API>
+    if '.' not in api or '<' in api:
+        return {}
+
     try:
         # Try parsing as JSON first
         params = json.loads(params_str)
@@ -319,3 +631,65 @@ def parse_llm_response(response: str) -> dict:
         'operation_id': api.split('.')[1],
         'parameters': params
     }
+
+
+def _parse_api_block(block: str) -> dict:
+    """Parse one complete <API>...</API> block.
+
+    Args:
+        block (str): Text from the opening tag to the closing tag.
+
+    Returns:
+        dict: API call information, empty if the block isn't a valid call.
+    """
+    match = _API_CALL_PATTERN.fullmatch(block)
+    return _api_call_info(match) if match else {}
+
+
+def _iter_api_calls(response: str):
+    """Yield the information of the valid API calls of an LLM response, in order.
+
+    Args:
+        response (str): LLM response.
+
+    Yields:
+        dict: API call information of each valid <API> block.
+    """
+    start = response.find(_API_OPEN_TAG)
+    while start >= 0:
+        end = response.find(_API_CLOSE_TAG, start + len(_API_OPEN_TAG))
+        if end < 0:
+            return
+        end += len(_API_CLOSE_TAG)
+        api_info = _parse_api_block(response[start:end])
+        if api_info:
+            yield api_info
+        start = response.find(_API_OPEN_TAG, end)
+
+
+def parse_llm_response(response: str) -> dict:
+    """Parse LLM response to extract API call information.
+
+    Args:
+        response (str): LLM response.
+
+    Returns:
+        dict: API call information of the first valid <API> block, as
+            returned by parse_llm_calls, or an empty dict.
+    """
+    with span("plugnplai.llm.parse"):
+        return next(_iter_api_calls(response), {})
+
+
+def parse_llm_calls(response: str) -> list:
+    """Parse LLM response to extract the information of every API call.
+
+    Args:
+        response (str): LLM response.
+
+    Returns:
+        list: API call information of each <API> block, in order. Blocks
+            that aren't valid API calls are skipped.
+    """
+    with span("plugnplai.llm.parse"):
+        return list(_iter_api_calls(response))
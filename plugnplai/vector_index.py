@@ -0,0 +1,144 @@
+"""
+Brute-force dense vector index on a NumPy matrix.
+
+Plugin catalogs hold a few thousand entries at most, so an exact search over
+a contiguous float32 matrix is fast enough and needs neither LangChain nor
+FAISS. Vectors are L2 normalized when added, so the dot product is the
+cosine similarity.
+
+Classes
+-------
+    NumpyIndex
+
+"""
+import os
+
+import numpy as np
+
+
+def _normalize(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyIndex:
+    """Exact top-k cosine similarity search on a contiguous float32 matrix.
+
+    Parameters
+    ----------
+    vectors : array-like, optional
+        Initial vectors, one per row. Defaults to an empty index.
+
+    Methods
+    -------
+    add(vectors)
+    remove(positions)
+    search(queries, k)
+    save(folder)
+    load(folder)
+    """
+
+    def __init__(self, vectors=None):
+        self._data = np.zeros((0, 0), dtype=np.float32)
+        self._size = 0
+        if vectors is not None and len(vectors):
+            self.add(vectors)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        """The indexed (normalized) vectors, one per row."""
+        return self._data[:self._size]
+
+    def add(self, vectors):
+        """Add vectors at the end of the index.
+
+        Parameters
+        ----------
+        vectors : array-like
+            Vectors to add, one per row.
+        """
+        vectors = _normalize(vectors)
+        if self._size == 0 and self._data.shape[1] != vectors.shape[1]:
+            self._data = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        needed = self._size + len(vectors)
+        if needed > len(self._data):
+            # Grow geometrically so adding plugins one by one stays cheap
+            data = np.zeros((max(needed, 2 * len(self._data)), vectors.shape[1]), dtype=np.float32)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:needed] = vectors
+        self._size = needed
+
+    def remove(self, positions):
+        """Remove the vectors at the given positions. The order of the others is kept.
+
+        Parameters
+        ----------
+        positions : list of int
+            Positions of the vectors to remove.
+        """
+        kept = np.delete(self.vectors, list(positions), axis=0)
+        self._data = np.ascontiguousarray(kept)
+        self._size = len(kept)
+
+    def search(self, queries, k=4):
+        """Find the k most similar vectors for each query.
+
+        Parameters
+        ----------
+        queries : array-like
+            Query vectors, one per row (or a single vector).
+        k : int, optional
+            Number of results per query. Defaults to 4.
+
+        Returns
+        -------
+        scores : numpy.ndarray
+            Cosine similarities, shape (n_queries, min(k, len(index))), best first.
+        indices : numpy.ndarray
+            Positions of the vectors, same shape as scores.
+        """
+        queries = _normalize(queries)
+        k = min(k, self._size)
+        if k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+
+        scores = queries @ self.vectors.T
+        if k < self._size:
+            # Select the top k of each row in linear time, then sort only those
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(self._size), (len(queries), self._size))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def save(self, folder):
+        """Save the index in a folder."""
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, "vectors.npy"), self.vectors)
+
+    @classmethod
+    def load(cls, folder):
+        """Load an index saved with save().
+
+        Returns
+        -------
+        NumpyIndex
+            The loaded index.
+        """
+        index = cls()
+        vectors = np.load(os.path.join(folder, "vectors.npy"))
+        # Saved vectors are already normalized
+        index._data = np.ascontiguousarray(vectors, dtype=np.float32)
+        index._size = len(vectors)
+        return index
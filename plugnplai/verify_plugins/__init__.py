@@ -1,7 +1,10 @@
+from plugnplai.verify_plugins.engine import HostRateLimiter, VerificationEngine
 from plugnplai.verify_plugins.verify_plugnplai import test_one_plugin_plugnplai, test_plugins_plugnplai
 from plugnplai.verify_plugins.verify_langchain import test_one_plugin_langchain
 
 __all__ = [
+    "HostRateLimiter",
+    "VerificationEngine",
     "test_one_plugin_plugnplai",
     "test_plugins_plugnplai",
     "test_one_plugin_langchain",
@@ -0,0 +1,271 @@
+"""
+Concurrent verification of plugin URLs.
+
+Each plugin goes through the same stages as test_one_plugin_plugnplai
+(manifest, OpenAPI url, OpenAPI spec, PluginObject, install, activate,
+prompt, tokens, functions). The manifest and the spec are fetched once and
+shared by the following stages. Plugins are checked in a thread pool, with a
+limit of concurrent requests and a minimum interval between requests per
+host, so a host serving many plugins isn't flooded.
+
+Every result is appended to a JSON-lines report as soon as it is known. A
+run reading an existing report skips the URLs already in it, so an
+interrupted verification can be resumed.
+
+Classes
+-------
+    HostRateLimiter
+    VerificationEngine
+
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from ..plugins import PluginObject, Plugins, count_tokens
+from ..utils import get_openapi_spec, get_openapi_url, get_plugin_manifest
+
+
+class HostRateLimiter:
+    """Limit the concurrent requests and the request rate per host.
+
+    Parameters
+    ----------
+    max_concurrent : int, optional
+        Maximum number of requests in flight to the same host. Defaults to 2.
+    min_interval : float, optional
+        Minimum number of seconds between the start of two requests to the
+        same host. Defaults to 0.
+    """
+
+    def __init__(self, max_concurrent: int = 2, min_interval: float = 0.0):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    @contextmanager
+    def limit(self, url: str):
+        """Context manager holding a request slot for the host of a URL."""
+        host = self.host(url)
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.max_concurrent)
+
+        with semaphore:
+            if self.min_interval:
+                with self._lock:
+                    now = time.monotonic()
+                    start = max(now, self._next_start.get(host, now))
+                    self._next_start[host] = start + self.min_interval
+                if start > now:
+                    time.sleep(start - now)
+            yield
+
+
+class VerificationEngine:
+    """Verify plugin URLs concurrently and write a JSON-lines report.
+
+    Parameters
+    ----------
+    report_path : str, optional
+        Path of the JSON-lines report. Results already in it are not checked
+        again. Defaults to None (no report).
+    max_workers : int, optional
+        Number of plugins checked at the same time. Defaults to 16.
+    max_per_host : int, optional
+        Maximum number of requests in flight to the same host. Defaults to 2.
+    min_interval : float, optional
+        Minimum number of seconds between two requests to the same host.
+        Defaults to 0.
+    retry_failed : bool, optional
+        Check again the URLs that failed in the existing report. Defaults to False.
+
+    Methods
+    -------
+    check(url)
+    verify(urls)
+    load_report()
+    """
+
+    STAGES = ("manifest", "openapi_url", "openapi_spec", "plugin_object", "install",
+              "activate", "prompt", "tokens", "functions")
+
+    def __init__(self, report_path: Optional[str] = None, max_workers: int = 16, max_per_host: int = 2,
+                 min_interval: float = 0.0, retry_failed: bool = False):
+        self.report_path = report_path
+        self.max_workers = max_workers
+        self.retry_failed = retry_failed
+        self.limiter = HostRateLimiter(max_per_host, min_interval)
+        self._report_lock = threading.Lock()
+
+    def check(self, url: str) -> Dict[str, Any]:
+        """Run every verification stage on a plugin URL.
+
+        Parameters
+        ----------
+        url : str
+            The plugin URL.
+
+        Returns
+        -------
+        dict
+            The result with the keys url, ok, failed_stage, error,
+            name_for_model, tokens, timings (milliseconds per stage) and
+            checked_at (Unix time).
+        """
+        result = {"url": url, "ok": False, "failed_stage": None, "error": None, "name_for_model": None,
+                  "tokens": None, "timings": {}, "checked_at": time.time()}
+        state = {}
+        stage = None
+        try:
+            for stage in self.STAGES:
+                start = time.perf_counter()
+                getattr(self, f"_stage_{stage}")(url, state)
+                result["timings"][stage] = round((time.perf_counter() - start) * 1000, 3)
+        except Exception as e:
+            result["timings"][stage] = round((time.perf_counter() - start) * 1000, 3)
+            result["failed_stage"] = stage
+            result["error"] = self._error_message(stage, url, state, e)
+            return result
+
+        result["ok"] = True
+        result["name_for_model"] = state["plugin"].name_for_model
+        result["tokens"] = state["tokens"]
+        return result
+
+    @staticmethod
+    def _error_message(stage: str, url: str, state: Dict[str, Any], error: Exception) -> str:
+        messages = {
+            "manifest": f"Error getting manifest from {url}: {error}",
+            "openapi_url": f"Error getting openapi url from manifest: {error}",
+            "openapi_spec": f"Error getting openapi spec from {state.get('openapi_url')}: {error}",
+            "plugin_object": f"Error creating PluginObject: {error}",
+            "install": f"Error installing Plugins: {error}",
+            "activate": f"Error activating plugin: {error}",
+            "prompt": f"Error filling prompt: {error}",
+            "tokens": f"Error counting tokens: {error}",
+            "functions": f"Error building functions: {error}",
+        }
+        return messages[stage]
+
+    def _stage_manifest(self, url: str, state: Dict[str, Any]):
+        with self.limiter.limit(url):
+            manifest = get_plugin_manifest(url)
+        if not isinstance(manifest, dict):
+            raise ValueError("the manifest is not a JSON object")
+        state["manifest"] = manifest
+
+    def _stage_openapi_url(self, url: str, state: Dict[str, Any]):
+        state["openapi_url"] = get_openapi_url(url, state["manifest"])
+
+    def _stage_openapi_spec(self, url: str, state: Dict[str, Any]):
+        with self.limiter.limit(state["openapi_url"]):
+            state["spec"] = get_openapi_spec(state["openapi_url"], resolve_refs=False)
+
+    def _stage_plugin_object(self, url: str, state: Dict[str, Any]):
+        state["plugin"] = PluginObject(url, state.pop("spec"), state["manifest"])
+
+    def _stage_install(self, url: str, state: Dict[str, Any]):
+        # Install the PluginObject already built instead of downloading the plugin again
+        state["plugins"] = Plugins([state["plugin"]])
+
+    def _stage_activate(self, url: str, state: Dict[str, Any]):
+        plugins = state["plugins"]
+        name = plugins.list_installed()[0]
+        plugins.active_plugins[name] = plugins.installed_plugins[name]
+
+    def _stage_prompt(self, url: str, state: Dict[str, Any]):
+        plugins = state["plugins"]
+        state["prompt"] = plugins.fill_prompt(plugins.template)
+
+    def _stage_tokens(self, url: str, state: Dict[str, Any]):
+        state["tokens"] = count_tokens(state["prompt"])
+
+    def _stage_functions(self, url: str, state: Dict[str, Any]):
+        # The functions must survive a JSON round trip to be sent to the LLM
+        json.loads(json.dumps(state["plugins"].build_functions()))
+
+    def load_report(self) -> Dict[str, Dict[str, Any]]:
+        """Load the results of the existing report, keyed by URL.
+
+        Returns
+        -------
+        dict
+            The last result of each URL in the report.
+        """
+        results = {}
+        if not self.report_path or not os.path.exists(self.report_path):
+            return results
+        with open(self.report_path, "r") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted run
+                    continue
+                results[result["url"]] = result
+        return results
+
+    def _end_report_line(self):
+        """End the incomplete last line of an interrupted run, so no result is appended to it."""
+        if not self.report_path or not os.path.exists(self.report_path):
+            return
+        with open(self.report_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _write(self, result: Dict[str, Any]):
+        if not self.report_path:
+            return
+        with self._report_lock:
+            with open(self.report_path, "a") as f:
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+
+    def verify(self, urls: Iterable[str]) -> List[Dict[str, Any]]:
+        """Verify plugin URLs concurrently.
+
+        Parameters
+        ----------
+        urls : iterable of str
+            The plugin URLs.
+
+        Returns
+        -------
+        list
+            The result of each URL (see check), in the order of the URLs,
+            including the ones read from the existing report.
+        """
+        urls = list(dict.fromkeys(urls))
+        done = self.load_report()
+        if self.retry_failed:
+            done = {url: result for url, result in done.items() if result["ok"]}
+        pending = [url for url in urls if url not in done]
+        if pending:
+            self._end_report_line()
+
+        results = dict(done)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.check, url) for url in pending]
+            for future in as_completed(futures):
+                result = future.result()
+                self._write(result)
+                results[result["url"]] = result
+
+        return [results[url] for url in urls]
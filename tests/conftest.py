@@ -0,0 +1,162 @@
+"""
+Fixtures of the unit tests. They run offline: plugin calls go to a local
+HTTP server.
+"""
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+from plugnplai import plugins as plugins_module
+from plugnplai.plugins import PluginObject, Plugins
+
+
+class _WordEncoding:
+    """Stand-in for a tiktoken encoding, with one token per word."""
+
+    def encode(self, text):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    """Count tokens as words: tiktoken downloads its encodings."""
+    monkeypatch.setattr(plugins_module, "get_encoding", lambda model_name="gpt-4": _WordEncoding())
+    plugins_module._template_tokens.cache_clear()
+    plugins_module._plugin_header_tokens.cache_clear()
+    yield
+    plugins_module._template_tokens.cache_clear()
+    plugins_module._plugin_header_tokens.cache_clear()
+
+
+def _manifest(handler):
+    if handler.headers.get("If-None-Match") == '"v1"':
+        return 304, {"ETag": '"v1"'}, b""
+    return 200, {"ETag": '"v1"'}, b'{"name_for_model": "test"}'
+
+
+def _hang(handler):
+    time.sleep(handler.server.hang)
+    return 200, {}, b'{"ok": true}'
+
+
+def _slow(handler):
+    # 20 chunks of 10 bytes, 0.1 s apart
+    return 200, {}, [b'"' + b"x" * 8 + b'"'] * 20
+
+
+def _echo(handler):
+    return 200, {}, handler.request_body or b"{}"
+
+
+_ROUTES = {
+    "/.well-known/ai-plugin.json": _manifest,
+    "/hang": _hang,
+    "/slow": _slow,
+    "/echo": _echo,
+    "/fail": (500, {}, b'{"ok": false}'),
+    "/throttle": (429, {"Retry-After": "8"}, b'{"ok": false}'),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        self.request_body = self.rfile.read(length) if length else b""
+        with server.lock:
+            server.hits[path] += 1
+            server.request_headers[path] = dict(self.headers)
+            server.requests.append((self.command, self.path, dict(self.headers), self.request_body))
+        time.sleep(server.latency.get(path, 0))
+
+        route = server.routes.get(path, (200, {}, b'{"ok": true}'))
+        status, headers, body = route(self) if callable(route) else route
+        chunks = body if isinstance(body, list) else [body]
+        headers = dict({"Content-Type": "application/json"}, **headers)
+        try:
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+            self.end_headers()
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(server.chunk_delay)
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except OSError:
+            # The client gave up waiting
+            pass
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    """Local HTTP server.
+
+    It answers any path with ``{"ok": true}``, and by default /fail (500),
+    /throttle (429), /hang (after 2 s), /slow (a body sent in 20 chunks,
+    0.1 s apart), /echo (the request body) and a plugin manifest with an
+    ETag. Tests can change:
+
+    - ``server.routes``: path -> (status, headers, body) or a function of
+      the handler returning it. A body given as a list of chunks is sent
+      ``server.chunk_delay`` seconds apart.
+    - ``server.latency``: path -> seconds to wait before answering.
+
+    ``server.hits`` counts the requests received per path,
+    ``server.request_headers`` keeps the headers of the last one and
+    ``server.requests`` all of them as (method, path, headers, body).
+    """
+    server = _Server(("127.0.0.1", 0), _Handler)
+    server.lock = threading.Lock()
+    server.routes = dict(_ROUTES)
+    server.latency = {}
+    server.chunk_delay = 0.1
+    server.hits = Counter()
+    server.request_headers = {}
+    server.requests = []
+    server.hang = 2
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def plugin(server):
+    """Plugin "test" with the GET operations ok, fail, throttle, hang and slow of the server."""
+    spec = {
+        "openapi": "3.0.1",
+        "info": {"title": "test", "version": "1"},
+        "servers": [{"url": server.url}],
+        "paths": {f"/{op}": {"get": {"operationId": op, "summary": f"The {op} operation."}}
+                  for op in ("ok", "fail", "throttle", "hang", "slow")},
+    }
+    manifest = {"name_for_model": "test", "description_for_model": "Plugin test.", "auth": {"type": "none"}}
+    return PluginObject(server.url, spec, manifest)
+
+
+@pytest.fixture
+def plugins(plugin):
+    """Plugins with the plugin "test" active."""
+    plugins = Plugins([plugin])
+    # Activate without counting tokens (tiktoken needs a download)
+    plugins.active_plugins["test"] = plugins.installed_plugins["test"]
+    return plugins
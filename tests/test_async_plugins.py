@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from plugnplai.async_plugins import AsyncPlugins  # noqa: E402
+
+
+def _serve_plugin(server, name):
+    """Serve plugin ``name`` under /name, with a GET operation ``name``."""
+    spec = {"openapi": "3.0.1", "info": {"title": name, "version": "1"}, "servers": [{"url": server.url}],
+            "paths": {f"/{name}/call": {"get": {"operationId": name}}}}
+    manifest = {"name_for_model": name, "description_for_model": f"Plugin {name}.", "auth": {"type": "none"},
+                "api": {"url": f"{server.url}/{name}/openapi.json"}}
+    server.routes[f"/{name}/.well-known/ai-plugin.json"] = (200, {}, json.dumps(manifest).encode())
+    server.routes[f"/{name}/openapi.json"] = (200, {}, json.dumps(spec).encode())
+    server.routes[f"/{name}/call"] = (200, {}, json.dumps({"plugin": name}).encode())
+    return f"{server.url}/{name}"
+
+
+@pytest.mark.parametrize("max_concurrency, min_time, max_time", [(None, 0, 0.6), (2, 0.6, 1.5)])
+def test_ainstall_plugins_concurrency(server, max_concurrency, min_time, max_time):
+    names = ["a", "b", "c", "d"]
+    urls = [_serve_plugin(server, name) for name in names]
+    for name in names:
+        server.latency[f"/{name}/.well-known/ai-plugin.json"] = 0.3
+
+    async def main():
+        plugins = AsyncPlugins()
+        start = time.monotonic()
+        results = await plugins.ainstall_plugins(urls, max_concurrency=max_concurrency)
+        return plugins, results, time.monotonic() - start
+
+    plugins, results, elapsed = asyncio.run(main())
+    assert min_time <= elapsed < max_time
+    assert results == {url: None for url in urls}
+    assert list(plugins.installed_plugins) == names
+
+
+def test_ainstall_plugins_timeout(server):
+    urls = [_serve_plugin(server, name) for name in ("fast", "slow", "other")]
+    server.latency["/slow/openapi.json"] = 3
+
+    async def main():
+        plugins = AsyncPlugins()
+        start = time.monotonic()
+        results = await plugins.ainstall_plugins(urls, timeout=0.5)
+        assert time.monotonic() - start < 1
+        # The download of the slow plugin was cancelled
+        assert [task for task in asyncio.all_tasks() if task is not asyncio.current_task()] == []
+        return plugins, results
+
+    plugins, results = asyncio.run(main())
+    assert isinstance(results[urls[1]], TimeoutError)
+    assert results[urls[0]] is None and results[urls[2]] is None
+    assert list(plugins.installed_plugins) == ["fast", "other"]
+
+
+def test_acall_api_timeout(server, plugin):
+    async def main():
+        plugins = AsyncPlugins([plugin])
+        plugins.active_plugins["test"] = plugins.installed_plugins["test"]
+        start = time.monotonic()
+        assert await plugins.acall_api("test", "hang", {}, timeout=0.5) is None
+        assert time.monotonic() - start < 1.5
+        response = await plugins.acall_api("test", "ok", {}, timeout=5)
+        assert response.json() == {"ok": True}
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("coroutine", [True, False])
+def test_aapply_plugins(server, coroutine):
+    urls = [_serve_plugin(server, name) for name in ("a", "b")]
+    server.latency.update({"/a/call": 0.4, "/b/call": 0.4})
+    messages = []
+
+    def llm(message):
+        messages.append(message)
+        if len(messages) == 1:
+            return "<API>a.a({})</API> <API>b.b({})</API>"
+        return "Done."
+
+    async def allm(message):
+        return llm(message)
+
+    async def main():
+        plugins = await AsyncPlugins.ainstall_and_activate(urls)
+        call_llm = plugins.aapply_plugins(allm if coroutine else llm)
+        start = time.monotonic()
+        assert await call_llm("Use both.") == "Done."
+        # The two calls were made concurrently
+        assert time.monotonic() - start < 0.8
+
+    asyncio.run(main())
+    assert messages[0].endswith("\nUse both.")
+    assert '{"plugin": "a"}' in messages[1] and '{"plugin": "b"}' in messages[1]
+
+
+def test_aapply_plugins_stream(server):
+    url = _serve_plugin(server, "a")
+    messages = []
+
+    async def llm(message):
+        messages.append(message)
+        chunks = ["<API>a.a", "({})</AP", "I> and more"] if len(messages) == 1 else ["Do", "ne."]
+        for chunk in chunks:
+            yield chunk
+
+    async def main():
+        plugins = await AsyncPlugins.ainstall_and_activate(url)
+        return await plugins.aapply_plugins_stream(llm)("Use a.")
+
+    assert asyncio.run(main()) == "Done."
+    assert '{"plugin": "a"}' in messages[1]
+
+
+def test_apply_plugins_stays_synchronous(server, plugin):
+    plugins = AsyncPlugins([plugin])
+    plugins.active_plugins["test"] = plugins.installed_plugins["test"]
+    call_llm = plugins.apply_plugins(lambda message: "No call.")
+    assert call_llm("Hi.") == "No call."
@@ -0,0 +1,68 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+import yaml
+
+from plugnplai import bulk
+from plugnplai.bulk import load_plugins
+from plugnplai.cache import SpecCache
+from plugnplai.plugins import PluginObject
+
+SPEC = """openapi: 3.0.1
+info:
+  title: Café
+  version: "1"
+paths:
+  /menu:
+    get:
+      operationId: menu
+      summary: Le menu du café.
+"""
+
+
+@pytest.fixture(scope="module")
+def executor():
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=bulk._process_context())
+    yield executor
+    executor.shutdown()
+
+
+def _serve_plugin(server, name, body, content_type):
+    """Serve the manifest of plugin ``name`` and its spec at /name/openapi.yaml."""
+    manifest = {"name_for_model": name, "description_for_model": f"Plugin {name}.", "auth": {"type": "none"},
+                "api": {"url": f"{server.url}/{name}/openapi.yaml"}}
+    server.routes[f"/{name}/.well-known/ai-plugin.json"] = (200, {}, json.dumps(manifest).encode())
+    server.routes[f"/{name}/openapi.yaml"] = (200, {"Content-Type": content_type}, body)
+    return f"{server.url}/{name}"
+
+
+def test_spec_bytes_are_stored_as_received(server, tmp_path, executor):
+    body = SPEC.encode("iso-8859-1")
+    url = _serve_plugin(server, "cafe", body, "application/yaml; charset=iso-8859-1")
+    cache = SpecCache(str(tmp_path))
+    plugin = load_plugins([url], cache=cache, executor=executor)[url]
+    assert isinstance(plugin, PluginObject)
+    assert list(plugin.operation_details_dict) == ["menu"]
+    entry = cache.lookup(f"{url}/openapi.yaml")
+    assert cache.load_body(entry) == body
+    assert cache.load_parsed(entry)["info"]["title"] == "Café"
+
+
+def test_parse_failure_in_a_worker_is_returned(server, tmp_path, executor):
+    good = _serve_plugin(server, "good", SPEC.encode(), "application/yaml")
+    bad = _serve_plugin(server, "bad", b"paths: [unclosed", "application/yaml")
+    results = load_plugins([bad, good], cache=SpecCache(str(tmp_path)), executor=executor)
+    assert list(results) == [bad, good]
+    assert isinstance(results[bad], yaml.YAMLError)
+    assert isinstance(results[good], PluginObject)
+    # The executor given by the caller is left running
+    assert executor.submit(len, "ok").result() == 2
+
+
+def test_default_pool_is_shared(server, tmp_path):
+    url = _serve_plugin(server, "cafe", SPEC.encode(), "application/yaml")
+    assert isinstance(load_plugins([url], cache=SpecCache(str(tmp_path / "a")))[url], PluginObject)
+    pool = bulk._compiler
+    assert isinstance(load_plugins([url], cache=SpecCache(str(tmp_path / "b")))[url], PluginObject)
+    assert bulk._compiler is pool
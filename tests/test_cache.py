@@ -0,0 +1,101 @@
+import os
+import time
+
+from plugnplai.cache import SpecCache
+from plugnplai.utils import get_plugin_manifest
+
+MANIFEST_PATH = "/.well-known/ai-plugin.json"
+
+
+def test_fresh_entry_is_served_without_request(server, tmp_path):
+    cache = SpecCache(str(tmp_path), ttl=3600)
+    assert get_plugin_manifest(server.url, cache=cache) == {"name_for_model": "test"}
+    assert get_plugin_manifest(server.url, cache=cache) == {"name_for_model": "test"}
+    assert server.hits[MANIFEST_PATH] == 1
+
+
+def test_stale_entry_is_revalidated(server, tmp_path):
+    cache = SpecCache(str(tmp_path), ttl=0)
+    assert get_plugin_manifest(server.url, cache=cache) == {"name_for_model": "test"}
+    assert get_plugin_manifest(server.url, cache=cache) == {"name_for_model": "test"}
+    assert server.hits[MANIFEST_PATH] == 2
+    assert server.request_headers[MANIFEST_PATH]["If-None-Match"] == '"v1"'
+    entry = cache.lookup(server.url + MANIFEST_PATH)
+    assert entry["etag"] == '"v1"'
+
+
+def test_stale_entry_is_served_when_the_server_is_down(server, tmp_path):
+    cache = SpecCache(str(tmp_path), ttl=0)
+    url = server.url
+    get_plugin_manifest(url, cache=cache)
+    server.shutdown()
+    server.server_close()
+    assert get_plugin_manifest(url, cache=cache) == {"name_for_model": "test"}
+
+
+def test_store_and_lookup(tmp_path):
+    cache = SpecCache(str(tmp_path))
+    entry = cache.store("http://example.com/openapi.json", b'{"a": 1}', {"a": 1},
+                        {"ETag": '"x"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    assert cache.lookup("http://example.com/openapi.json") == entry
+    assert cache.is_fresh(entry)
+    assert cache.load_parsed(entry) == {"a": 1}
+    assert cache.load_body(entry) == b'{"a": 1}'
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"x"',
+                                                "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    cache.clear()
+    assert cache.lookup("http://example.com/openapi.json") is None
+
+
+def _age(cache, seconds):
+    """Move the modification times of every file of the cache back."""
+    past = time.time() - seconds
+    for directory in (cache._entries_dir, cache._objects_dir):
+        for name in os.listdir(directory):
+            os.utime(os.path.join(directory, name), (past, past))
+
+
+def _store(cache, name):
+    return cache.store(f"http://example.com/{name}.json", name.encode() * 100, {"name": name})
+
+
+def test_store_does_not_rescan_the_objects_on_every_write(tmp_path, monkeypatch):
+    cache = SpecCache(str(tmp_path))
+    scans = []
+    objects_size = cache._objects_size
+    monkeypatch.setattr(cache, "_objects_size", lambda: scans.append(1) or objects_size())
+    for i in range(250):
+        _store(cache, f"doc{i}")
+    # The first store and every hundredth
+    assert len(scans) == 3
+    assert cache._size == objects_size()
+
+
+def test_prune_evicts_the_least_recently_used_entries(tmp_path):
+    cache = SpecCache(str(tmp_path))
+    for name in ("a", "b", "c"):
+        _store(cache, name)
+        _age(cache, 100)
+    cache.lookup("http://example.com/a.json")
+    size = cache._objects_size() // 3
+    cache.max_bytes = 2 * size
+    _store(cache, "d")
+    assert cache.lookup("http://example.com/b.json") is None
+    assert cache.lookup("http://example.com/c.json") is None
+    for name in ("a", "d"):
+        assert cache.load_parsed(cache.lookup(f"http://example.com/{name}.json")) == {"name": name}
+    assert cache._objects_size() == 2 * size
+
+
+def test_prune_keeps_the_objects_of_a_store_in_progress(tmp_path):
+    cache = SpecCache(str(tmp_path), max_bytes=0)
+    # A concurrent store wrote its objects but not its entry yet
+    content_hash = cache._hash(b"new")
+    cache._write_atomic(cache._object_path(content_hash, ".body"), b"new")
+    cache._write_atomic(cache._object_path(content_hash, ".json"), b"{}")
+    cache.prune()
+    assert sorted(os.listdir(cache._objects_dir)) == [content_hash + ".body", content_hash + ".json"]
+    # Once older than the grace period, unreferenced objects are removed
+    _age(cache, 60)
+    cache.prune()
+    assert os.listdir(cache._objects_dir) == []
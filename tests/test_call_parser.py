@@ -0,0 +1,42 @@
+import pytest
+
+from plugnplai.call_parser import APICallParser
+from plugnplai.utils import parse_llm_calls, parse_llm_response
+
+RESPONSE = ('Let me check. <API>weather.getForecast({"city": "Paris"})</API> and '
+            '<API>not a call</API> then <API>shop.search({\'q\': "shoes"})</API> done.')
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(RESPONSE)])
+def test_chunks_give_the_calls_of_the_whole_response(size):
+    parser = APICallParser()
+    calls = []
+    for start in range(0, len(RESPONSE), size):
+        calls += parser.feed(RESPONSE[start:start + size])
+    assert calls == parser.calls == parse_llm_calls(RESPONSE)
+    assert parser.text == RESPONSE
+    assert [call["operation_id"] for call in calls] == ["getForecast", "search"]
+    assert calls[1]["parameters"] == {"q": "shoes"}
+
+
+def test_call_is_returned_when_its_closing_tag_arrives():
+    parser = APICallParser()
+    assert parser.feed('<API>weather.getForecast({"city": "Paris"})</AP') == []
+    assert parser.feed('I>') == [{"plugin_name": "weather", "operation_id": "getForecast",
+                                  "parameters": {"city": "Paris"}}]
+    assert parser.feed(' <API>weather.getForecast({})') == []
+    assert len(parser.calls) == 1
+
+
+@pytest.mark.parametrize("response, expected", [
+    ('<API>nope</API><API>a.b({})</API>', [{"plugin_name": "a", "operation_id": "b", "parameters": {}}]),
+    ('<API><API>a.b({})</API>', []),
+    ('<API>a.b({"x": 1})</API> <API>c.d(x=1)</API>', [{"plugin_name": "a", "operation_id": "b", "parameters": {"x": 1}},
+                                                       {"plugin_name": "c", "operation_id": "d", "parameters": {}}]),
+    ('No call here.', []),
+])
+def test_parsers_agree(response, expected):
+    parser = APICallParser()
+    parser.feed(response)
+    assert parse_llm_calls(response) == parser.calls == expected
+    assert parse_llm_response(response) == (expected[0] if expected else {})
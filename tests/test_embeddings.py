@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pytest
+
+from plugnplai.embeddings import HashingEmbeddings, PluginRetriever
+
+
+class _CountingEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings counting the texts embedded."""
+
+    def __init__(self):
+        super().__init__(n_features=256)
+        self.documents = 0
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        return super().embed_query(text)
+
+    def embed_queries(self, texts):
+        self.queries += len(texts)
+        return super().embed_queries(texts)
+
+
+class _LangChainEmbeddings(_CountingEmbeddings):
+    """Embeddings with only the LangChain interface."""
+
+    embed_queries = None
+
+
+class OpenAIEmbeddings(_LangChainEmbeddings):
+    """Stand-in for the LangChain OpenAIEmbeddings, counting the backend calls."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def _manifest(name, description):
+    return {"name_for_model": name, "description_for_model": description}
+
+
+MANIFESTS = [
+    _manifest("weather", "Get the weather forecast of a city."),
+    _manifest("shop", "Search products to buy in the online shop."),
+    _manifest("news", "Read the latest news headlines."),
+]
+
+
+def _saved(index_path):
+    return sorted(os.listdir(index_path))
+
+
+@pytest.fixture(params=["numpy", "faiss"])
+def engine(request):
+    if request.param == "faiss":
+        pytest.importorskip("faiss")
+        pytest.importorskip("langchain")
+    return request.param
+
+
+def test_retrieve(engine):
+    retriever = PluginRetriever([dict(m) for m in MANIFESTS], returnList=["w", "s", "n"],
+                                embeddings=HashingEmbeddings(), engine=engine)
+    assert retriever.retrieve_names("weather forecast in Paris")[0] == "weather"
+    assert retriever.retrieve_urls("buy shoes in the shop")[0] == "s"
+
+
+def test_index_is_loaded_from_disk(engine, tmp_path):
+    index_path = str(tmp_path)
+    embeddings = _CountingEmbeddings()
+    PluginRetriever([dict(m) for m in MANIFESTS], embeddings=embeddings, index_path=index_path, engine=engine)
+    assert embeddings.documents == 3
+
+    retriever = PluginRetriever([dict(m) for m in MANIFESTS], returnList=["w", "s", "n"], embeddings=embeddings,
+                                index_path=index_path, engine=engine)
+    assert embeddings.documents == 3
+    # The returned objects are the current ones, not the saved ones
+    assert retriever.retrieve_urls("weather forecast in Paris")[0] == "w"
+
+    # Only the changed manifest is embedded again
+    changed = [dict(m) for m in MANIFESTS]
+    changed[2] = _manifest("news", "Read the sports results.")
+    PluginRetriever(changed, embeddings=embeddings, index_path=index_path, engine=engine)
+    assert embeddings.documents == 4
+
+
+def test_updates_replace_the_saved_index(engine, tmp_path):
+    index_path = str(tmp_path)
+    embeddings = _CountingEmbeddings()
+    retriever = PluginRetriever([dict(m) for m in MANIFESTS], embeddings=embeddings, index_path=index_path,
+                                engine=engine)
+    cache = "embeddings-_CountingEmbeddings-256.npz"
+    assert _saved(index_path) == [cache, "index"]
+
+    retriever.add_manifests([_manifest("maps", "Find directions on a map.")])
+    retriever.update_manifest(_manifest("shop", "Compare the prices of products."))
+    retriever.remove_plugins(["weather"])
+    assert _saved(index_path) == [cache, "index"]
+    with np.load(os.path.join(index_path, cache)) as saved:
+        assert len(saved["keys"]) == 3
+
+    documents = embeddings.documents
+    reloaded = PluginRetriever([_manifest("news", MANIFESTS[2]["description_for_model"]),
+                                _manifest("maps", "Find directions on a map."),
+                                _manifest("shop", "Compare the prices of products.")],
+                               embeddings=embeddings, index_path=index_path, engine=engine)
+    assert embeddings.documents == documents
+    assert reloaded.retrieve_names("find directions on a map")[0] == "maps"
+
+
+@pytest.mark.parametrize("embeddings_class", [_CountingEmbeddings, _LangChainEmbeddings])
+def test_batch_queries_are_embedded_as_queries(embeddings_class):
+    embeddings = embeddings_class()
+    retriever = PluginRetriever([dict(m) for m in MANIFESTS], embeddings=embeddings, engine="numpy")
+    documents = embeddings.documents
+    results = retriever.retrieve_names_batch(["weather forecast in Paris", "latest news headlines"], k=1)
+    assert [names[0][0] for names in results] == ["weather", "news"]
+    assert embeddings.documents == documents
+    assert embeddings.queries == 2
+
+
+def test_batch_queries_are_embedded_in_one_call_by_symmetric_backends():
+    embeddings = OpenAIEmbeddings()
+    retriever = PluginRetriever([dict(m) for m in MANIFESTS], embeddings=embeddings, engine="numpy")
+    calls = embeddings.calls
+    queries = ["weather forecast in Paris", "latest news headlines", "buy shoes online"]
+    results = retriever.retrieve_names_batch(queries, k=1)
+    assert [names[0][0] for names in results] == ["weather", "news", "shop"]
+    assert embeddings.calls == calls + 1
+    assert embeddings.queries == 0
@@ -0,0 +1,131 @@
+import sys
+
+import pytest
+
+from plugnplai.instrumentation import (
+    CALL_DURATION,
+    CALL_ERRORS,
+    CALLS,
+    CallbackInstrumentation,
+    InMemoryMetrics,
+    OpenTelemetryInstrumentation,
+    get_instrumentation,
+    set_instrumentation,
+    span,
+)
+
+
+@pytest.fixture
+def instrument():
+    """Set an instrumentation for the test only."""
+    yield set_instrumentation
+    set_instrumentation(None)
+
+
+def test_spans_are_noop_by_default():
+    with span("stage", size=1) as s:
+        s.set_attribute("other", 2)
+    assert type(get_instrumentation()).__name__ == "_NoopInstrumentation"
+
+
+def test_callback_receives_start_end_and_error(instrument):
+    events = []
+    instrument(CallbackInstrumentation(
+        on_span=lambda name, attributes, duration, error: events.append(("end", name, dict(attributes), error)),
+        on_span_start=lambda name, attributes: events.append(("start", name, dict(attributes))),
+    ))
+    error = ValueError("bad spec")
+    with span("outer", url="u"):
+        with span("inner") as inner:
+            inner.set_attribute("size", 3)
+        with pytest.raises(ValueError):
+            with span("failing"):
+                raise error
+    assert events == [
+        ("start", "outer", {"url": "u"}),
+        ("start", "inner", {}),
+        ("end", "inner", {"size": 3}, None),
+        ("start", "failing", {}),
+        ("end", "failing", {}, error),
+        ("end", "outer", {"url": "u"}, None),
+    ]
+
+
+def test_nested_spans_are_timed(instrument):
+    durations = {}
+    instrument(CallbackInstrumentation(
+        on_span=lambda name, attributes, duration, error: durations.setdefault(name, duration)))
+    with span("outer"):
+        with span("inner"):
+            sum(range(10000))
+    assert 0 < durations["inner"] <= durations["outer"]
+
+
+def test_call_metrics(instrument, server, plugins):
+    metrics = InMemoryMetrics()
+    instrument(metrics)
+    assert plugins.call_api("test", "ok", {}).status_code == 200
+    assert plugins.call_api("test", "fail", {}).status_code == 500
+
+    stats = metrics.plugin_stats()["test"]
+    assert (stats["count"], stats["errors"], stats["error_rate"]) == (2, 1, 0.5)
+    assert metrics.stage_stats()["plugnplai.call"]["count"] == 2
+    ok = (("operation", "ok"), ("plugin", "test"))
+    fail = (("operation", "fail"), ("plugin", "test"))
+    assert metrics.counters == {(CALLS, ok): 1, (CALLS, fail): 1, (CALL_ERRORS, fail): 1}
+
+    histograms = metrics.histogram_stats()
+    assert set(histograms) == {(CALL_DURATION, ok), (CALL_DURATION, fail)}
+    duration = histograms[(CALL_DURATION, ok)]
+    assert duration["count"] == 1
+    assert 0 < duration["p50"] == duration["max"] <= stats["max"]
+    assert "errors" not in duration
+
+    metrics.reset()
+    assert metrics.histogram_stats() == {} and metrics.counters == {}
+
+
+def test_histogram_percentiles():
+    metrics = InMemoryMetrics(max_samples=100)
+    for value in range(1, 201):
+        metrics.histogram("size", value, {"kind": "spec"})
+    stats = metrics.histogram_stats()[("size", (("kind", "spec"),))]
+    # The percentiles are over the last max_samples values
+    assert stats == {"count": 200, "mean": 100.5, "p50": 150, "p99": 199, "max": 200}
+
+
+def test_opentelemetry_needs_the_package(monkeypatch):
+    # A None entry makes the import fail, whether the package is installed or not
+    monkeypatch.setitem(sys.modules, "opentelemetry", None)
+    with pytest.raises(ImportError, match="pip install opentelemetry-api"):
+        OpenTelemetryInstrumentation()
+
+
+def test_opentelemetry_records_spans_and_metrics(instrument):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+    reader = InMemoryMetricReader()
+    instrument(OpenTelemetryInstrumentation(tracer_provider, MeterProvider(metric_readers=[reader])))
+
+    with span("outer"):
+        with pytest.raises(ValueError):
+            with span("plugnplai.call", plugin="test", operation="ok"):
+                raise ValueError("boom")
+
+    inner, outer = exporter.get_finished_spans()
+    assert (inner.name, outer.name) == ("plugnplai.call", "outer")
+    assert inner.parent.span_id == outer.context.span_id
+    assert not inner.status.is_ok
+    names = {metric.name
+             for resource in reader.get_metrics_data().resource_metrics
+             for scope in resource.scope_metrics
+             for metric in scope.metrics}
+    assert names == {CALL_DURATION, CALLS, CALL_ERRORS}
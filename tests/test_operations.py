@@ -0,0 +1,126 @@
+import pickle
+
+import pytest
+
+from plugnplai.operations import Operation, Parameter, compile_operations
+from plugnplai.refs import RefResolver
+
+BASE_URL = "https://a.com/"
+
+PATHS = {
+    "/todos/{user}": {
+        "summary": "Todos of a user",
+        "parameters": [{"name": "user", "in": "path", "required": True, "schema": {"type": "string"}}],
+        "get": {
+            "operationId": "getTodos",
+            "parameters": [
+                {"name": "user", "in": "path", "required": True, "schema": {"type": "string"}},
+                {"name": "limit", "in": "query", "description": "Maximum number of todos",
+                 "schema": {"type": "integer"}},
+            ],
+        },
+        "post": {
+            "operationId": "addTodo",
+            "requestBody": {
+                "description": "The todo",
+                "required": True,
+                "content": {"application/json": {"schema": {
+                    "type": "object",
+                    "required": ["todo"],
+                    "properties": {"todo": {"type": "string", "description": "Text of the todo"}},
+                }}},
+            },
+        },
+        "delete": {"summary": "No operationId, skipped"},
+    },
+}
+
+
+def _baseline_operation_details(paths, base_url):
+    """PluginObject.get_operation_details before the compact model, on resolved paths."""
+    operation_details_dict = {}
+    for path, path_item in paths.items():
+        for method, operation in path_item.items():
+            current_operation_id = operation.get('operationId')
+            if current_operation_id:
+                operation_details = {
+                    'method': method,
+                    'url': f"{base_url.rstrip('/')}/{path.lstrip('/')}",
+                    'parameters': [],
+                    'requestBody': None,
+                }
+                for parameter in operation.get('parameters', []):
+                    operation_details['parameters'].append({
+                        'name': parameter['name'],
+                        'in': parameter['in'],
+                        'description': parameter.get('description'),
+                        'required': parameter.get('required', False),
+                        'type': parameter['schema'].get('type'),
+                    })
+                if 'requestBody' in operation:
+                    operation_details['requestBody'] = {
+                        'description': operation['requestBody'].get('description'),
+                        'required': operation['requestBody'].get('required', False),
+                        'content': operation['requestBody']['content'],
+                    }
+                operation_details_dict[current_operation_id] = operation_details
+    return operation_details_dict
+
+
+def _as_dict(operation):
+    """Rebuild the dict of an operation through its dict-like view."""
+    body = operation.get('requestBody')
+    return {
+        'method': operation['method'],
+        'url': operation['url'],
+        'parameters': [{key: parameter[key] for key in parameter.keys()} for parameter in operation['parameters']],
+        'requestBody': None if body is None else {key: body[key] for key in body.keys()},
+    }
+
+
+def _without_path_keys(paths):
+    """The paths without their path-level keys, which the baseline crashed on."""
+    return {path: {method: operation for method, operation in path_item.items()
+                   if method not in ("summary", "parameters")}
+            for path, path_item in paths.items()}
+
+
+def test_compile_operations_skips_path_level_keys():
+    operations = compile_operations(PATHS, BASE_URL)
+    assert list(operations) == ["getTodos", "addTodo"]
+    assert compile_operations(PATHS, BASE_URL, RefResolver({"paths": PATHS})).keys() == operations.keys()
+
+
+def test_compile_operations_agrees_with_the_baseline():
+    operations = compile_operations(PATHS, BASE_URL)
+    baseline = _baseline_operation_details(_without_path_keys(PATHS), BASE_URL)
+    assert {operation_id: _as_dict(operation) for operation_id, operation in operations.items()} == baseline
+
+
+def test_dict_access():
+    operation = compile_operations(PATHS, BASE_URL)["getTodos"]
+    assert isinstance(operation, Operation)
+    assert operation['requestBody'] is None and operation.get('requestBody', 1) is None
+    assert 'requestBody' in operation and 'operation_id' not in operation
+    assert operation.get('missing', 1) == 1
+
+    parameter = operation['parameters'][1]
+    assert isinstance(parameter, Parameter)
+    assert (parameter['in'], parameter.location) == ("query", "query")
+    assert parameter.get('required') is False
+    assert list(parameter.keys()) == ['name', 'in', 'description', 'required', 'type']
+    with pytest.raises(KeyError, match="location"):
+        parameter['location']
+
+
+def test_pickle_round_trip():
+    operations = compile_operations(PATHS, BASE_URL)
+    copies = pickle.loads(pickle.dumps(operations))
+    assert {k: _as_dict(v) for k, v in copies.items()} == {k: _as_dict(v) for k, v in operations.items()}
+    assert repr(copies["addTodo"]) == repr(operations["addTodo"])
+
+    # Strings are interned again after unpickling
+    name = copies["getTodos"].parameters[1].name
+    assert name is operations["getTodos"].parameters[1].name
+    required = copies["addTodo"].request_body.media_types[0].required
+    assert required[0] is operations["addTodo"].request_body.media_types[0].required[0]
@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
+import json
+import threading
+import time
+
+import pytest
+
+from plugnplai.plugins import PluginObject, Plugins, _knapsack, count_tokens
+from plugnplai.prompt_templates import PromptBuilder
+from plugnplai.utils import parse_llm_calls
+
+
+def _best_value(weights, values, capacity):
+    best = 0
+    for size in range(len(weights) + 1):
+        for chosen in combinations(range(len(weights)), size):
+            if sum(weights[i] for i in chosen) <= capacity:
+                best = max(best, sum(values[i] for i in chosen))
+    return best
+
+
+@pytest.mark.parametrize("weights, values, capacity", [
+    ([5, 4, 6, 3], [10, 40, 30, 50], 10),
+    ([1, 2, 3, 8, 7, 4], [20, 5, 10, 40, 15, 25], 10),
+    ([3, 3, 3], [1, 1, 1], 5),
+    ([20, 30], [1, 2], 10),
+    ([], [], 10),
+])
+def test_knapsack_is_optimal(weights, values, capacity):
+    chosen = _knapsack(weights, values, capacity)
+    assert chosen == sorted(set(chosen))
+    assert sum(weights[i] for i in chosen) <= capacity
+    assert sum(values[i] for i in chosen) == _best_value(weights, values, capacity)
+
+
+def _plugin(name, words):
+    spec = {
+        "openapi": "3.0.1",
+        "info": {"title": name, "version": "1"},
+        "servers": [{"url": f"http://{name}.example.com"}],
+        "paths": {"/search": {"get": {"operationId": "search", "summary": "Search."}}},
+    }
+    description = " ".join(["word"] * words)
+    manifest = {"name_for_model": name, "description_for_model": description, "auth": {"type": "none"}}
+    return PluginObject(f"http://{name}.example.com", spec, manifest)
+
+
+@pytest.fixture
+def catalog():
+    return Plugins([_plugin("small", 10), _plugin("medium", 40), _plugin("large", 200)])
+
+
+def test_select_within_budget_fits_the_budget(catalog):
+    scores = {"small": 1.0, "medium": 2.0, "large": 3.0}
+    everything, _, _ = catalog.select_within_budget(scores, 100000)
+    base = count_tokens(catalog.prompt_for([]))
+    for budget in (count_tokens(everything), base + 100, base + 30, base + 5):
+        prompt, tokens, selected = catalog.select_within_budget(scores, budget)
+        assert tokens == count_tokens(prompt) <= budget
+        assert selected == sorted(selected, key=scores.get, reverse=True)
+    assert catalog.select_within_budget(scores, count_tokens(everything))[2] == ["large", "medium", "small"]
+
+
+def test_select_within_budget_maximizes_the_scores(catalog):
+    # large alone scores less than medium and small together
+    scores = {"small": 2.0, "medium": 2.5, "large": 3.0}
+    budget = count_tokens(catalog.prompt_for(["medium", "small"])) + 5
+    assert catalog.select_within_budget(scores, budget)[2] == ["medium", "small"]
+
+
+def test_select_within_budget_ignores_unusable_plugins(catalog):
+    prompt, tokens, selected = catalog.select_within_budget(["small", "unknown"], 100000)
+    assert selected == ["small"]
+    assert catalog.select_within_budget({"small": 0, "medium": -1}, 100000)[2] == []
+    assert catalog.select_within_budget({"small": 1.0}, 0)[2] == []
+
+
+def test_select_within_budget_activates(catalog):
+    prompt, tokens, selected = catalog.select_within_budget({"small": 1.0, "medium": 2.0}, 100000, activate=True)
+    assert list(catalog.active_plugins) == selected == ["medium", "small"]
+    assert catalog.prompt == prompt and catalog.tokens == tokens
+
+
+def test_incremental_token_count_matches_the_prompt(catalog):
+    assert catalog.count_prompt_tokens() == count_tokens(catalog.prompt_for([]))
+    for action, name in [("activate", "medium"), ("activate", "large"), ("activate", "small"),
+                         ("deactivate", "large"), ("activate", "unknown"), ("deactivate", "medium"),
+                         ("deactivate", "small")]:
+        getattr(catalog, action)(name)
+        assert catalog.tokens == catalog.count_prompt_tokens() == count_tokens(catalog.prompt)
+        for names in (["small"], ["large", "medium"]):
+            assert catalog.count_prompt_tokens(names) == count_tokens(catalog.fill_prompt(catalog.template, names))
+
+
+def test_prompt_builder_is_thread_safe():
+    builder = PromptBuilder("Plugins:\n{{plugins}}End")
+    descriptions = [f"Plugin {i}." for i in range(200)]
+    expected = builder.build(descriptions)
+    assert expected.startswith("Plugins:\n### Plugin 1\nPlugin 0.\n\n### Plugin 2\n")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        prompts = list(executor.map(lambda n: PromptBuilder(builder.template).build(descriptions[:n]),
+                                    range(200, 0, -1)))
+    assert all(expected.startswith(prompt[:-len("End")]) for prompt in prompts)
+
+
+def _routing_plugin(url, auth="none"):
+    parameters = [
+        {"name": "user", "in": "path", "required": True, "schema": {"type": "string"}},
+        {"name": "q", "in": "query", "schema": {"type": "string"}},
+        {"name": "limit", "in": "query", "schema": {"type": "integer"}},
+        {"name": "X-Trace", "in": "header", "schema": {"type": "string"}},
+        {"name": "session", "in": "cookie", "schema": {"type": "string"}},
+    ]
+    body = {"content": {"application/json": {"schema": {
+        "type": "object",
+        "properties": {"title": {"type": "string"}, "tags": {"type": "array", "items": {"type": "string"}}},
+        "required": ["title"],
+    }}}}
+    paths = {"/users/{user}/items": {"get": {"operationId": "list", "parameters": parameters}}}
+    for method in ("post", "put", "patch", "delete"):
+        paths[f"/{method}/{{user}}/{{user}}"] = {method: {
+            "operationId": method, "parameters": parameters[:1], "requestBody": body}}
+    spec = {"openapi": "3.0.1", "info": {"title": "routing", "version": "1"}, "servers": [{"url": url}],
+            "paths": paths}
+    manifest = {"name_for_model": "routing", "description_for_model": "Routing.", "auth": {"type": auth}}
+    return PluginObject(url, spec, manifest)
+
+
+def test_call_plan_routes_the_parameters():
+    plugin = _routing_plugin("http://api.example.com")
+    request = plugin._prepare_request(
+        "list", {"user": "ann", "q": "shoes", "X-Trace": "t1", "session": "s1", "other": 1})
+    assert request == {
+        "method": "GET",
+        "url": "http://api.example.com/users/ann/items",
+        "params": {"q": "shoes"},
+        "headers": {"X-Trace": "t1"},
+        "cookies": {"session": "s1"},
+        "json": None,
+    }
+    # The plan is compiled once per operation
+    assert plugin._call_plan("list") is plugin._call_plan("list")
+    assert plugin._prepare_request("missing", {}) is None
+
+
+def test_call_plan_fills_repeated_path_parameters():
+    plugin = _routing_plugin("http://api.example.com")
+    request = plugin._prepare_request("put", {"user": 7, "title": "t"})
+    assert request["url"] == "http://api.example.com/put/7/7"
+
+
+def test_call_plan_bearer_auth():
+    plugin = _routing_plugin("http://api.example.com", auth="service_http")
+    headers = plugin._prepare_request("list", {"user": "ann"}, api_key="secret")["headers"]
+    assert headers == {"Authorization": "Bearer secret", "Accept": "application/json"}
+    headers = plugin._prepare_request("post", {"user": "ann", "title": "t"}, api_key="secret")["headers"]
+    assert headers["Authorization"] == "Bearer secret"
+    assert headers["Content-Type"] == "application/json"
+
+
+@pytest.mark.parametrize("method", ["post", "put", "patch", "delete"])
+def test_call_plan_sends_the_parameters_as_json(server, method):
+    plugin = _routing_plugin(server.url)
+    parameters = {"user": "ann", "title": "Notes", "tags": ["a", "b"]}
+    response = plugin.call_operation(method, parameters)
+    assert response.status_code == 200
+    sent_method, path, headers, body = server.requests[-1]
+    assert (sent_method, path) == (method.upper(), f"/{method}/ann/ann")
+    assert headers["Content-Type"] == "application/json"
+    assert json.loads(body) == parameters
+
+
+def test_call_plan_sends_no_body_with_get(server):
+    plugin = _routing_plugin(server.url)
+    response = plugin.call_operation("list", {"user": "ann", "q": "shoes", "limit": 3})
+    assert response.status_code == 200
+    method, path, headers, body = server.requests[-1]
+    assert (method, path, body) == ("GET", "/users/ann/items?q=shoes&limit=3", b"")
+    assert "Content-Type" not in headers
+
+
+def test_call_plan_reports_a_missing_required_parameter(capsys):
+    plugin = _routing_plugin("http://api.example.com")
+    # As before, the call is still made without it
+    request = plugin._prepare_request("post", {"user": "ann", "tags": []})
+    assert capsys.readouterr().out == "Required parameter title is missing\n"
+    assert request["json"] == {"user": "ann", "tags": []}
+
+
+@pytest.fixture
+def letters(server):
+    """Active plugins "letters", whose GET operations a, b and c answer their letter, and "down"."""
+    for op in "abc":
+        server.routes[f"/{op}"] = (200, {}, f'"{op}"'.encode())
+    spec = {"openapi": "3.0.1", "info": {"title": "letters", "version": "1"}, "servers": [{"url": server.url}],
+            "paths": {f"/{op}": {"get": {"operationId": op}} for op in "abc"}}
+    manifest = {"name_for_model": "letters", "description_for_model": "Letters.", "auth": {"type": "none"}}
+    # Nothing listens on port 9 of localhost
+    down = dict(spec, servers=[{"url": "http://127.0.0.1:9"}])
+    plugins = Plugins([PluginObject(server.url, spec, manifest),
+                       PluginObject("http://127.0.0.1:9", down, dict(manifest, name_for_model="down"))])
+    plugins.active_plugins.update(plugins.installed_plugins)
+    return plugins
+
+
+LLM_CALLS = "<API>letters.a({})</API> <API>letters.b({})</API> <API>letters.c({})</API>"
+
+
+def test_call_apis_keeps_the_order_of_the_llm(server, letters):
+    # The calls finish in the order c, b, a
+    server.latency.update({"/a": 0.6, "/b": 0.3})
+    calls = parse_llm_calls(LLM_CALLS)
+    start = time.monotonic()
+    results = letters.call_apis(calls)
+    assert time.monotonic() - start < 0.9
+    assert results == [(call, f'"{call["operation_id"]}"') for call in calls]
+
+
+def test_call_apis_timeout(server, letters):
+    server.latency["/b"] = 2
+    calls = parse_llm_calls(LLM_CALLS)
+    start = time.monotonic()
+    results = letters.call_apis(calls, timeout=0.5)
+    assert time.monotonic() - start < 1.5
+    assert [response for _, response in results] == ['"a"', None, '"c"']
+
+    # call_timeout is the default
+    letters.call_timeout = 0.5
+    assert [response for _, response in letters.call_apis(calls)] == ['"a"', None, '"c"']
+
+
+def test_call_apis_isolates_the_failures(server, letters, monkeypatch):
+    plugin = letters.active_plugins["letters"]
+    prepare = plugin._prepare_request
+
+    def prepare_request(operation_id, *args):
+        if operation_id == "c":
+            raise RuntimeError("bug")
+        return prepare(operation_id, *args)
+
+    # An unexpected error in c, a connection error, an unknown plugin and an unknown operation
+    monkeypatch.setattr(plugin, "_prepare_request", prepare_request)
+    calls = parse_llm_calls(LLM_CALLS + " <API>down.a({})</API> <API>missing.a({})</API> <API>letters.z({})</API>")
+    results = letters.call_apis(calls)
+    assert [response for _, response in results] == ['"a"', '"b"', None, None, None, None]
+    assert server.hits["/a"] == server.hits["/b"] == 1
+
+
+def _serve_plugin(server, name):
+    """Serve plugin ``name`` under /name."""
+    spec = {"openapi": "3.0.1", "info": {"title": name, "version": "1"}, "servers": [{"url": server.url}],
+            "paths": {"/ok": {"get": {"operationId": "ok"}}}}
+    manifest = {"name_for_model": name, "description_for_model": f"Plugin {name}.", "auth": {"type": "none"},
+                "api": {"url": f"{server.url}/{name}/openapi.json"}}
+    server.routes[f"/{name}/.well-known/ai-plugin.json"] = (200, {}, json.dumps(manifest).encode())
+    server.routes[f"/{name}/openapi.json"] = (200, {}, json.dumps(spec).encode())
+    return f"{server.url}/{name}"
+
+
+def _install_threads():
+    return {thread for thread in threading.enumerate() if thread.name.startswith("ThreadPoolExecutor")}
+
+
+def test_install_deadline(server):
+    urls = [_serve_plugin(server, name) for name in ("fast", "slow", "other")]
+    server.latency["/slow/.well-known/ai-plugin.json"] = 3
+    threads = _install_threads()
+    plugins = Plugins([])
+    start = time.monotonic()
+    results = plugins.install_plugins(urls, timeout=0.5)
+    assert time.monotonic() - start < 1
+    assert results[urls[0]] is None and results[urls[2]] is None
+    assert isinstance(results[urls[1]], Exception)
+    assert list(plugins.installed_plugins) == ["fast", "other"]
+    assert plugins.install_errors == {urls[1]: results[urls[1]]}
+    # The download of the slow plugin stopped at the deadline as well
+    time.sleep(0.5)
+    assert _install_threads() <= threads
+
+
+def test_install_keeps_the_order_of_the_urls(server):
+    names = ["c", "a", "b"]
+    urls = [_serve_plugin(server, name) for name in names]
+    # The plugins finish in the order b, a, c
+    server.latency.update({"/c/openapi.json": 0.4, "/a/openapi.json": 0.2})
+    plugins = Plugins([])
+    results = plugins.install_plugins(urls, max_workers=3)
+    assert list(results) == urls
+    assert list(plugins.installed_plugins) == names
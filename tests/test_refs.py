@@ -0,0 +1,52 @@
+import pytest
+
+from plugnplai.refs import RefResolver
+
+SPEC = {
+    "components": {"schemas": {
+        "Node": {"type": "object", "properties": {
+            "value": {"type": "string"},
+            "children": {"type": "array", "items": {"$ref": "#/components/schemas/Node"}},
+        }},
+        "Alias": {"$ref": "#/components/schemas/Node"},
+        "Loop": {"$ref": "#/components/schemas/Loop2"},
+        "Loop2": {"$ref": "#/components/schemas/Loop"},
+    }},
+}
+
+
+def test_recursive_schema_contains_itself():
+    resolver = RefResolver(SPEC)
+    node = resolver.resolve({"$ref": "#/components/schemas/Node"})
+    assert node["properties"]["children"]["items"] is node
+    alias = resolver.resolve({"$ref": "#/components/schemas/Alias"})
+    assert alias["properties"]["children"]["items"] is node
+    # The document is left unresolved
+    assert SPEC["components"]["schemas"]["Alias"] == {"$ref": "#/components/schemas/Node"}
+
+
+def test_deref_follows_chains():
+    resolver = RefResolver(SPEC)
+    target = resolver.deref({"$ref": "#/components/schemas/Alias"})
+    assert target is SPEC["components"]["schemas"]["Node"]
+
+
+def test_circular_chain_of_references_raises():
+    resolver = RefResolver(SPEC)
+    with pytest.raises(ValueError, match="Circular"):
+        resolver.deref({"$ref": "#/components/schemas/Loop"})
+    with pytest.raises(ValueError, match="Circular"):
+        resolver.resolve({"$ref": "#/components/schemas/Loop"})
+
+
+def test_unresolvable_reference_raises():
+    with pytest.raises(ValueError, match="Unresolvable"):
+        RefResolver(SPEC).resolve({"$ref": "#/components/schemas/Missing"})
+
+
+def test_cyclic_document_is_copied():
+    # A spec already resolved by jsonref contains itself
+    node = {"type": "object", "properties": {}}
+    node["properties"]["self"] = node
+    copy = RefResolver({}).resolve(node)
+    assert copy is not node and copy["properties"]["self"] is copy
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from plugnplai.resilience import CallGuard, CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+def test_timeout_returns_none_and_counts_a_failure(server, plugins):
+    plugins.call_guard = CallGuard(timeout=0.5)
+    start = time.monotonic()
+    assert plugins.call_api("test", "hang", {}) is None
+    assert time.monotonic() - start < 1.5
+    assert server.hits["/hang"] == 1
+    assert plugins.call_guard.breaker("test").failures == 1
+
+
+
+def test_timeout_covers_a_slow_body(server, plugins):
+    # The headers come at once and the body takes 2 s
+    plugins.call_guard = CallGuard(timeout=0.5)
+    start = time.monotonic()
+    assert plugins.call_api("test", "slow", {}) is None
+    assert time.monotonic() - start < 1
+    assert plugins.call_guard.breaker("test").failures == 1
+
+
+def test_timed_call_keeps_the_body(server, plugins):
+    plugins.call_guard = CallGuard(timeout=5)
+    response = plugins.call_api("test", "slow", {})
+    assert response.status_code == 200
+    assert response.content == b'"xxxxxxxx"' * 20
+    assert plugins.call_api("test", "ok", {}).json() == {"ok": True}
+    assert plugins.call_guard.breaker("test").failures == 0
+
+def test_failed_status_is_sent_once(server, plugins):
+    plugins.call_guard = CallGuard(rate=100)
+    response = plugins.call_api("test", "fail", {})
+    assert response.status_code == 500
+    assert server.hits["/fail"] == 1
+    assert plugins.call_guard.breaker("test").failures == 1
+
+
+def test_retry_after_does_not_hold_the_caller(server, plugins):
+    start = time.monotonic()
+    response = plugins.call_api("test", "throttle", {})
+    assert response.status_code == 429
+    assert time.monotonic() - start < 1
+    assert server.hits["/throttle"] == 1
+
+
+def test_async_timeout_returns_none_and_counts_a_failure(server, plugin):
+    pytest.importorskip("httpx")
+    from plugnplai.async_plugins import AsyncPlugins
+
+    async def main():
+        plugins = AsyncPlugins([plugin])
+        plugins.active_plugins["test"] = plugins.installed_plugins["test"]
+        plugins.call_guard = CallGuard(timeout=0.5)
+        start = time.monotonic()
+        assert await plugins.acall_api("test", "hang", {}) is None
+        assert time.monotonic() - start < 1.5
+        assert plugins.call_guard.breaker("test").failures == 1
+
+    asyncio.run(main())
+    assert server.hits["/hang"] == 1
+
+
+def test_token_bucket_spaces_the_calls():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_circuit_breaker_opens_after_repeated_failures():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_time=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_circuit_breaker_lets_one_probe_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_time=0.05)
+    breaker.record_failure()
+    time.sleep(0.1)
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()
+    # A cancelled probe gives its place back
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.1)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_open_circuit_fails_fast(server, plugins):
+    plugins.call_guard = CallGuard(failure_threshold=1, recovery_time=60)
+    assert plugins.call_api("test", "fail", {}).status_code == 500
+    assert plugins.call_guard.breaker_states() == {"test": "open"}
+    assert plugins.call_api("test", "ok", {}) is None
+    assert server.hits["/ok"] == 0
+    assert plugins.available_plugins() == []
+    with pytest.raises(CircuitOpenError):
+        plugins.installed_plugins["test"].call_operation("ok", {}, guard=plugins.call_guard)
+
+
+def test_operation_timeouts():
+    guard = CallGuard(timeout=30, operation_timeouts={"shop.search": 5, "search": 10})
+    assert guard.timeout_for("shop", "search") == 5
+    assert guard.timeout_for("news", "search") == 10
+    assert guard.timeout_for("news", "latest") == 30
+    assert guard.timeout_for("shop", "search", 1) == 1
+
+
+def test_calls_are_unguarded_by_default(server, plugins):
+    assert plugins.call_guard is None
+    for _ in range(6):
+        assert plugins.call_api("test", "fail", {}).status_code == 500
+    assert plugins.available_plugins() == ["test"]
+    assert plugins.call_api("test", "ok", {}).status_code == 200
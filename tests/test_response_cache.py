@@ -0,0 +1,108 @@
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from plugnplai.response_cache import ResponseCache
+
+REQUEST = {"method": "get", "url": "http://example.com/items", "headers": {}}
+
+
+def _response(status_code=200, body=b'{"items": []}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers or {})
+    response._content = body
+    response._content_consumed = True
+    response.url = REQUEST["url"]
+    return response
+
+
+class _Server:
+    """send function counting the requests, answering with a fixed response."""
+
+    def __init__(self, headers=None, delay=0.0):
+        self.headers = headers or {}
+        self.delay = delay
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        time.sleep(self.delay)
+        if "ETag" in self.headers and request["headers"].get("If-None-Match") == self.headers["ETag"]:
+            return _response(304, b"", self.headers)
+        return _response(headers=self.headers)
+
+
+def _fetch(cache, send, parameters=None, method="get"):
+    return cache.fetch("shop", "search", parameters or {"q": "shoes"}, None, dict(REQUEST, method=method), send)
+
+
+def test_fresh_response_is_served_from_memory():
+    cache, send = ResponseCache(ttl=60), _Server()
+    assert _fetch(cache, send).json() == {"items": []}
+    assert _fetch(cache, send).json() == {"items": []}
+    assert len(send.requests) == 1
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    _fetch(cache, send, {"q": "hats"})
+    assert len(send.requests) == 2
+
+
+def test_cache_control():
+    send = _Server({"Cache-Control": "max-age=60"})
+    cache = ResponseCache(ttl=0)
+    _fetch(cache, send)
+    _fetch(cache, send)
+    assert len(send.requests) == 1
+
+    for headers in ({"Cache-Control": "no-store"}, {"Cache-Control": "no-cache"}, {"Cache-Control": "max-age=0"}):
+        send = _Server(headers)
+        cache = ResponseCache(ttl=60)
+        _fetch(cache, send)
+        _fetch(cache, send)
+        assert len(send.requests) == 2, headers
+
+
+def test_stale_response_is_revalidated():
+    send = _Server({"Cache-Control": "max-age=0", "ETag": '"v1"'})
+    cache = ResponseCache()
+    _fetch(cache, send)
+    response = _fetch(cache, send)
+    assert response.status_code == 200 and response.json() == {"items": []}
+    assert send.requests[1]["headers"]["If-None-Match"] == '"v1"'
+    assert cache.stats["revalidated"] == 1
+
+
+def test_only_idempotent_methods_are_cached():
+    cache, send = ResponseCache(), _Server()
+    _fetch(cache, send, method="post")
+    _fetch(cache, send, method="post")
+    assert len(send.requests) == 2
+
+
+def test_concurrent_misses_are_coalesced():
+    cache, send = ResponseCache(), _Server(delay=0.2)
+    start = threading.Barrier(8)
+    responses = []
+
+    def fetch():
+        start.wait()
+        responses.append(_fetch(cache, send))
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(send.requests) == 1
+    assert cache.stats["coalesced"] == 7
+    assert all(response.json() == {"items": []} for response in responses)
+
+
+def test_sqlite_tier_is_shared(tmp_path):
+    path = str(tmp_path / "responses.db")
+    send = _Server()
+    _fetch(ResponseCache(sqlite_path=path), send)
+    assert _fetch(ResponseCache(sqlite_path=path), send).json() == {"items": []}
+    assert len(send.requests) == 1
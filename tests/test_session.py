@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+import pytest
+
+from plugnplai.session import configure_session, get_async_client
+
+httpx = pytest.importorskip("httpx")
+
+
+@pytest.fixture(autouse=True)
+def default_session():
+    yield
+    configure_session()
+
+
+async def _client(server):
+    client = get_async_client()
+    # Open a pooled connection
+    assert (await client.get(server.url + "/ok")).status_code == 200
+    return client
+
+
+def test_configure_session_closes_the_clients_of_idle_loops(server):
+    loop = asyncio.new_event_loop()
+    try:
+        client = loop.run_until_complete(_client(server))
+        configure_session(pool_maxsize=5)
+        assert client.is_closed
+        assert loop.run_until_complete(_client(server)) is not client
+    finally:
+        loop.close()
+
+
+def test_configure_session_closes_the_clients_of_running_loops(server):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        client = asyncio.run_coroutine_threadsafe(_client(server), loop).result(5)
+        configure_session(pool_maxsize=5)
+        # The client is closed by a task on its loop
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), loop).result(5)
+        assert client.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+def test_configure_session_from_a_coroutine(server):
+    async def main():
+        client = await _client(server)
+        configure_session(pool_maxsize=5)
+        await asyncio.sleep(0.1)
+        assert client.is_closed
+        assert await _client(server) is not client
+
+    asyncio.run(main())
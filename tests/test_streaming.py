@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+import requests
+
+from plugnplai.streaming import (
+    aiter_response,
+    aread_response,
+    iter_json_lines,
+    iter_response,
+    read_response,
+    truncation_note,
+)
+
+TEXT = {"Content-Type": "text/plain; charset=utf-8"}
+
+
+def _get(server, path):
+    return requests.get(server.url + path, stream=True)
+
+
+def _read_sync(server, path, max_bytes):
+    return read_response(_get(server, path), max_bytes=max_bytes, chunk_size=4)
+
+
+def _read_async(server, path, max_bytes):
+    httpx = pytest.importorskip("httpx")
+
+    async def main():
+        async with httpx.AsyncClient() as client:
+            response = await client.send(client.build_request("GET", server.url + path), stream=True)
+            return await aread_response(response, max_bytes=max_bytes, chunk_size=4)
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(params=["sync", "async"])
+def read(request):
+    return _read_sync if request.param == "sync" else _read_async
+
+
+@pytest.mark.parametrize("body, max_bytes, expected", [
+    # Exactly at the cap
+    (b"0123456789", 10, ("0123456789", False)),
+    # One byte over the cap
+    (b"0123456789A", 10, ("0123456789", True)),
+    # A two-byte character split by the cap is dropped
+    ("012345678é".encode("utf-8"), 10, ("012345678", True)),
+    ("012345678é".encode("utf-8"), 11, ("012345678é", False)),
+    (b"0123456789", None, ("0123456789", False)),
+])
+def test_read_response_caps_the_body(server, read, body, max_bytes, expected):
+    server.routes["/body"] = (200, TEXT, body)
+    assert read(server, "/body", max_bytes) == expected
+
+
+def test_characters_split_between_chunks_are_decoded(server, read):
+    server.chunk_delay = 0.01
+    server.routes["/body"] = (200, TEXT, [b"caf\xc3", b"\xa9 cr\xc3", b"\xa8me"])
+    assert read(server, "/body", None) == ("café crème", False)
+
+
+def test_iter_response_caps_the_chunks(server):
+    server.routes["/body"] = (200, TEXT, b"x" * 100)
+    chunks = list(iter_response(_get(server, "/body"), chunk_size=16, max_bytes=40))
+    assert b"".join(chunks) == b"x" * 40
+    assert len(chunks) == 3
+
+
+def test_aiter_response_caps_the_chunks(server):
+    httpx = pytest.importorskip("httpx")
+    server.routes["/body"] = (200, TEXT, b"x" * 100)
+
+    async def main():
+        async with httpx.AsyncClient() as client:
+            response = await client.send(client.build_request("GET", server.url + "/body"), stream=True)
+            chunks = [chunk async for chunk in aiter_response(response, chunk_size=16, max_bytes=40)]
+            assert response.is_closed
+            return chunks
+
+    assert b"".join(asyncio.run(main())) == b"x" * 40
+
+
+@pytest.mark.parametrize("max_bytes, expected", [
+    (None, [{"a": 1}, {"a": 2}, {"a": 3}]),
+    # The whole body, exactly at the cap
+    (27, [{"a": 1}, {"a": 2}, {"a": 3}]),
+    # The third line is cut off by the cap and dropped
+    (24, [{"a": 1}, {"a": 2}]),
+    # Exactly after the newline of the second line
+    (19, [{"a": 1}, {"a": 2}]),
+    # Before its newline: the line may go on, so it is dropped
+    (18, [{"a": 1}]),
+])
+def test_iter_json_lines(server, max_bytes, expected):
+    server.routes["/lines"] = (200, {}, b'{"a": 1}\n\n{"a": 2}\n{"a": 3}')
+    assert list(iter_json_lines(_get(server, "/lines"), chunk_size=5, max_bytes=max_bytes)) == expected
+
+
+def test_truncation_note():
+    assert truncation_note("café", False) == "café"
+    assert truncation_note("café", True) == "café\n[... response truncated to its first 5 bytes]"
@@ -0,0 +1,89 @@
+import json
+import math
+import sys
+
+import pytest
+import yaml
+
+from plugnplai.utils import detect_spec_format, get_openapi_spec, marshal_spec
+
+JSON_SPEC = '{"openapi": "3.0.1", "info": {"title": "t", "version": "1"}, "paths": {}}'
+YAML_SPEC = 'openapi: 3.0.1\ninfo:\n  title: t\n  version: "1"\npaths: {}\n'
+SPEC = {"openapi": "3.0.1", "info": {"title": "t", "version": "1"}, "paths": {}}
+
+
+def _baseline_marshal_spec(txt):
+    """marshal_spec before the format detection."""
+    try:
+        return json.loads(txt)
+    except json.JSONDecodeError:
+        return yaml.safe_load(txt)
+
+
+@pytest.mark.parametrize("txt, content_type, url, expected", [
+    (JSON_SPEC, "application/json; charset=utf-8", None, "json"),
+    (YAML_SPEC, "application/x-yaml", None, "yaml"),
+    (YAML_SPEC, "text/yml", None, "yaml"),
+    (YAML_SPEC, None, "http://a.com/openapi.YAML?v=1", "yaml"),
+    (JSON_SPEC, None, "http://a.com/openapi.json", "json"),
+    (JSON_SPEC, "text/plain", "http://a.com/openapi", "json"),
+    ("\n  [1]", None, None, "json"),
+    ("# comment\n" + YAML_SPEC, None, None, "yaml"),
+    # The Content-Type wins over the URL, and the URL over the content
+    (JSON_SPEC, "text/yaml", "http://a.com/openapi.json", "yaml"),
+    (YAML_SPEC, None, "http://a.com/openapi.json", "json"),
+])
+def test_detect_spec_format(txt, content_type, url, expected):
+    assert detect_spec_format(txt, content_type, url) == expected
+
+
+@pytest.mark.parametrize("txt, content_type, url", [
+    (JSON_SPEC, "application/json", None),
+    (YAML_SPEC, "application/yaml", None),
+    # Wrong hints: the other format is tried
+    (JSON_SPEC, "text/yaml", None),
+    (YAML_SPEC, "application/json", None),
+    (YAML_SPEC, None, "http://a.com/openapi.json"),
+    (JSON_SPEC, None, "http://a.com/openapi.yml"),
+    (JSON_SPEC, None, None),
+    (YAML_SPEC, None, None),
+])
+def test_marshal_spec_agrees_with_the_baseline(txt, content_type, url):
+    assert marshal_spec(txt, content_type=content_type, url=url) == _baseline_marshal_spec(txt) == SPEC
+
+
+@pytest.mark.parametrize("txt, content_type", [
+    ('{"openapi": "3.0.1", "paths": ', "application/json"),
+    ('{"openapi": "3.0.1", "paths": ', None),
+    ("openapi: [3.0.1\npaths: {}", "text/yaml"),
+    ("openapi: [3.0.1\npaths: {}", None),
+])
+def test_malformed_spec_raises_like_the_baseline(txt, content_type):
+    with pytest.raises(yaml.YAMLError):
+        _baseline_marshal_spec(txt)
+    with pytest.raises(yaml.YAMLError):
+        marshal_spec(txt, content_type=content_type)
+
+
+def test_marshal_spec_without_orjson(monkeypatch):
+    # A None entry makes the import fail, whether orjson is installed or not
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert marshal_spec(JSON_SPEC, content_type="application/json") == SPEC
+    assert math.isnan(marshal_spec('{"n": NaN}', content_type="application/json")["n"])
+
+
+def test_marshal_spec_with_orjson():
+    pytest.importorskip("orjson")
+    assert marshal_spec(JSON_SPEC, content_type="application/json") == SPEC
+    # Rejected by orjson, parsed by json
+    assert marshal_spec('{"n": 18446744073709551616}', content_type="application/json") == {"n": 2 ** 64}
+
+
+@pytest.mark.parametrize("path, body, content_type", [
+    ("/openapi.yaml", JSON_SPEC, "text/yaml"),
+    ("/openapi.json", YAML_SPEC, "application/octet-stream"),
+    ("/openapi", YAML_SPEC, "application/json"),
+])
+def test_mislabeled_specs_are_parsed(server, path, body, content_type):
+    server.routes[path] = (200, {"Content-Type": content_type}, body.encode())
+    assert get_openapi_spec(server.url + path, resolve_refs=False) == SPEC
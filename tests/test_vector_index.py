@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from plugnplai.vector_index import NumpyIndex
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).normal(size=(50, 8)).astype(np.float32)
+
+
+def test_search_matches_brute_force(vectors):
+    index = NumpyIndex(vectors)
+    queries = vectors[:5] + 0.01
+    scores, indices = index.search(queries, k=3)
+    assert scores.shape == indices.shape == (5, 3)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarities = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+    expected = np.argsort(-similarities, axis=1)[:, :3]
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_allclose(scores, np.take_along_axis(similarities, expected, axis=1), rtol=1e-5)
+    assert list(indices[:, 0]) == [0, 1, 2, 3, 4]
+
+
+def test_k_larger_than_the_index(vectors):
+    index = NumpyIndex(vectors[:3])
+    scores, indices = index.search(vectors[0], k=10)
+    assert indices.shape == (1, 3) and indices[0, 0] == 0
+    assert np.all(np.diff(scores[0]) <= 0)
+    assert NumpyIndex().search(vectors[0])[1].shape == (1, 0)
+
+
+def test_add_and_remove_keep_the_positions(vectors):
+    index = NumpyIndex()
+    for vector in vectors[:10]:
+        index.add(vector)
+    index.add(vectors[10:20])
+    assert len(index) == 20
+    index.remove([0, 5])
+    assert len(index) == 18
+    assert index.search(vectors[6], k=1)[1][0, 0] == 4
+    assert index.search(vectors[19], k=1)[1][0, 0] == 17
+
+
+def test_save_and_load(vectors, tmp_path):
+    index = NumpyIndex(vectors)
+    index.save(str(tmp_path / "index"))
+    loaded = NumpyIndex.load(str(tmp_path / "index"))
+    np.testing.assert_array_equal(loaded.vectors, index.vectors)
+    np.testing.assert_array_equal(loaded.search(vectors[:2])[1], index.search(vectors[:2])[1])
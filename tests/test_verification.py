@@ -0,0 +1,46 @@
+import json
+
+from plugnplai.verify_plugins.engine import VerificationEngine
+
+
+class _Engine(VerificationEngine):
+    """Engine recording the URLs checked instead of downloading them."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checked = []
+
+    def check(self, url):
+        self.checked.append(url)
+        return {"url": url, "ok": not url.endswith("bad"), "failed_stage": None}
+
+
+def test_results_are_written_to_the_report(tmp_path):
+    path = str(tmp_path / "report.jsonl")
+    results = _Engine(path, max_workers=2).verify(["http://a", "http://bad", "http://a"])
+    assert [result["url"] for result in results] == ["http://a", "http://bad"]
+    with open(path) as f:
+        assert sorted(json.loads(line)["url"] for line in f) == ["http://a", "http://bad"]
+
+
+def test_interrupted_run_is_resumed(tmp_path):
+    path = tmp_path / "report.jsonl"
+    # The last line of an interrupted run is incomplete
+    path.write_text(json.dumps({"url": "http://a", "ok": True}) + "\n"
+                    + json.dumps({"url": "http://bad", "ok": False}) + "\n" + '{"url": "http://c", "o')
+    engine = _Engine(str(path))
+    results = engine.verify(["http://a", "http://bad", "http://c"])
+    assert engine.checked == ["http://c"]
+    assert [result["ok"] for result in results] == [True, False, True]
+
+    engine = _Engine(str(path), retry_failed=True)
+    engine.verify(["http://a", "http://bad", "http://c"])
+    assert engine.checked == ["http://bad"]
+
+
+def test_failed_stage_is_reported(server):
+    # The manifest of the server has no api section
+    result = VerificationEngine().check(server.url)
+    assert not result["ok"] and result["failed_stage"] == "openapi_url"
+    assert result["error"].startswith("Error getting openapi url")
+    assert set(result["timings"]) == {"manifest", "openapi_url"}